@@ -0,0 +1,423 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import List, Tuple, Dict, Any, Callable, Optional, Sequence
+
+import numpy as np
+
+POS_FILE = 'dat/pos/wsj-pos.dev.gold.tsv'
+NER_DIR = 'dat/ner'
+SIZES = {'small': 100, 'medium': 1000, 'large': 5000}
+SEED = 0
+
+# fixed synthetic vocabulary covering the cases of the tokenizers and the normalizer
+SYNTHETIC_WORDS = ['the', 'company', 'said', 'it', 'would', 'sell', 'shares', 'in', 'New', 'York', 'Mr.', 'Smith', "don't",
+                   "it's", 'gonna', 'cannot', 'U.S.', '$3.50', '#1', '12.5%', 'state-of-the-art', 'e-mail', '(', ')',
+                   '"', ',', '.', '?!', 'twenty', 'three', 'hundred', 'thousand', 'million', 'and', 'five', 'ninety-six']
+SYNONYM_WORDS = ['dog', 'cat', 'car', 'run', 'good', 'bank', 'book', 'light', 'play', 'house']
+ANTONYM_SENSES = ['purchase.v.01', 'end.v.02', 'nonspecific.a.01', 'good.a.01', 'light.n.01', 'increase.v.01']
+LCH_PAIRS = [('dog.n.01', 'cat.n.01'), ('car.n.01', 'bicycle.n.01'), ('run.v.01', 'walk.v.01'), ('apple.n.01', 'banana.n.01')]
+# the modules whose import time is measured in fresh interpreters (see import_times())
+IMPORT_MODULES = ['src.tokenization', 'src.quiz.quiz1', 'src.ontology_taxonomy', 'src.quiz.quiz2', 'src.quiz.quiz5',
+                  'src.state_machine', 'src.quiz.quiz3', 'src.pos_tagger', 'src.lazy']
+
+
+def synthetic_texts(n: int, length: int = 20, seed: int = SEED) -> List[str]:
+    """
+    :return: n texts of `length` words drawn from SYNTHETIC_WORDS with a fixed seed.
+    """
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(SYNTHETIC_WORDS) for _ in range(length)) for _ in range(n)]
+
+
+def wsj_sentences(n: int) -> List[List[Tuple[str, str]]]:
+    """
+    :return: the first n sentences of the WSJ corpus, repeated if the corpus is smaller.
+    """
+    from src.pos_corpus import iter_sentences
+    data = list(iter_sentences(POS_FILE))
+    return (data * (n // len(data) + 1))[:n]
+
+
+def wsj_texts(n: int) -> List[str]:
+    return [' '.join(w for w, _ in sentence) for sentence in wsj_sentences(n)]
+
+
+def cycle(items: Sequence[Any], n: int) -> List[Any]:
+    return [items[i % len(items)] for i in range(n)]
+
+
+# every benchmark takes the number of inputs and returns a function and the inputs it is called with, one call per op
+def bench_tokenize_regex(n: int):
+    from src.regular_expression import tokenize_regex
+    return tokenize_regex, synthetic_texts(n) + wsj_texts(n)
+
+
+def bench_tokenize_strmat_0(n: int):
+    from src.tokenization import tokenize_strmat_0
+    return tokenize_strmat_0, synthetic_texts(n) + wsj_texts(n)
+
+
+def bench_tokenize_strmat_1(n: int):
+    from src.tokenization import tokenize_strmat_1
+    return tokenize_strmat_1, synthetic_texts(n) + wsj_texts(n)
+
+
+def bench_tokenize_scanner(n: int):
+    from src.regular_expression import tokenize
+    return tokenize, synthetic_texts(n) + wsj_texts(n)
+
+
+def bench_normalize(n: int):
+    from src.quiz.quiz1 import normalize
+    return normalize, synthetic_texts(n)
+
+
+def bench_synonyms(n: int):
+    from src.ontology_taxonomy import synonyms
+    return synonyms, cycle(SYNONYM_WORDS, n)
+
+
+def bench_synonyms_many(n: int):
+    from src.ontology_taxonomy import synonyms_many
+    return synonyms_many, [cycle(SYNONYM_WORDS, 100)] * max(1, n // 100)
+
+
+def bench_antonyms(n: int):
+    from src.quiz.quiz2 import antonyms
+    return antonyms, cycle(ANTONYM_SENSES, n)
+
+
+def bench_lch_paths(n: int):
+    from src.ontology_taxonomy import lch_paths
+    return lambda pair: lch_paths(*pair), cycle(LCH_PAIRS, n)
+
+
+def bench_similarity_matrix(n: int):
+    from src.similarity import similarity_matrix
+    from src.taxonomy_index import get_index
+    nouns = [name for name in get_index().synset_names if '.n.' in name]
+    senses = random.Random(SEED).sample(nouns, 100)
+    return lambda x: similarity_matrix(x, 'wup'), [senses] * max(1, n // 100)
+
+
+def pos_split(n: int) -> Tuple[List[List[Tuple[str, str]]], List[List[Tuple[str, str]]]]:
+    data = wsj_sentences(n)
+    return data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+
+
+def bench_pos_train(n: int):
+    from src.quiz import quiz3
+    trn_data, _ = pos_split(n)
+    creates = [quiz3.create_cw_dict, quiz3.create_pp_dict, quiz3.create_pw_dict, quiz3.create_nw_dict,
+               quiz3.create_first_pos_dict, quiz3.create_second_pos_dict, quiz3.create_third_pos_dict,
+               quiz3.create_fourth_pos_dict]
+    return lambda data: [create(data) for create in creates], [trn_data]
+
+
+def bench_pos_train_tables(n: int):
+    from src.pos_training import train_tables
+    trn_data, _ = pos_split(n)
+    return train_tables, [trn_data]
+
+
+def bench_pos_train_file(n: int):
+    import atexit
+    import tempfile
+    from src.pos_training import train_file
+    trn_data, _ = pos_split(n)
+    # the same sentences as pos.train_tables, written as a corpus file that is removed at exit
+    fd, filename = tempfile.mkstemp(suffix='.tsv')
+    with os.fdopen(fd, 'w', encoding='utf-8') as fout:
+        for sentence in trn_data: fout.write(''.join('{}\t{}\n'.format(w, t) for w, t in sentence) + '\n')
+    atexit.register(os.remove, filename)
+    return train_file, [filename]
+
+
+def pos_args(trn_data: List[List[Tuple[str, str]]]) -> Tuple:
+    from src.pos_training import create_dicts
+    return create_dicts(trn_data) + (1.0, 1.0, 1.0, 1.0)
+
+
+def bench_pos_predict(n: int):
+    from src.quiz import quiz3
+    trn_data, tst_data = pos_split(n)
+    args = pos_args(trn_data)
+    return lambda tokens: quiz3.predict(tokens, *args), [[w for w, _ in s] for s in tst_data]
+
+
+def bench_pos_predict_compact(n: int):
+    from src.pos_model import CompactModel
+    from src.pos_training import train_tables
+    trn_data, tst_data = pos_split(n)
+    model = CompactModel.from_tables(*train_tables(trn_data))
+    return model.predict, [[w for w, _ in s] for s in tst_data]
+
+
+def bench_pos_evaluate(n: int):
+    from src.quiz import quiz3
+    trn_data, tst_data = pos_split(n)
+    args = pos_args(trn_data)
+    return lambda data: quiz3.evaluate(data, *args), [tst_data]
+
+
+def ner_automaton():
+    from src.quiz.quiz5 import read_gazetteers
+    return read_gazetteers(NER_DIR)
+
+
+def ner_inputs(n: int) -> List[List[str]]:
+    # WSJ sentences with gazetteer entries spliced in, so that every sentence has matches and overlaps
+    rng = random.Random(SEED)
+    names = ['New York', 'Atlantic City', 'South Korea', 'United States of America', 'Georgia', 'Emory', 'James', 'English']
+    out = []
+    for sentence in wsj_sentences(n):
+        tokens = [w for w, _ in sentence]
+        for _ in range(3): tokens[rng.randrange(len(tokens) + 1):0] = rng.choice(names).split()
+        out.append(tokens)
+    return out
+
+
+def bench_ner_load_gazetteers(n: int):
+    from src.gazetteer import load_gazetteers
+    return load_gazetteers, [NER_DIR] * max(1, n // 100)
+
+
+def bench_ner_match(n: int):
+    from src.quiz.quiz5 import match
+    AC = ner_automaton()
+    return lambda tokens: match(AC, tokens), ner_inputs(n)
+
+
+def bench_ner_match_tokens(n: int):
+    from src.quiz.quiz5 import match_tokens
+    trie = ner_automaton().trie
+    return lambda tokens: match_tokens(trie, tokens), ner_inputs(n)
+
+
+def bench_ner_remove_overlaps(n: int):
+    from src.quiz.quiz5 import match, remove_overlaps
+    AC = ner_automaton()
+    return remove_overlaps, [match(AC, tokens) for tokens in ner_inputs(n)]
+
+
+def bench_ner_to_bilou(n: int):
+    from src.quiz.quiz5 import match, remove_overlaps, to_bilou
+    AC = ner_automaton()
+    inputs = []
+    for tokens in ner_inputs(n):
+        entities = [(s, b, e, sorted(v)[0]) for s, b, e, v in remove_overlaps(match(AC, tokens))]
+        inputs.append((tokens, entities))
+    return lambda x: to_bilou(*x), inputs
+
+
+BENCHMARKS: Dict[str, Callable[[int], Tuple[Callable, List[Any]]]] = {
+    'tokenize_regex': bench_tokenize_regex,
+    'tokenize_strmat_0': bench_tokenize_strmat_0,
+    'tokenize_strmat_1': bench_tokenize_strmat_1,
+    'tokenize_scanner': bench_tokenize_scanner,
+    'normalize': bench_normalize,
+    'synonyms': bench_synonyms,
+    'synonyms_many': bench_synonyms_many,
+    'antonyms': bench_antonyms,
+    'lch_paths': bench_lch_paths,
+    'similarity_matrix': bench_similarity_matrix,
+    'pos.train': bench_pos_train,
+    'pos.train_tables': bench_pos_train_tables,
+    'pos.train_file': bench_pos_train_file,
+    'pos.predict': bench_pos_predict,
+    'pos.predict_compact': bench_pos_predict_compact,
+    'pos.evaluate': bench_pos_evaluate,
+    'ner.load_gazetteers': bench_ner_load_gazetteers,
+    'ner.match': bench_ner_match,
+    'ner.match_tokens': bench_ner_match_tokens,
+    'ner.remove_overlaps': bench_ner_remove_overlaps,
+    'ner.to_bilou': bench_ner_to_bilou,
+}
+
+
+def measure(func: Callable, inputs: List[Any], repeat: int = 3, memory: bool = True) -> Dict[str, Any]:
+    """
+    Calls the function on every input `repeat` times and records the latency of every call.
+    :param memory: if True, run once more under tracemalloc to record the peak memory (not included in the latencies).
+    :return: the number of ops, ops/sec, latency percentiles in microseconds, and the peak memory in KB.
+    """
+    func(inputs[0])  # warm up caches and lazy initialization
+    latencies = np.empty(len(inputs) * repeat)
+    k = 0
+    st = time.perf_counter()
+    for _ in range(repeat):
+        for x in inputs:
+            t = time.perf_counter()
+            func(x)
+            latencies[k] = time.perf_counter() - t
+            k += 1
+    total = time.perf_counter() - st
+
+    result = {'ops': k, 'seconds': total, 'ops_per_sec': k / total}
+    for p in (50, 90, 99):
+        result['p{}_us'.format(p)] = float(np.percentile(latencies, p)) * 1e6
+
+    if memory:
+        tracing = tracemalloc.is_tracing()
+        if not tracing: tracemalloc.start()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        for x in inputs: func(x)
+        result['peak_kb'] = (tracemalloc.get_traced_memory()[1] - base) / 1024
+        if not tracing: tracemalloc.stop()
+
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run_suite(names: Optional[Sequence[str]] = None,
+              sizes: Sequence[str] = ('small', 'medium'),
+              repeat: int = 3,
+              memory: bool = True,
+              verbose: bool = True) -> Dict[str, Any]:
+    """
+    :param names: the benchmarks to run (prefixes of the keys in BENCHMARKS); if None, run all.
+    :param sizes: the input sizes to run, keys of SIZES.
+    :return: the environment and the result of every (benchmark, size); benchmarks whose dependencies or data
+             are unavailable (e.g., the WordNet corpus) are reported as skipped.
+    """
+    selected = [b for b in BENCHMARKS if names is None or any(b.startswith(n) for n in names)]
+    results = {}
+
+    for name in selected:
+        for size in sizes:
+            key = '{}/{}'.format(name, size)
+            try:
+                func, inputs = BENCHMARKS[name](SIZES[size])
+                results[key] = measure(func, inputs, repeat, memory)
+            except (ImportError, LookupError, OSError) as e:
+                message = next((line.strip() for line in str(e).splitlines() if any(c.isalpha() for c in line)), '')
+                results[key] = {'skipped': '{}: {}'.format(type(e).__name__, message)}
+            if verbose: print(format_result(key, results[key]))
+
+    return {'environment': environment(), 'results': results}
+
+
+def import_time(module: str, runs: int = 5) -> float:
+    """
+    :return: the cumulative import time of the module in microseconds reported by `python -X importtime`,
+             the minimum over `runs` fresh interpreters; raises ImportError if the module cannot be imported.
+    """
+    best = float('inf')
+    for _ in range(runs):
+        p = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True, text=True)
+        if p.returncode != 0:
+            raise ImportError(next((line for line in reversed(p.stderr.splitlines()) if line.strip()), module))
+        # every line is "import time: self [us] | cumulative | imported package"
+        for line in p.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                best = min(best, int(fields[1]))
+    return best
+
+
+def import_times(modules: Sequence[str] = IMPORT_MODULES, runs: int = 5, verbose: bool = True) -> Dict[str, Any]:
+    """
+    :return: the import time of every module in microseconds, or {'skipped': reason} if it cannot be imported.
+    """
+    results = {}
+    for module in modules:
+        try:
+            results[module] = import_time(module, runs)
+            if verbose: print('{:<32} import {:>10,.1f} ms'.format(module, results[module] / 1000))
+        except ImportError as e:
+            results[module] = {'skipped': str(e)}
+            if verbose: print('{:<32} skipped ({})'.format(module, str(e)[:80]))
+    return results
+
+
+def format_result(key: str, r: Dict[str, Any]) -> str:
+    if 'skipped' in r: return '{:<32} skipped ({})'.format(key, r['skipped'][:80])
+    return '{:<32} {:>12,.1f} ops/sec  p50 {:>10,.1f} us  p90 {:>10,.1f} us  p99 {:>10,.1f} us  peak {:>10,.1f} KB'.format(
+        key, r['ops_per_sec'], r['p50_us'], r['p90_us'], r['p99_us'], r.get('peak_kb', float('nan')))
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1, min_kb: float = 64,
+            min_import_ms: float = 5) -> List[str]:
+    """
+    :param threshold: the relative slowdown in ops/sec (or growth in peak memory or import time) reported as a regression.
+    :param min_kb: growths in peak memory smaller than this are noise and not reported.
+    :param min_import_ms: growths in import time smaller than this are noise and not reported.
+    :return: the keys of the regressed benchmarks; prints the ratio of every benchmark run in both.
+    """
+    regressions = []
+    for module, new in current.get('imports', {}).items():
+        old = baseline.get('imports', {}).get(module)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)): continue
+        ratio = new / old if old else 1.0
+        slow = ratio > 1 + threshold and (new - old) / 1000 >= min_import_ms
+        if slow: regressions.append('import/' + module)
+        print('{:<32} import {:>6.2f}x{}'.format('import/' + module, ratio, '  REGRESSION' if slow else ''))
+
+    for key, new in current['results'].items():
+        old = baseline['results'].get(key)
+        if old is None or 'skipped' in old or 'skipped' in new: continue
+        speed = new['ops_per_sec'] / old['ops_per_sec']
+        mem = new['peak_kb'] / old['peak_kb'] if old.get('peak_kb') and 'peak_kb' in new else 1.0
+        grown = mem > 1 + threshold and new['peak_kb'] - old['peak_kb'] >= min_kb
+        slow = speed < 1 - threshold or grown
+        if slow: regressions.append(key)
+        print('{:<32} speed {:>6.2f}x  memory {:>6.2f}x{}'.format(key, speed, mem, '  REGRESSION' if slow else ''))
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the NLP components')
+    parser.add_argument('names', nargs='*', help='benchmark name prefixes (default: all)')
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--imports', action='store_true', help='also measure the import time of IMPORT_MODULES')
+    parser.add_argument('--imports-only', action='store_true', help='only measure the import time of IMPORT_MODULES')
+    args = parser.parse_args()
+
+    if args.imports_only:
+        suite = {'environment': environment(), 'results': {}}
+    else:
+        suite = run_suite(args.names or None, args.sizes, args.repeat, not args.no_memory)
+    if args.imports or args.imports_only: suite['imports'] = import_times()
+    if args.output:
+        with open(args.output, 'w') as fout: json.dump(suite, fout, indent=2)
+    if args.compare:
+        with open(args.compare) as fin: baseline = json.load(fin)
+        regressed = compare(baseline, suite, args.threshold)
+        if regressed: raise SystemExit('{} regression(s): {}'.format(len(regressed), ', '.join(regressed)))
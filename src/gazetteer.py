@@ -0,0 +1,400 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional, FrozenSet, NamedTuple, Any, BinaryIO
+
+from src.lazy import ahocorasick
+
+FORMAT_VERSION = 3
+CACHE_DIR = os.environ.get('CS329_GAZETTEER_CACHE', 'dat/gazetteer_cache')
+LENGTH_BITS = 16  # the value of a span is (labelset ID << LENGTH_BITS) | len(span)
+LENGTH_MASK = (1 << LENGTH_BITS) - 1
+
+logger = logging.getLogger(__name__)
+
+
+class Hit(NamedTuple):
+    span: str
+    values: FrozenSet[str]
+
+
+class Gazetteer:
+    """
+    A finalized Aho-Corasick automaton over the spans of gazetteers that stores an integer per span instead of an object:
+    the ID of the set of its labels, interned once per distinct set in labelsets, and the length of the span.
+    iter() yields the same (end index, hit) pairs as the automaton of quiz5.create_ac() where hit has .span and .values,
+    so it works with quiz5.match() and quiz5.match_spans(); trie is the TokenTrie of the same spans for quiz5.match_tokens().
+    """
+
+    def __init__(self, automaton: Any, labelsets: List[FrozenSet[str]], trie: Optional['TokenTrie'] = None):
+        """
+        :param automaton: the finalized automaton of ahocorasick.STORE_INTS.
+        :param labelsets: the set of labels of every labelset ID.
+        :param trie: the token trie of the spans; built from items() on first use if None.
+        """
+        self.automaton = automaton
+        self.labelsets = labelsets
+        self._trie = trie
+        self._trie_source: Optional[Tuple[str, int, str]] = None  # the path, the offset, and the save ID of a saved trie
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, data: Iterable[Tuple[str, str]]) -> 'Gazetteer':
+        """
+        :param data: a collection of (span, label) pairs; a span in several pairs has the union of their labels.
+        """
+        labels: Dict[str, int] = {}
+        masks: Dict[str, int] = {}
+        for span, label in data:
+            if not span: continue
+            if len(span) > LENGTH_MASK: raise ValueError('Span too long: {}...'.format(span[:50]))
+            bit = 1 << labels.setdefault(label, len(labels))
+            masks[span] = masks.get(span, 0) | bit
+
+        names = list(labels)
+        ids: Dict[int, int] = {}
+        automaton = ahocorasick.Automaton(ahocorasick.STORE_INTS)
+        for span, mask in masks.items():
+            automaton.add_word(span, (ids.setdefault(mask, len(ids)) << LENGTH_BITS) | len(span))
+        automaton.make_automaton()
+
+        labelsets = [frozenset(names[i] for i in range(len(names)) if mask >> i & 1) for mask in ids]
+        return cls(automaton, labelsets)
+
+    def __len__(self) -> int:
+        return len(self.automaton)
+
+    def __contains__(self, span: str) -> bool:
+        return span in self.automaton
+
+    def get(self, span: str) -> Optional[FrozenSet[str]]:
+        """
+        :return: the labels of the span if exists; otherwise, None.
+        """
+        value = self.automaton.get(span, -1)
+        return self.labelsets[value >> LENGTH_BITS] if value >= 0 else None
+
+    def iter(self, text: str) -> Iterator[Tuple[int, Hit]]:
+        """
+        :return: the end index (inclusive) and the hit of every occurrence of the spans in the text.
+        """
+        labelsets = self.labelsets
+        for end, value in self.automaton.iter(text):
+            begin = end + 1 - (value & LENGTH_MASK)
+            yield end, Hit(text[begin:end + 1], labelsets[value >> LENGTH_BITS])
+
+    @property
+    def trie(self) -> 'TokenTrie':
+        """
+        :return: the token trie of the spans, read on first use from the file that the gazetteer was loaded from if it was
+                 saved with one (see load_gazetteers()); otherwise, built from items().
+        """
+        with self._lock:
+            if self._trie is None:
+                self._trie = self._load_trie() or TokenTrie.from_gazetteer(self)
+        return self._trie
+
+    def _load_trie(self) -> Optional['TokenTrie']:
+        if self._trie_source is None: return None
+        path, offset, save_id = self._trie_source
+        try:
+            with open(path, 'rb') as fin:
+                if pickle.load(fin)[2] != save_id: return None  # replaced since the gazetteer was loaded
+                fin.seek(offset)
+                return pickle.load(fin)
+        except Exception as e:
+            logger.info('Building the token trie; could not read it from %s: %r', path, e)
+            return None
+
+    def items(self) -> Iterator[Tuple[str, FrozenSet[str]]]:
+        """
+        :return: every span and its labels.
+        """
+        labelsets = self.labelsets
+        for span, value in self.automaton.items():
+            yield span, labelsets[value >> LENGTH_BITS]
+
+    def dump(self, fout: BinaryIO, checksum: str = '', native: Optional[str] = None):
+        """
+        Writes a header of the format version, the checksum, and a new save ID, then the labelsets and the automaton, and then
+        the token trie if it has been built, as separate pickles, so that load() can reject the file without reading the
+        automaton, and the trie is read only when it is used.
+        :param checksum: the identity of the data that the gazetteer is built from (e.g., sources_checksum()).
+        :param native: if not None, the file name of the automaton saved by its own save(), written instead of the automaton.
+        """
+        pickle.dump((FORMAT_VERSION, checksum, uuid.uuid4().hex), fout, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump((self.labelsets, native or self.automaton), fout, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(self._trie, fout, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save(self, path: str, checksum: str = '', native: bool = False):
+        """
+        :param checksum: see dump(); load() rejects the file unless it is given the same checksum.
+        :param native: if True, the automaton is written by ahocorasick's own save() to a file of a new name next to the path,
+                       which takes less time to write and less memory to load, but over ten times longer to load than a
+                       pickle (about 15 vs. 1 seconds for one million spans); the files of the earlier saves are removed.
+        """
+        stem = os.path.splitext(path)[0]
+        filename = None
+        if native:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            fd, filename = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(stem) + '-', suffix='.ac')
+            os.close(fd)
+            self.automaton.save(filename)
+        write_atomic(path, lambda fout: self.dump(fout, checksum, filename and os.path.basename(filename)))
+        for old in glob.glob(glob.escape(stem) + '-*.ac'):
+            if old != filename: os.unlink(old)
+
+    @classmethod
+    def load(cls, path: str, checksum: Optional[str] = None) -> 'Gazetteer':
+        """
+        :param checksum: if not None, the checksum that the gazetteer must have been saved with.
+        :raises ValueError: if the file has another format version or another checksum.
+        """
+        with open(path, 'rb') as fin:
+            version, saved, save_id = pickle.load(fin)
+            if version != FORMAT_VERSION:
+                raise ValueError('Unsupported gazetteer format: {}'.format(version))
+            if checksum is not None and saved != checksum:
+                raise ValueError('The gazetteer is not built from the expected sources: {}'.format(path))
+            labelsets, automaton = pickle.load(fin)
+            offset = fin.tell()
+        if isinstance(automaton, str):
+            # the proxy has its own load(), so the function of the module is reached through the module itself
+            automaton = ahocorasick.load().load(os.path.join(os.path.dirname(path), automaton), pickle.loads)
+        gazetteer = cls(automaton, labelsets)
+        gazetteer._trie_source = (os.path.abspath(path), offset, save_id)
+        return gazetteer
+
+
+class TokenTrie:
+    """
+    A trie over the token IDs of the spans of a gazetteer, read from the last token of every span to its first, so that
+    walking backward from a token finds every span ending at that token, and only spans aligned with token boundaries.
+    A span is split into tokens by single spaces, that is, it matches the tokens whose join by ' ' is the span,
+    the same spans as quiz5.match() finds (except tokens that themselves contain spaces).
+    """
+
+    def __init__(self, vocab: Dict[str, int], edges: Dict[int, int], labelsets: List[Optional[FrozenSet[str]]]):
+        """
+        :param vocab: the ID of every token in the spans.
+        :param edges: the child of every (node, token ID) pair, keyed by node * len(vocab) + token ID; the root is 0.
+        :param labelsets: the labels of the span ending at every node; None if no span ends there.
+        """
+        self.vocab = vocab
+        self.edges = edges
+        self.labelsets = labelsets
+        # the children of the root by the last tokens of the spans, so that most tokens are skipped by a single lookup
+        self.roots = {token: edges[i] for token, i in vocab.items() if i in edges}
+
+    @classmethod
+    def build(cls, data: Iterable[Tuple[str, FrozenSet[str]]]) -> 'TokenTrie':
+        """
+        :param data: a collection of (span, labels) pairs with distinct spans (e.g., Gazetteer.items()).
+        """
+        data = [(span.split(' '), labels) for span, labels in data]
+        vocab: Dict[str, int] = {}
+        for tokens, _ in data:
+            for token in tokens: vocab.setdefault(token, len(vocab))
+
+        v = len(vocab)
+        edges: Dict[int, int] = {}
+        labelsets: List[Optional[FrozenSet[str]]] = [None]
+        for tokens, labels in data:
+            node = 0
+            for token in reversed(tokens):
+                key = node * v + vocab[token]
+                child = edges.get(key)
+                if child is None:
+                    child = edges[key] = len(labelsets)
+                    labelsets.append(None)
+                node = child
+            labelsets[node] = labels
+        return cls(vocab, edges, labelsets)
+
+    @classmethod
+    def from_gazetteer(cls, gazetteer: 'Gazetteer') -> 'TokenTrie':
+        return cls.build(gazetteer.items())
+
+    def __len__(self) -> int:
+        return sum(labels is not None for labels in self.labelsets)
+
+
+def source_files(dirname: str) -> List[str]:
+    """
+    :return: the gazetteer files in the directory; the label of every file is its name without .txt.
+    """
+    return sorted(glob.glob(os.path.join(dirname, '*.txt')))
+
+
+def read_source(filename: str) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    :return: the (span, label) pairs of the file, and the SHA-1 of its content, from a single read.
+    """
+    with open(filename, 'rb') as fin:
+        content = fin.read()
+    label = os.path.basename(filename)[:-4]
+    return [(line.strip(), label) for line in content.decode('utf-8').splitlines()], hashlib.sha1(content).hexdigest()
+
+
+def file_sha1(filename: str) -> str:
+    h = hashlib.sha1()
+    with open(filename, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''): h.update(block)
+    return h.hexdigest()
+
+
+def sources_checksum(sources: Dict[str, Dict[str, Any]]) -> str:
+    """
+    :param sources: the 'sources' of a manifest.
+    :return: the SHA-1 over the names and the content hashes of the source files.
+    """
+    return hashlib.sha1(json.dumps(sorted((name, source['sha1']) for name, source in sources.items())).encode('utf-8')).hexdigest()
+
+
+def cache_paths(dirname: str, cache_dir: str) -> Tuple[str, str]:
+    """
+    :return: the paths of the automaton and of its manifest for the gazetteer directory.
+    """
+    key = hashlib.sha1(os.path.abspath(dirname).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, key + '.pkl'), os.path.join(cache_dir, key + '.json')
+
+
+def write_atomic(path: str, write: Any, binary: bool = True):
+    """
+    Writes to a temporary file in the same directory and renames it, so that concurrent readers never see partial files.
+    :param write: called with the open file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w') as fout: write(fout)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def is_fresh(manifest: Dict[str, Any], filenames: List[str]) -> Tuple[bool, bool]:
+    """
+    A file is unchanged if its size and mtime are the same, or else if its content hash is the same.
+    :return: whether all files are unchanged, and whether the manifest needs to record new mtimes.
+    """
+    sources = manifest.get('sources', {})
+    if manifest.get('version') != FORMAT_VERSION or sorted(sources) != sorted(os.path.basename(f) for f in filenames):
+        return False, False
+    touched = False
+    for filename in filenames:
+        source, st = sources[os.path.basename(filename)], os.stat(filename)
+        if source['size'] == st.st_size and source['mtime_ns'] == st.st_mtime_ns: continue
+        if source['size'] != st.st_size or source['sha1'] != file_sha1(filename): return False, False
+        source['mtime_ns'] = st.st_mtime_ns
+        touched = True
+    return True, touched
+
+
+def load_gazetteers(dirname: str, cache_dir: Optional[str] = CACHE_DIR, native: bool = False) -> Gazetteer:
+    """
+    :param dirname: the directory of the gazetteer files (*.txt), one span per line.
+    :param cache_dir: the directory of the built automata; if None, always build.
+    :param native: if True, a built automaton is cached in the format of ahocorasick; see Gazetteer.save().
+    :return: the gazetteer loaded from the cache, or built from the files and cached if any file has changed
+             (a different size, or a different mtime and content hash) or if the set of files has changed.
+             The automaton records the checksum of the sources in the manifest that it is built with, so an automaton
+             and a manifest written by different builds are never used together; the token trie (Gazetteer.trie) is built
+             and cached along with the automaton.
+    """
+    filenames = source_files(dirname)
+    if cache_dir is None:
+        return Gazetteer.build(pair for filename in filenames for pair in read_source(filename)[0])
+
+    automaton_path, manifest_path = cache_paths(dirname, cache_dir)
+    try:
+        with open(manifest_path) as fin:
+            manifest = json.load(fin)
+        fresh, touched = is_fresh(manifest, filenames)
+        if fresh:
+            gazetteer = Gazetteer.load(automaton_path, sources_checksum(manifest['sources']))
+            if touched:
+                try:
+                    write_atomic(manifest_path, lambda fout: json.dump(manifest, fout, indent=2), binary=False)
+                except OSError as e:
+                    logger.warning('Could not update the manifest %s: %s', manifest_path, e)
+            return gazetteer
+    except Exception as e:  # no cache yet, or an unreadable, older, or mismatched one; unpickling can raise almost anything
+        logger.info('Building the gazetteers of %s: %r', dirname, e)
+
+    data, sources = [], {}
+    for filename in filenames:
+        st = os.stat(filename)
+        pairs, sha1 = read_source(filename)
+        data.extend(pairs)
+        sources[os.path.basename(filename)] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1}
+    gazetteer = Gazetteer.build(data)
+
+    manifest = {'version': FORMAT_VERSION, 'dirname': os.path.abspath(dirname), 'sources': sources,
+                'spans': len(gazetteer), 'labelsets': len(gazetteer.labelsets)}
+    try:
+        gazetteer.trie  # cached in the same file, so that no process needs to build it from the automaton again
+        gazetteer.save(automaton_path, sources_checksum(sources), native)
+        write_atomic(manifest_path, lambda fout: json.dump(manifest, fout, indent=2), binary=False)
+    except OSError as e:  # e.g., a read-only cache directory
+        logger.warning('Could not cache the gazetteers of %s in %s: %s', dirname, cache_dir, e)
+    return gazetteer
+
+
+if __name__ == '__main__':
+    import random
+    import shutil
+    import string
+    import time
+
+    # a synthetic gazetteer directory of one million spans over 10 labels
+    random.seed(0)
+    src_dir, cache_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    for i in range(10):
+        with open(os.path.join(src_dir, 'label{}.txt'.format(i)), 'w') as fout:
+            for _ in range(100000):
+                fout.write(' '.join(''.join(random.choices(string.ascii_letters, k=random.randint(3, 9)))
+                                    for _ in range(random.randint(1, 3))) + '\n')
+
+    for step in ['build', 'load', 'load']:
+        st = time.perf_counter()
+        gazetteer = load_gazetteers(src_dir, cache_dir)
+        print('{:<5} {:,} spans: {:.3f} sec'.format(step, len(gazetteer), time.perf_counter() - st))
+    st = time.perf_counter()
+    print('token trie of {:,} spans: {:.3f} sec'.format(len(gazetteer.trie), time.perf_counter() - st))
+
+    with open(os.path.join(src_dir, 'label0.txt'), 'a') as fout: fout.write('Emory University\n')
+    st = time.perf_counter()
+    gazetteer = load_gazetteers(src_dir, cache_dir)
+    print('rebuild after a change: {:.3f} sec, {}'.format(time.perf_counter() - st, gazetteer.get('Emory University')))
+
+    native_dir = tempfile.mkdtemp()
+    for step in ['build', 'load']:
+        st = time.perf_counter()
+        gazetteer = load_gazetteers(src_dir, native_dir, native=True)
+        print('{:<5} native: {:.3f} sec, {}'.format(step, time.perf_counter() - st, gazetteer.get('Emory University')))
+    shutil.rmtree(native_dir)
+    shutil.rmtree(src_dir)
+    shutil.rmtree(cache_dir)
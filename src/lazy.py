@@ -0,0 +1,117 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import importlib
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence
+
+
+class LazyImport:
+    """
+    A module, or an attribute of a module, imported on the first access to any of its attributes, so that importing
+    a module that uses heavy dependencies (e.g., NLTK) costs nothing until they are used.
+    """
+
+    def __init__(self, module: str, attr: Optional[str] = None):
+        """
+        :param module: the name of the module to import (e.g., 'nltk.corpus').
+        :param attr: if not None, the attribute of the module to load (e.g., 'wordnet').
+        """
+        self._module = module
+        self._attr = attr
+        self._target = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Any:
+        """
+        :return: the module or the attribute, imported on the first call.
+        """
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    module = importlib.import_module(self._module)
+                    self._target = getattr(module, self._attr) if self._attr else module
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+    def __repr__(self) -> str:
+        name = self._module + ('.' + self._attr if self._attr else '')
+        return '<LazyImport {} ({})>'.format(name, 'loaded' if self.loaded else 'not loaded')
+
+
+# shared by all modules so that the corpus reader is created once
+wordnet = LazyImport('nltk.corpus', 'wordnet')
+ahocorasick = LazyImport('ahocorasick')
+
+
+def load_wordnet():
+    wordnet.ensure_loaded()  # the corpus reader of NLTK is itself lazy, so reading the corpus needs a call
+
+
+def load_wordnet_index():
+    from src.wordnet_index import get_index
+    get_index().synset_names
+
+
+def load_taxonomy_index():
+    from src.taxonomy_index import get_index
+    get_index().synset_names
+
+
+# the heavy resources that can be loaded ahead of the first request, e.g., when a worker starts
+RESOURCES: Dict[str, Callable[[], Any]] = {
+    'wordnet': load_wordnet,
+    'wordnet_index': load_wordnet_index,
+    'taxonomy_index': load_taxonomy_index,
+    'ahocorasick': ahocorasick.load,
+}
+
+
+def prewarm(names: Optional[Sequence[str]] = None, background: bool = False) -> Optional[threading.Thread]:
+    """
+    Loads the resources so that the first requests do not pay for them.
+    :param names: the keys of RESOURCES to load; if None, load all.
+    :param background: if True, load in a daemon thread and return the thread (join() it to wait).
+    :return: the thread if background; otherwise, None.
+    """
+    names = list(RESOURCES) if names is None else list(names)
+    unknown = [name for name in names if name not in RESOURCES]
+    if unknown: raise ValueError('Unknown resource(s): {}'.format(', '.join(unknown)))
+
+    def run():
+        for name in names: RESOURCES[name]()
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='prewarm', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    for name in sys.argv[1:] or RESOURCES:
+        st = time.perf_counter()
+        prewarm([name])
+        print('{:<16} {:8.3f} sec'.format(name, time.perf_counter() - st))
@@ -13,17 +13,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
-from typing import Optional, Set, List
-from nltk.corpus import wordnet as wn
-from nltk.corpus.reader import Synset
+from functools import lru_cache
+from typing import Optional, Set, List, FrozenSet, Iterable, Tuple, TYPE_CHECKING
 
+from src.lazy import LazyImport, wordnet as wn
 
-def synonyms(word: str, pos: Optional[str] = None, count: Optional[int] = 0) -> Set[str]:
+if TYPE_CHECKING:
+    from nltk.corpus.reader import Synset
+
+# NLTK and the indexes (with numpy) are imported on first use; see lazy.prewarm() to load them ahead
+wordnet_index = LazyImport('src.wordnet_index')
+taxonomy_index = LazyImport('src.taxonomy_index')
+
+SYNONYM_CACHE_SIZE = 65536
+
+
+def synonyms_nltk(word: str, pos: Optional[str] = None, count: Optional[int] = 0) -> Set[str]:
     """
-    :param word: the word to retrieve synonyms for.
-    :param pos: the part-of-speech tag of the word; if None, retrieve synonyms across all part-of-speeches.
-    :param count: the minimum frequency of the synonym to be retrieved.
-    :return: the lemma set of all synonyms of the specific word.
+    The same as synonyms() where the synsets and the lemma counts are read through the WordNet corpus reader of NLTK.
     """
     syns = set()
 
@@ -35,11 +42,63 @@ def synonyms(word: str, pos: Optional[str] = None, count: Optional[int] = 0) ->
     return syns
 
 
-def lch_paths(sense_0: str, sense_1: str) -> List[List[Synset]]:
+@lru_cache(maxsize=SYNONYM_CACHE_SIZE)
+def cached_synonyms_nltk(word: str, pos: Optional[str], count: int) -> FrozenSet[str]:
+    return frozenset(synonyms_nltk(word, pos, count))
+
+
+@lru_cache(maxsize=SYNONYM_CACHE_SIZE)
+def cached_synonyms(word: str, pos: Optional[str], count: int) -> FrozenSet[str]:
+    syns = wordnet_index.get_index().synonyms(word, pos, count)
+    return syns if syns is not None else cached_synonyms_nltk(word, pos, count)
+
+
+def synonyms(word: str, pos: Optional[str] = None, count: Optional[int] = 0) -> Set[str]:
+    """
+    :param word: the word to retrieve synonyms for.
+    :param pos: the part-of-speech tag of the word; if None, retrieve synonyms across all part-of-speeches.
+    :param count: the minimum frequency of the synonym to be retrieved.
+    :return: the lemma set of all synonyms of the specific word.
+    Served from the precomputed WordNet index (see wordnet_index) with an LRU cache on top;
+    words outside the index (e.g., regular inflections) fall back to synonyms_nltk().
+    """
+    return set(cached_synonyms(word, pos, count or 0))
+
+
+def synonyms_many(words: Iterable[str], pos: Optional[str] = None, count: Optional[int] = 0) -> List[Set[str]]:
+    """
+    :return: the synonyms of every word; see synonyms(). The words in the index are answered in one batch
+             without going through the cache of synonyms(); the others fall back to the cached synonyms_nltk().
+    """
+    words, count = list(words), count or 0
+    return [set(syns) if syns is not None else set(cached_synonyms_nltk(word, pos, count))
+            for word, syns in zip(words, wordnet_index.get_index().synonyms_many(words, pos, count))]
+
+
+def lch_paths(sense_0: str, sense_1: str) -> List[List['Synset']]:
     """
     :param sense_0: the ID of the first sense.
     :param sense_1: the ID of the second sense.
     :return: the list of LCH paths where each LCH path shows the path from the LCD to its root.
+    Served from the precomputed taxonomy index (see taxonomy_index); see lch_paths_nltk() for the original computation.
+    """
+    index = taxonomy_index.get_index()
+    return [index.to_synsets(path) for path in index.lch_paths(index.synset_id(sense_0), index.synset_id(sense_1))]
+
+
+def lch_paths_many(pairs: Iterable[Tuple[str, str]]) -> List[List[List['Synset']]]:
+    """
+    :return: the LCH paths of every pair of senses; see lch_paths(). The lowest common hypernyms of all pairs are found at once.
+    """
+    index = taxonomy_index.get_index()
+    pairs = [(index.synset_id(s0), index.synset_id(s1)) for s0, s1 in pairs]
+    return [[index.to_synsets(path) for path in index.lch_paths(s0, s1, lch)]
+            for (s0, s1), lch in zip(pairs, index.lowest_common_hypernyms_many(pairs))]
+
+
+def lch_paths_nltk(sense_0: str, sense_1: str) -> List[List['Synset']]:
+    """
+    The same as lch_paths() where the hypernym paths and the lowest common hypernyms are computed through NLTK.
     """
     synset_0 = wn.synset(sense_0)
     synset_1 = wn.synset(sense_1)
@@ -58,6 +117,8 @@ def lch_paths(sense_0: str, sense_1: str) -> List[List[Synset]]:
 if __name__ == '__main__':
     print(synonyms('dog', pos='n'))
     print(synonyms('dog', pos='n'))
+    print(synonyms_many(['cat', 'dogs', 'run'], pos='v'))
 
     paths = lch_paths('dog.n.01', 'cat.n.01')
-    for path in paths: print(' -> '.join([syn.name() for syn in path]))
\ No newline at end of file
+    for path in paths: print(' -> '.join([syn.name() for syn in path]))
+    print(lch_paths_many([('dog.n.01', 'cat.n.01'), ('boy.n.01', 'girl.n.01')]))
\ No newline at end of file
@@ -0,0 +1,80 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import multiprocessing
+import os
+from collections import deque
+from itertools import islice
+from typing import Iterable, Iterator, List, Callable, Any, Optional, Tuple
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    :param items: any iterable; it is consumed lazily.
+    :param size: the maximum number of items per chunk.
+    :return: an iterator of lists containing consecutive items.
+    """
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk: return
+        yield chunk
+
+
+def map_chunk(func: Callable[[Any], Any], chunk: List[Any]) -> List[Any]:
+    return [func(item) for item in chunk]
+
+
+def imap_chunks(func: Callable[[Any], Any],
+                items: Iterable[Any],
+                workers: Optional[int] = None,
+                chunksize: int = 1000,
+                max_pending: Optional[int] = None,
+                initializer: Optional[Callable] = None,
+                initargs: Tuple = ()) -> Iterator[Any]:
+    """
+    Applies the function to every item across a process pool and yields the results in the input order.
+    Items are read lazily and at most `max_pending` chunks are in flight, so the memory stays bounded for any input size.
+    :param func: a module-level (picklable) function taking one item.
+    :param items: any iterable of items.
+    :param workers: the number of worker processes; if None, use all cores; if <= 1, run in this process.
+    :param chunksize: the number of items sent to a worker at a time.
+    :param max_pending: the maximum number of chunks in flight; if None, twice the number of workers.
+    :param initializer: called once in each worker (and once in this process when running serially).
+    :param initargs: the arguments to the initializer.
+    """
+    if workers is None: workers = os.cpu_count() or 1
+    chunks = chunked(items, chunksize)
+    first = next(chunks, None)
+    if first is None: return
+
+    second = next(chunks, None) if workers > 1 else None
+    if second is None:  # a single chunk is not worth a process pool
+        if initializer is not None: initializer(*initargs)
+        yield from map_chunk(func, first)
+        for chunk in chunks: yield from map_chunk(func, chunk)
+        return
+
+    if max_pending is None: max_pending = 2 * workers
+    pending = deque()
+
+    with multiprocessing.Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        for chunk in (first, second):
+            pending.append(pool.apply_async(map_chunk, (func, chunk)))
+        for chunk in chunks:
+            if len(pending) >= max_pending: yield from pending.popleft().get()
+            pending.append(pool.apply_async(map_chunk, (func, chunk)))
+        while pending:
+            yield from pending.popleft().get()
@@ -0,0 +1,218 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import os
+import re
+import time
+from typing import Dict, List, Any, Iterator, Optional
+
+
+class Pattern:
+    """
+    A named regular expression that is compiled once on first use and shared by every module that registers the same name.
+    When the registry is profiling, every call records its number of matches and the time spent.
+    """
+    __slots__ = ('name', 'pattern', 'flags', 'registry', 'compiled_', 'calls', 'matches', 'seconds')
+
+    def __init__(self, name: str, pattern: str, flags: int, registry: 'PatternRegistry'):
+        self.name = name
+        self.pattern = pattern
+        self.flags = flags
+        self.registry = registry
+        self.compiled_ = None
+        self.calls = 0
+        self.matches = 0
+        self.seconds = 0.0
+
+    @property
+    def compiled(self) -> re.Pattern:
+        if self.compiled_ is None: self.compiled_ = re.compile(self.pattern, self.flags)
+        return self.compiled_
+
+    @property
+    def groups(self) -> int:
+        return self.compiled.groups
+
+    @property
+    def groupindex(self) -> Dict[str, int]:
+        return self.compiled.groupindex
+
+    def record(self, st: float, matches: int):
+        self.seconds += time.perf_counter() - st
+        self.calls += 1
+        self.matches += matches
+
+    def search(self, string: str, *args) -> Optional[re.Match]:
+        if not self.registry.profile: return self.compiled.search(string, *args)
+        st = time.perf_counter()
+        m = self.compiled.search(string, *args)
+        self.record(st, m is not None)
+        return m
+
+    def match(self, string: str, *args) -> Optional[re.Match]:
+        if not self.registry.profile: return self.compiled.match(string, *args)
+        st = time.perf_counter()
+        m = self.compiled.match(string, *args)
+        self.record(st, m is not None)
+        return m
+
+    def fullmatch(self, string: str, *args) -> Optional[re.Match]:
+        if not self.registry.profile: return self.compiled.fullmatch(string, *args)
+        st = time.perf_counter()
+        m = self.compiled.fullmatch(string, *args)
+        self.record(st, m is not None)
+        return m
+
+    def finditer(self, string: str, *args) -> Iterator[re.Match]:
+        if not self.registry.profile: return self.compiled.finditer(string, *args)
+        return self.profile_finditer(string, *args)
+
+    def profile_finditer(self, string: str, *args) -> Iterator[re.Match]:
+        st, count, seconds = time.perf_counter(), 0, 0.0
+        it = self.compiled.finditer(string, *args)
+        try:
+            while True:
+                m = next(it, None)
+                seconds += time.perf_counter() - st
+                if m is None: break
+                count += 1
+                yield m
+                st = time.perf_counter()
+        finally:
+            self.calls += 1
+            self.matches += count
+            self.seconds += seconds
+
+    def findall(self, string: str, *args) -> List[Any]:
+        if not self.registry.profile: return self.compiled.findall(string, *args)
+        st = time.perf_counter()
+        ms = self.compiled.findall(string, *args)
+        self.record(st, len(ms))
+        return ms
+
+    def sub(self, repl: Any, string: str, count: int = 0) -> str:
+        if not self.registry.profile: return self.compiled.sub(repl, string, count)
+        st = time.perf_counter()
+        s, n = self.compiled.subn(repl, string, count)
+        self.record(st, n)
+        return s
+
+    def split(self, string: str, maxsplit: int = 0) -> List[str]:
+        if not self.registry.profile: return self.compiled.split(string, maxsplit)
+        st = time.perf_counter()
+        ss = self.compiled.split(string, maxsplit)
+        self.record(st, len(ss) - 1)
+        return ss
+
+    def __repr__(self):
+        return 'Pattern({!r}, {!r})'.format(self.name, self.pattern)
+
+
+class PatternRegistry:
+    """
+    The registry of all regular expressions used across modules.
+    Set `profile` (or the environment variable CS329_PATTERN_STATS=1) to record per-pattern match counts and time.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.patterns: Dict[str, Pattern] = dict()
+        self.profile = profile
+
+    def register(self, name: str, pattern: str, flags: int = 0) -> Pattern:
+        """
+        :param name: the unique name of the pattern.
+        :param pattern: the regular expression.
+        :param flags: the re flags.
+        :return: the shared pattern; registering the same name twice returns the same object.
+        """
+        p = self.patterns.get(name)
+        if p is None:
+            p = self.patterns[name] = Pattern(name, pattern, flags, self)
+        elif p.pattern != pattern or p.flags != flags:
+            raise ValueError('Pattern {} is already registered as {!r}'.format(name, p.pattern))
+        return p
+
+    def __getitem__(self, name: str) -> Pattern:
+        return self.patterns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.patterns
+
+    def compile_all(self):
+        """
+        Compiles every registered pattern now instead of on first use (e.g., before forking workers).
+        """
+        for p in self.patterns.values(): p.compiled
+
+    def reset_stats(self):
+        for p in self.patterns.values(): p.calls, p.matches, p.seconds = 0, 0, 0.0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        :return: per-pattern statistics sorted by the time spent in descending order.
+        """
+        stats = [{'name': p.name, 'pattern': p.pattern, 'calls': p.calls, 'matches': p.matches, 'seconds': p.seconds}
+                 for p in self.patterns.values()]
+        return sorted(stats, key=lambda d: d['seconds'], reverse=True)
+
+    def report(self) -> str:
+        lines = ['{:<14} {:>10} {:>10} {:>10}'.format('pattern', 'calls', 'matches', 'seconds')]
+        for d in self.stats():
+            lines.append('{:<14} {:>10} {:>10} {:>10.4f}'.format(d['name'], d['calls'], d['matches'], d['seconds']))
+        return '\n'.join(lines)
+
+
+PATTERNS = PatternRegistry(profile=os.environ.get('CS329_PATTERN_STATS', '') not in {'', '0'})
+
+# tokenizer (regular_expression.py, tokenization.py)
+RE_TOK = PATTERNS.register('TOK', r'([",.]|n\'t|\s+)')
+RE_ABBR = PATTERNS.register('ABBR', r'((?:Mr|Mrs|Ms|Dr)\.)|((?:[A-Z]\.){2,})')  # Mr. Dr. Mrs. U.S.A. USA.
+RE_APOS = PATTERNS.register('APOS', r'\'(\d\ds?|cause)')
+RE_CONC = PATTERNS.register('CONC', r'([A-Za-z]+)(n\'t)|(gon)(na)|(can)(not)')
+RE_HYPE = PATTERNS.register('HYPE', r'(https?:\/\/\S+)')
+RE_NUMB = PATTERNS.register('NUMB', r'(\d+\/\d+)|(\d{3}-\d{3}-\d{4})|(\d(?:,\d{3})+)')
+RE_UNIT = PATTERNS.register('UNIT', r'([$#])?(\d+)([km]g)?')
+RE_PUNC = PATTERNS.register('PUNC', r'[",.]|n\'t')
+RE_WORD = PATTERNS.register('WORD', r'[^\s",.n]+(?:n(?!\'t)[^\s",.n]*)*|n(?!\'t)[^\s",.n]*(?:n(?!\'t)[^\s",.n]*)*')  # stops before n't
+RE_CONC_SCAN = PATTERNS.register('CONC_SCAN', r'(gon)(na)|(can)(not)')  # the n't branch of RE_CONC is covered by RE_WORD + RE_PUNC
+# words and punctuation whose first characters no other scanner rule can match, so that they skip the other rules
+RE_PLAIN = PATTERNS.register('PLAIN', r'(?!https?://|[A-Z]\.|(?:Mr|Mrs|Ms|Dr)\.|gonna|cannot|n\'t)[^\s\d\'$#",.][^\s",.n]*'
+                                      r'(?:n(?!\'t)[^\s",.n]*)*|[",.]|n\'t')
+
+STARTS = ['"']
+ENDS = ["n't", '.', ',', '"']
+
+# normalizer (quiz/quiz1.py)
+RE_NUMBER_WORD = PATTERNS.register('NUMBER_WORD', r'[A-Za-z]+')
+RE_NUMBER_GAP = PATTERNS.register('NUMBER_GAP', r'\s+|\s*-\s*')
+
+
+if __name__ == '__main__':
+    from src.patterns import PATTERNS  # the registry shared with the modules below, not the one of __main__
+    from src.quiz.quiz1 import normalize
+    from src.regular_expression import tokenize, tokenize_regex
+
+    texts = []
+    for line in open('dat/pos/wsj-pos.dev.gold.tsv'):
+        l = line.split()
+        texts.append(l[0] if l else '\n')
+    texts = ' '.join(texts).split('\n')
+
+    PATTERNS.profile = True
+    for text in texts:
+        tokenize(text)
+        tokenize_regex(text)
+        normalize(text)
+    print(PATTERNS.report())
@@ -0,0 +1,175 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+from typing import Dict, Sequence, Optional
+
+import numpy as np
+
+from src.pos_model import CompactModel
+from src.pos_training import ContextTable, hash_keys
+
+# the tables keyed by (word, word) or (tag, word) pairs, which hold most contexts seen only once
+PAIR_TABLES = ('first', 'second', 'third', 'fourth')
+
+
+def entry_rows(table: ContextTable) -> np.ndarray:
+    """
+    :return: the row of every entry in the table.
+    """
+    return np.repeat(np.arange(len(table.indptr) - 1), np.diff(table.indptr))
+
+
+def entry_counts(table: ContextTable) -> np.ndarray:
+    """
+    :return: the observed count of every (context, tag) entry, recovered from the probabilities and the totals.
+    """
+    return np.rint(table.values(slice(None)) * table.totals[entry_rows(table)]).astype(np.int64)
+
+
+def select(table: ContextTable, rows: np.ndarray) -> ContextTable:
+    """
+    :param rows: the keyed rows to keep in ascending order.
+    :return: a table with only the rows kept (without hash buckets).
+    """
+    keep = np.zeros(len(table.indptr) - 1, dtype=bool)
+    keep[rows] = True
+    keep = keep[entry_rows(table)]
+    sizes = np.bincount(entry_rows(table)[keep], minlength=len(table.indptr) - 1)[rows]
+    indptr = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    return ContextTable(table.keys[rows], indptr, table.tags[keep], table.probs[keep], table.totals[rows], table.scale)
+
+
+def prune(table: ContextTable, min_count: int) -> ContextTable:
+    """
+    :return: the table without the contexts observed less than `min_count` times.
+    """
+    return select(table, np.flatnonzero(table.totals[:len(table)] >= min_count))
+
+
+def top_k(table: ContextTable, k: int) -> ContextTable:
+    """
+    :return: the table keeping only the `k` most probable tags of each context (the entries are in descending order).
+    """
+    rows = entry_rows(table)
+    keep = np.arange(len(rows)) - table.indptr[rows] < k
+    sizes = np.bincount(rows[keep], minlength=len(table.indptr) - 1)
+    indptr = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    return ContextTable(table.keys, indptr, table.tags[keep], table.probs[keep], table.totals, table.scale, table.buckets)
+
+
+def hash_rare(table: ContextTable, min_count: int, buckets: int) -> ContextTable:
+    """
+    Keeps the contexts observed at least `min_count` times and merges the counts of the other contexts into `buckets` rows
+    indexed by hash_keys(), so an unseen or rare context falls back to the distribution of its bucket.
+    """
+    frequent = table.totals[:len(table)] >= min_count
+    rows, counts = entry_rows(table), entry_counts(table)
+    rare = ~frequent[rows]
+
+    bucket = hash_keys(table.keys[rows[rare]], buckets)
+    num_tags = int(table.tags.max()) + 1 if len(table.tags) else 1
+    merged = np.bincount(bucket * num_tags + table.tags[rare], weights=counts[rare], minlength=buckets * num_tags)
+    b, tag = np.divmod(np.flatnonzero(merged), num_tags)
+    bucket_counts = merged[b * num_tags + tag]
+    order = np.lexsort((tag, -bucket_counts, b))  # by bucket, then by count in descending order
+    b, tag, bucket_counts = b[order], tag[order], bucket_counts[order]
+    bucket_totals = np.bincount(b, weights=bucket_counts, minlength=buckets)
+
+    kept = select(table, np.flatnonzero(frequent))
+    sizes = np.bincount(b, minlength=buckets)
+    indptr = np.concatenate((kept.indptr, kept.indptr[-1] + np.cumsum(sizes))).astype(np.int64)
+    probs = bucket_counts / bucket_totals[b]
+    return ContextTable(kept.keys, indptr, np.concatenate((kept.tags, tag.astype(kept.tags.dtype))),
+                        np.concatenate((kept.probs, probs.astype(kept.probs.dtype))),
+                        np.concatenate((kept.totals, bucket_totals.astype(kept.totals.dtype))), buckets=buckets)
+
+
+def quantize(table: ContextTable, bits: int) -> ContextTable:
+    """
+    :param bits: 8 or 16; the probabilities are rounded to multiples of 1 / (2 ** bits - 1).
+    :return: the table with unsigned integer probabilities and their scale.
+    """
+    if bits not in (8, 16): raise ValueError('Unsupported number of bits: {}'.format(bits))
+    levels = 2 ** bits - 1
+    probs = np.rint(table.values(slice(None)) * levels).astype(np.uint8 if bits == 8 else np.uint16)
+    return ContextTable(table.keys, table.indptr, table.tags, probs, table.totals, 1.0 / levels, table.buckets)
+
+
+def compress(tables: Dict[str, ContextTable],
+             names: Sequence[str] = PAIR_TABLES,
+             min_count: int = 1,
+             k: Optional[int] = None,
+             bits: Optional[int] = None,
+             buckets: int = 0) -> Dict[str, ContextTable]:
+    """
+    :param tables: the context tables returned by pos_training.train_tables().
+    :param names: the tables to compress; the other tables are returned as they are.
+    :param min_count: contexts observed less than this many times are pruned, or hashed if `buckets` > 0.
+    :param k: if not None, keep only the top-k tags of each context.
+    :param bits: if not None, quantize the probabilities to 8 or 16 bits.
+    :param buckets: the number of hash buckets for the rare contexts; 0 prunes them instead.
+    :return: the compressed tables, to be passed to CompactModel.from_tables().
+    """
+    out = dict(tables)
+    for name in names:
+        table = tables[name]
+        if min_count > 1: table = hash_rare(table, min_count, buckets) if buckets else prune(table, min_count)
+        if k is not None: table = top_k(table, k)
+        if bits is not None: table = quantize(table, bits)
+        out[name] = table
+    return out
+
+
+def model_size(model: CompactModel) -> int:
+    """
+    :return: the number of bytes of all arrays in the model.
+    """
+    size = model.vocab.nbytes + model.vocab_ids.nbytes
+    for table in model.tables.values():
+        size += sum(a.nbytes for a in (table.keys, table.indptr, table.tags, table.probs, table.totals))
+    return size
+
+
+if __name__ == '__main__':
+    import time
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, tst_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    words, tags, tables = train_tables(trn_data)
+
+    configs = [
+        ('full', {}),
+        ('16-bit', dict(bits=16)),
+        ('8-bit', dict(bits=8)),
+        ('top-3', dict(k=3)),
+        ('top-1', dict(k=1)),
+        ('min-count 2', dict(min_count=2)),
+        ('min-count 3', dict(min_count=3)),
+        ('min-count 2, hash 4096', dict(min_count=2, buckets=4096)),
+        ('min-count 2, top-3, 8-bit', dict(min_count=2, k=3, bits=8)),
+        ('min-count 3, top-1, 8-bit', dict(min_count=3, k=1, bits=8)),
+    ]
+
+    base = None
+    print('{:<27} {:>10} {:>7} {:>9} {:>8}'.format('Config', 'Size (KB)', 'Ratio', 'Accuracy', 'Sec'))
+    for label, kwargs in configs:
+        model = CompactModel.from_tables(words, tags, compress(tables, **kwargs))
+        size = model_size(model)
+        if base is None: base = size
+        st = time.perf_counter()
+        acc = model.evaluate(tst_data)
+        print('{:<27} {:>10.1f} {:>6.2f}x {:>8.2f}% {:>8.2f}'.format(label, size / 1024, base / size, acc, time.perf_counter() - st))
@@ -0,0 +1,54 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import mmap
+from typing import List, Tuple, Iterator
+
+BUFFER_SIZE = 1 << 20
+
+
+def iter_lines(filename: str, use_mmap: bool = False, encoding: str = 'utf-8') -> Iterator[str]:
+    """
+    :param filename: the path to a text file.
+    :param use_mmap: if True, read the file through a memory map; otherwise, through a large read buffer.
+    :return: an iterator of the lines in the file.
+    """
+    if not use_mmap:
+        with open(filename, encoding=encoding, buffering=BUFFER_SIZE) as fin:
+            yield from fin
+        return
+
+    with open(filename, 'rb') as fin:
+        if fin.seek(0, 2) == 0: return  # empty files cannot be memory-mapped
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''): yield line.decode(encoding)
+
+
+def iter_sentences(filename: str, use_mmap: bool = False, encoding: str = 'utf-8') -> Iterator[List[Tuple[str, str]]]:
+    """
+    Reads a tab-separated corpus (word and POS tag per line, a blank line after every sentence) lazily.
+    The last sentence is returned even if the file does not end with a blank line.
+    :return: an iterator of sentences where every sentence is a list of (word, pos) pairs.
+    """
+    sentence = []
+    for line in iter_lines(filename, use_mmap, encoding):
+        l = line.split()
+        if l:
+            sentence.append((l[0], l[1]))
+        elif sentence:
+            yield sentence
+            sentence = []
+    if sentence: yield sentence
+
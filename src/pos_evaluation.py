@@ -0,0 +1,170 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import time
+from typing import List, Tuple, Dict, Iterable, Sequence, Optional
+
+import numpy as np
+
+from src.parallel import chunked, imap_chunks
+from src.pos_corpus import iter_sentences
+from src.pos_model import CompactModel
+
+UNSEEN = '<unseen>'  # gold tags unseen by the model (a row only)
+NO_TAG = '<XX>'  # the XX prediction for tokens without any context (a column only, so never correct)
+
+MODEL: Optional[CompactModel] = None
+LABEL_IDS: Dict[str, int] = {}
+WEIGHTS: Optional[Sequence[float]] = None
+BEAM_WIDTH = 1
+
+
+class Evaluation:
+    def __init__(self, labels: List[str], confusion: np.ndarray, sentences: int, seconds: float = 0.0):
+        """
+        :param labels: the tag of each row and column in the confusion matrix.
+        :param confusion: confusion[g, p] is the number of tokens whose gold tag is labels[g] and predicted tag is labels[p].
+        :param sentences: the number of evaluated sentences.
+        :param seconds: the wall-clock time of the evaluation.
+        """
+        self.labels = labels
+        self.confusion = confusion
+        self.sentences = sentences
+        self.seconds = seconds
+
+    @property
+    def tokens(self) -> int:
+        return int(self.confusion.sum())
+
+    @property
+    def accuracy(self) -> float:
+        return 100.0 * np.trace(self.confusion) / max(self.tokens, 1)
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds > 0 else 0.0
+
+    def per_tag(self) -> Dict[str, Tuple[float, float, int]]:
+        """
+        :return: a dictionary where the key is a tag and the value is (precision, recall, gold count) in percent.
+        """
+        correct = np.diag(self.confusion).astype(np.float64)
+        gold = self.confusion.sum(axis=1)
+        pred = self.confusion.sum(axis=0)
+        precision = 100.0 * correct / np.maximum(pred, 1)
+        recall = 100.0 * correct / np.maximum(gold, 1)
+        return {tag: (float(precision[i]), float(recall[i]), int(gold[i]))
+                for i, tag in enumerate(self.labels) if gold[i] or pred[i]}
+
+    def report(self, top: int = 10) -> str:
+        """
+        :param top: the number of the most frequent confusions to show.
+        """
+        lines = ['Accuracy: {:5.2f}% ({} tokens, {} sentences, {:.2f} sec, {:.0f} tokens/sec)'.format(
+            self.accuracy, self.tokens, self.sentences, self.seconds, self.tokens_per_second)]
+
+        lines.append('{:<8} {:>9} {:>9} {:>8}'.format('Tag', 'Precision', 'Recall', 'Count'))
+        for tag, (p, r, c) in sorted(self.per_tag().items(), key=lambda x: -x[1][2]):
+            lines.append('{:<8} {:>8.2f}% {:>8.2f}% {:>8}'.format(tag, p, r, c))
+
+        errors = self.confusion.copy()
+        np.fill_diagonal(errors, 0)
+        lines.append('Top confusions (gold -> predicted):')
+        for i in np.argsort(errors, axis=None)[::-1][:top]:
+            g, p = divmod(int(i), len(self.labels))
+            if errors[g, p] == 0: break
+            lines.append('{:<8} -> {:<8} {:>8}'.format(self.labels[g], self.labels[p], errors[g, p]))
+
+        return '\n'.join(lines)
+
+
+def init_worker(model_path: str, weights: Optional[Sequence[float]], beam_width: int):
+    global MODEL, LABEL_IDS, WEIGHTS, BEAM_WIDTH
+    MODEL = CompactModel.load(model_path)
+    LABEL_IDS = {tag: i for i, tag in enumerate(MODEL.tags)}
+    WEIGHTS, BEAM_WIDTH = weights, beam_width
+
+
+def evaluate_shard(data: List[List[Tuple[str, str]]]) -> Tuple[np.ndarray, int]:
+    """
+    :return: the confusion matrix and the number of sentences of the shard.
+    """
+    unseen, no_tag = len(MODEL.tags), len(MODEL.tags) + 1
+    num_labels = len(MODEL.tags) + 2
+    sentences = [[w for w, _ in sentence] for sentence in data]
+    outputs = MODEL.predict_batch(sentences, WEIGHTS, BEAM_WIDTH)
+    gold = np.array([LABEL_IDS.get(t, unseen) for sentence in data for _, t in sentence], dtype=np.int64)
+    pred = np.array([no_tag if t == 'XX' else LABEL_IDS[t] for output in outputs for t, _ in output], dtype=np.int64)
+    confusion = np.bincount(gold * num_labels + pred, minlength=num_labels * num_labels)
+    return confusion.reshape(num_labels, num_labels), len(data)
+
+
+def evaluate(model_path: str,
+             data: Iterable[List[Tuple[str, str]]],
+             weights: Optional[Sequence[float]] = None,
+             beam_width: int = 1,
+             workers: Optional[int] = None,
+             shard_size: int = 1000) -> Evaluation:
+    """
+    Evaluates the model on the data where shards of sentences are tagged across processes and their counts are merged.
+    :param model_path: the path to a model saved by CompactModel.save(); every worker memory-maps the model.
+    :param data: sentences where every sentence is a list of (word, pos) pairs; read lazily.
+    :param weights: see CompactModel.predict_batch().
+    :param beam_width: see CompactModel.predict_batch().
+    :param workers: the number of worker processes; see parallel.imap_chunks().
+    :param shard_size: the number of sentences in each shard.
+    """
+    labels = CompactModel.load(model_path).tags + [UNSEEN, NO_TAG]
+    confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    sentences = 0
+
+    st = time.perf_counter()
+    for counts, n in imap_chunks(evaluate_shard, chunked(data, shard_size), workers=workers, chunksize=1,
+                                 initializer=init_worker, initargs=(model_path, weights, beam_width)):
+        confusion += counts
+        sentences += n
+
+    return Evaluation(labels, confusion, sentences, time.perf_counter() - st)
+
+
+def evaluate_file(model_path: str, filename: str, use_mmap: bool = False, **kwargs) -> Evaluation:
+    """
+    Streams the tab-separated corpus (see pos_corpus.iter_sentences()) into evaluate().
+    """
+    return evaluate(model_path, iter_sentences(filename, use_mmap), **kwargs)
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    filename = 'dat/pos/wsj-pos.dev.gold.tsv'
+    data = quiz3.read_data(filename)
+    trn_data, tst_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    weights = (1.0, 1.0, 1.0, 1.0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'quiz3.model')
+        CompactModel.from_tables(*train_tables(trn_data), weights=weights).save(model_path)
+
+        result = evaluate(model_path, tst_data, workers=1)
+        print(result.report())
+        print('CompactModel.evaluate: {:5.2f}%'.format(CompactModel.load(model_path).evaluate(tst_data)))
+
+        for workers in [1, 2, 4]:
+            result = evaluate_file(model_path, filename, workers=workers, shard_size=500)
+            print('workers {}: {:5.2f}%, {:8.0f} tokens/sec'.format(workers, result.accuracy, result.tokens_per_second))
@@ -0,0 +1,114 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+from typing import List, Tuple, Sequence, Optional
+
+import numpy as np
+
+from src.pos_model import CompactModel, CW_WEIGHT, PW_WEIGHT, NW_WEIGHT
+
+
+class FeatureCache:
+    """
+    The weight-independent part of predict() for a fixed set of sentences, computed once:
+    for every token, the tag-probability vectors of cw + pw + nw (with their fixed weights), first, second, and fourth,
+    and the rows of the third table for every previous tag.
+    A trial with new weights is then a weighted sum of four matrices followed by the greedy decoding.
+    """
+
+    def __init__(self, model: CompactModel, data: List[List[Tuple[str, str]]]):
+        """
+        :param model: the model to evaluate.
+        :param data: sentences where every sentence is a list of (word, pos) pairs.
+        """
+        self.model = model
+        self.lengths = np.array([len(sentence) for sentence in data], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths))).tolist()
+        self.gold = [pos for sentence in data for _, pos in sentence]
+
+        word_ids = model.encode([word for sentence in data for word, _ in sentence])
+        keys = model.static_keys(word_ids, self.lengths)
+        n, t = len(word_ids), len(model.tags)
+        self.found = np.zeros(n, dtype=bool)
+
+        self.base = np.zeros((n, t), dtype=np.float32)
+        for name, weight in [('cw', CW_WEIGHT), ('pw', PW_WEIGHT), ('nw', NW_WEIGHT)]:
+            model.source_scores(name, keys[name], self.base, weight, self.found)
+
+        self.sources = []
+        for name in ['first', 'second', 'fourth']:
+            scores = np.zeros((n, t), dtype=np.float32)
+            model.source_scores(name, keys[name], scores, 1.0, self.found)
+            self.sources.append(scores)
+
+        self.found = self.found.tolist()
+        self.third_rows = model.third_rows(word_ids).tolist()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def scores(self, weights: Sequence[float], end: Optional[int] = None) -> np.ndarray:
+        """
+        :param weights: the weights of the first, second, third, and fourth tables.
+        :param end: the number of tokens to score from the beginning; if None, all tokens.
+        :return: the same (token x tag) scores as CompactModel.static_scores().
+        """
+        first_weight, second_weight, _, fourth_weight = weights
+        first, second, fourth = (s[:end] for s in self.sources)
+        return self.base[:end] + first_weight * first + second_weight * second + fourth_weight * fourth
+
+    def predict(self, weights: Sequence[float], sentences: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """
+        :param weights: the weights of the first, second, third, and fourth tables.
+        :param sentences: the number of sentences to predict from the beginning; if None, all sentences.
+        :return: the same output as CompactModel.predict_batch() for the sentences.
+        """
+        if sentences is None: sentences = len(self)
+        offsets = self.offsets[:sentences + 1]
+        scores = self.scores(weights, offsets[-1])
+        return [self.model.decode_greedy(scores, self.found, self.third_rows, weights[2], b, e)
+                for b, e in zip(offsets, offsets[1:])]
+
+    def evaluate(self, weights: Sequence[float], sentences: Optional[int] = None) -> float:
+        """
+        :return: the accuracy in percent of the first sentences; see predict().
+        """
+        pred = [p for output in self.predict(weights, sentences) for p, _ in output]
+        correct = sum(1 for g, p in zip(self.gold, pred) if g == p)
+        return 100.0 * correct / len(pred)
+
+
+if __name__ == '__main__':
+    import itertools
+    import time
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, dev_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    model = CompactModel.from_tables(*train_tables(trn_data))
+    grid = list(itertools.product([0.5, 1, 2], repeat=4))[:9]
+
+    st = time.perf_counter()
+    expected = [model.evaluate(dev_data, weights) for weights in grid]
+    print('CompactModel.evaluate: {:.2f} sec/trial'.format((time.perf_counter() - st) / len(grid)))
+
+    st = time.perf_counter()
+    cache = FeatureCache(model, dev_data)
+    print('FeatureCache:          {:.2f} sec to build'.format(time.perf_counter() - st))
+    st = time.perf_counter()
+    actual = [cache.evaluate(weights) for weights in grid]
+    print('FeatureCache.evaluate: {:.2f} sec/trial'.format((time.perf_counter() - st) / len(grid)))
+    print('same accuracies: {}'.format(all(abs(e - a) < 1e-9 for e, a in zip(expected, actual))))
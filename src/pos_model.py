@@ -0,0 +1,374 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import json
+import os
+from typing import List, Tuple, Dict, Sequence, Optional, Iterable
+
+import numpy as np
+
+from src.parallel import chunked
+from src.pos_training import TABLES, Vocab, ContextTable, shift, hash_keys
+
+FORMAT_VERSION = 1
+TABLE_ARRAYS = ['keys', 'indptr', 'tags', 'probs', 'totals']
+
+# fixed weights of quiz3.predict() for cw, pp, pw, nw
+CW_WEIGHT, PP_WEIGHT, PW_WEIGHT, NW_WEIGHT = 1.0, 0.5, 0.5, 0.5
+
+
+def expand(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param indptr: the CSR offsets of a table.
+    :param rows: row indices of the table.
+    :return: for every entry of the rows, the index of its row in `rows` and its index in the entry arrays of the table.
+    """
+    starts = indptr[rows]
+    lens = indptr[rows + 1] - starts
+    ends = lens.cumsum()
+    which = np.arange(len(rows)).repeat(lens)
+    return which, np.arange(ends[-1] if len(ends) else 0) - (ends - lens - starts).repeat(lens)
+
+
+class CompactModel:
+    """
+    The POS model of quiz3 as flat arrays: the sorted vocabulary (UTF-8 bytes) with the word ID of each entry,
+    the tag list, and one CSR ContextTable per table of TABLES with float32 (or quantized, see pos_compression) probabilities.
+    Loaded models memory-map every array so that worker processes share the same pages.
+    """
+
+    def __init__(self, vocab: np.ndarray, vocab_ids: np.ndarray, num_words: int, tags: List[str],
+                 tables: Dict[str, ContextTable], weights: Sequence[float]):
+        """
+        :param vocab: the sorted vocabulary in UTF-8 bytes.
+        :param vocab_ids: the word ID of each entry in the sorted vocabulary.
+        :param num_words: the number of word IDs used to encode pair contexts.
+        :param tags: the tag of each tag ID.
+        :param tables: the context tables of TABLES.
+        :param weights: the weights of the first, second, third, and fourth tables.
+        """
+        self.vocab = vocab
+        self.vocab_ids = vocab_ids
+        self.num_words = num_words
+        self.tags = tags
+        self.tables = tables
+        self.weights = tuple(float(w) for w in weights)
+
+        # pp depends only on the previous tag: keep it as a dense (previous tag x tag) matrix
+        pp = tables['pp']
+        self.pp_matrix = np.zeros((len(tags), len(tags)), dtype=np.float32)
+        self.pp_found = [False] * len(tags)
+        rows, idx = expand(pp.indptr, np.arange(len(pp)))
+        self.pp_matrix[pp.keys[rows], pp.tags[idx]] = pp.values(idx)
+        for key in pp.keys.tolist(): self.pp_found[key] = True
+        self.pp_rows = [PP_WEIGHT * self.pp_matrix[i] if f else None for i, f in enumerate(self.pp_found)]
+
+    @classmethod
+    def from_tables(cls, words: Vocab, tags: Vocab, tables: Dict[str, ContextTable],
+                    weights: Sequence[float] = (1.0, 1.0, 1.0, 1.0)) -> 'CompactModel':
+        """
+        :return: the compact model of the tables trained by pos_training.train_tables().
+        """
+        encoded = np.array([w.encode('utf-8') for w in words.items], dtype=np.bytes_)
+        order = np.argsort(encoded, kind='stable')
+        tag_dtype = np.int16 if len(tags) < 2 ** 15 else np.int32
+        compact = {name: ContextTable(t.keys.astype(np.int64), t.indptr.astype(np.int64), t.tags.astype(tag_dtype),
+                                      t.probs if t.scale is not None else t.probs.astype(np.float32),  # keep quantized probs
+                                      t.totals.astype(np.int32), t.scale, t.buckets) for name, t in tables.items()}
+        return cls(encoded[order], order.astype(np.int32), len(words), list(tags.items), compact, weights)
+
+    def save(self, path: str):
+        """
+        Saves the model to the directory as one .npy file per array and meta.json.
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'vocab.npy'), self.vocab)
+        np.save(os.path.join(path, 'vocab_ids.npy'), self.vocab_ids)
+        for name, table in self.tables.items():
+            for attr in TABLE_ARRAYS: np.save(os.path.join(path, '{}.{}.npy'.format(name, attr)), getattr(table, attr))
+
+        meta = {'version': FORMAT_VERSION, 'num_words': self.num_words, 'tags': self.tags, 'tables': list(self.tables),
+                'weights': self.weights,
+                'scales': {name: t.scale for name, t in self.tables.items() if t.scale is not None},
+                'buckets': {name: t.buckets for name, t in self.tables.items() if t.buckets}}
+        with open(os.path.join(path, 'meta.json'), 'w') as fout:
+            json.dump(meta, fout)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'CompactModel':
+        """
+        :param path: the directory of a saved model.
+        :param mmap: if True, memory-map the arrays instead of reading them.
+        """
+        with open(os.path.join(path, 'meta.json')) as fin:
+            meta = json.load(fin)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported model format: {}'.format(meta['version']))
+
+        mode = 'r' if mmap else None
+        # plain ndarray views over the maps avoid the overhead of np.memmap on every slice
+        load = lambda filename: np.asarray(np.load(os.path.join(path, filename), mmap_mode=mode))
+        scales, buckets = meta.get('scales', {}), meta.get('buckets', {})
+        tables = {name: ContextTable(*[load('{}.{}.npy'.format(name, attr)) for attr in TABLE_ARRAYS],
+                                     scale=scales.get(name), buckets=buckets.get(name, 0)) for name in meta['tables']}
+        return cls(load('vocab.npy'), load('vocab_ids.npy'), meta['num_words'], meta['tags'], tables, meta['weights'])
+
+    def encode(self, tokens: Sequence[str]) -> np.ndarray:
+        """
+        :return: the word ID of every token; -1 for unknown words.
+        """
+        if not len(tokens): return np.zeros(0, dtype=np.int64)
+        encoded = np.array([t.encode('utf-8') for t in tokens], dtype=np.bytes_)
+        idx = np.minimum(np.searchsorted(self.vocab, encoded), len(self.vocab) - 1)
+        return np.where(self.vocab[idx] == encoded, self.vocab_ids[idx], -1).astype(np.int64)
+
+    @staticmethod
+    def find_rows(table: ContextTable, keys: np.ndarray) -> np.ndarray:
+        """
+        :param keys: context keys of any shape; negative keys are never found.
+        :return: the row of every key in the table, or of its non-empty hash bucket if the table has buckets; -1 if not found.
+        """
+        if not len(table.keys): return np.full(np.shape(keys), -1, dtype=np.int64)
+        rows = np.minimum(table.keys.searchsorted(keys), len(table.keys) - 1)
+        hit = table.keys[rows] == keys  # keys in the table are non-negative
+        rows[~hit] = -1
+        if table.buckets:
+            miss = (keys >= 0) & ~hit
+            buckets = len(table.keys) + hash_keys(keys[miss], table.buckets)
+            rows[miss] = np.where(table.indptr[buckets + 1] > table.indptr[buckets], buckets, -1)
+        return rows
+
+    def source_scores(self, name: str, keys: np.ndarray, out: np.ndarray, weight: float, found: np.ndarray):
+        """
+        Adds the weighted tag probabilities of the table for every context key to the (token x tag) score matrix.
+        :param keys: one context key per token; negative keys are skipped.
+        :param found: marks the tokens whose context is found in the table.
+        """
+        table = self.tables[name]
+        rows = self.find_rows(table, keys)
+        positions = np.flatnonzero(rows >= 0)
+        which, idx = expand(table.indptr, rows[positions])
+        out[positions[which], table.tags[idx]] += weight * table.values(idx)
+        found[positions] = True
+
+    def static_keys(self, word_ids: np.ndarray, lengths: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        :param word_ids: the word IDs of all tokens in one or more sentences.
+        :param lengths: the length of every sentence.
+        :return: the context key of every token for each table that does not depend on the previous tag.
+        """
+        W = self.num_words
+        prev_ids, next_ids = shift(word_ids, lengths, -1), shift(word_ids, lengths, 1)
+        pair = lambda a, b: np.where((a >= 0) & (b >= 0), a * W + b, -1)
+        return {'cw': word_ids, 'pw': prev_ids, 'nw': next_ids, 'first': pair(prev_ids, word_ids),
+                'second': pair(word_ids, next_ids), 'fourth': pair(prev_ids, next_ids)}
+
+    def static_scores(self, word_ids: np.ndarray, lengths: np.ndarray, weights: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param word_ids: the word IDs of all tokens in one or more sentences.
+        :param lengths: the length of every sentence.
+        :param weights: the weights of the first, second, third, and fourth tables.
+        :return: the (token x tag) scores of all tables that do not depend on the previous tag,
+                 and whether any of them is found for each token.
+        """
+        first_weight, second_weight, _, fourth_weight = weights
+        table_weights = {'cw': CW_WEIGHT, 'pw': PW_WEIGHT, 'nw': NW_WEIGHT,
+                         'first': first_weight, 'second': second_weight, 'fourth': fourth_weight}
+        scores = np.zeros((len(word_ids), len(self.tags)), dtype=np.float32)
+        found = np.zeros(len(word_ids), dtype=bool)
+        for name, keys in self.static_keys(word_ids, lengths).items():
+            self.source_scores(name, keys, scores, table_weights[name], found)
+        return scores, found
+
+    def third_rows(self, word_ids: np.ndarray) -> np.ndarray:
+        """
+        :return: the (previous tag x token) rows of (previous tag, word) in the third table; -1 if not found.
+        """
+        keys = np.where(word_ids >= 0, np.arange(len(self.tags))[:, None] * self.num_words + word_ids, -1)
+        return self.find_rows(self.tables['third'], keys)
+
+    def decode_greedy(self, scores: np.ndarray, found: List[bool], third_rows: Optional[List[List[int]]], third_weight: float,
+                      begin: int, end: int, word_ids: Optional[List[int]] = None) -> List[Tuple[str, float]]:
+        """
+        Greedily adds the scores of the tables depending on the previous tag, token by token, to the static scores.
+        :param third_rows: the rows of third_rows() as lists; if None, the row of the previous tag is found token by token
+                           from word_ids, which is cheaper for a single sentence than the rows of all previous tags.
+        :param begin: the index of the first token of the sentence.
+        :param end: the index of the last token of the sentence + 1.
+        """
+        third, pp_rows = self.tables['third'], self.pp_rows
+        output, prev = [], 0
+
+        for i in range(begin, end):
+            s, any_found = scores[i], found[i]
+            if prev >= 0:
+                row = pp_rows[prev]
+                if row is not None:
+                    s = s + row
+                    any_found = True
+                if third_rows is not None: r = third_rows[prev][i]
+                else: r = third.find(prev * self.num_words + word_ids[i]) if word_ids[i] >= 0 else -1
+                if r >= 0:
+                    b, e = third.indptr[r:r + 2]
+                    if row is None: s = s.copy()
+                    s[third.tags[b:e]] += third_weight * third.values(slice(b, e))
+                    any_found = True
+
+            if any_found:
+                prev = int(s.argmax())
+                output.append((self.tags[prev], float(s[prev])))
+            else:
+                prev = -1
+                output.append(('XX', 0.0))
+
+        return output
+
+    def decode_beam(self, scores: np.ndarray, found: List[bool], third_rows: np.ndarray, third_weight: float,
+                    begin: int, end: int, beam_width: int) -> List[Tuple[str, float]]:
+        """
+        Finds the tag sequence maximizing the sum of the token scores of predict(), keeping the best `beam_width` tags per token.
+        The (beam x tag) transition scores of each token are computed with one vectorized operation;
+        a beam width >= the number of tags + 1 is exact Viterbi decoding and a beam width of 1 is the greedy decoding.
+        :param begin: the index of the first token of the sentence.
+        :param end: the index of the last token of the sentence + 1.
+        :return: the list of (tag, token score) pairs; XX when no table is found for the token given its previous tag.
+        """
+        third, t = self.tables['third'], len(self.tags)
+        xx = t  # the extra state for XX that has no pp or third entry
+        pp = np.vstack((self.pp_matrix * PP_WEIGHT, np.zeros((1, t), dtype=np.float32)))
+        pp_found = np.array(self.pp_found + [False])
+        states, acc, history = np.zeros(1, dtype=np.int64), np.zeros(1), []
+
+        for i in range(begin, end):
+            trans = np.empty((len(states), t + 1))
+            trans[:, :t] = scores[i] + pp[states]
+            trans[:, xx] = -np.inf
+            any_found = pp_found[states] | found[i]
+            rows = np.where(states < xx, third_rows[np.minimum(states, t - 1), i], -1)
+            hit = np.flatnonzero(rows >= 0)
+            which, idx = expand(third.indptr, rows[hit])
+            trans[hit[which], third.tags[idx]] += third_weight * third.values(idx)
+            any_found[hit] = True
+            trans[~any_found] = -np.inf
+            trans[~any_found, xx] = 0.0
+
+            cand = acc[:, None] + trans
+            best_prev = cand.argmax(axis=0)
+            best = cand[best_prev, np.arange(t + 1)]
+            keep = np.flatnonzero(np.isfinite(best))
+            if len(keep) > beam_width: keep = keep[np.argsort(-best[keep], kind='stable')[:beam_width]]
+            history.append((keep, states[best_prev[keep]], trans[best_prev[keep], keep]))
+            states, acc = keep, best[keep]
+
+        output, state = [], states[int(acc.argmax())] if len(acc) else 0
+        for keep, prevs, token_scores in reversed(history):
+            j = int(np.flatnonzero(keep == state)[0])
+            output.append(('XX', 0.0) if state == xx else (self.tags[state], float(token_scores[j])))
+            state = prevs[j]
+
+        return output[::-1]
+
+    def predict_batch(self, sentences: Sequence[Sequence[str]], weights: Optional[Sequence[float]] = None,
+                      beam_width: int = 1) -> List[List[Tuple[str, float]]]:
+        """
+        The same greedy decoding as quiz3.predict() where the static scores of all sentences are computed at once;
+        tags with the same score are resolved to the lowest tag ID.
+        :param sentences: lists of input tokens.
+        :param weights: the weights of the first, second, third, and fourth tables; if None, use the weights of the model.
+        :param beam_width: if > 1, use decode_beam() instead of the greedy decoding.
+        :return: the list of (tag, score) pairs for each sentence.
+        """
+        if weights is None: weights = self.weights
+        lengths = np.array([len(tokens) for tokens in sentences], dtype=np.int64)
+        word_ids = self.encode([token for tokens in sentences for token in tokens])
+        scores, found = self.static_scores(word_ids, lengths, weights)
+        found = found.tolist()
+        if beam_width > 1: third_rows = self.third_rows(word_ids)
+        elif len(sentences) > 1: third_rows = self.third_rows(word_ids).tolist()
+        else: third_rows = None
+        ids = word_ids.tolist() if third_rows is None else None
+        outputs, begin = [], 0
+
+        for n in lengths.tolist():
+            if beam_width > 1:
+                outputs.append(self.decode_beam(scores, found, third_rows, weights[2], begin, begin + n, beam_width))
+            else:
+                outputs.append(self.decode_greedy(scores, found, third_rows, weights[2], begin, begin + n, ids))
+            begin += n
+
+        return outputs
+
+    def predict(self, tokens: Sequence[str], weights: Optional[Sequence[float]] = None, beam_width: int = 1) -> List[Tuple[str, float]]:
+        """
+        :return: the list of (tag, score) pairs; see predict_batch().
+        """
+        return self.predict_batch([tokens], weights, beam_width)[0]
+
+    def evaluate(self, data: Iterable[List[Tuple[str, str]]], weights: Optional[Sequence[float]] = None, batch_size: int = 1000,
+                 beam_width: int = 1) -> float:
+        """
+        :param data: sentences where every sentence is a list of (word, pos) pairs; read lazily, batch_size sentences at a time
+                     (e.g., pos_corpus.iter_sentences()).
+        :return: the accuracy of predict() on the data in percent.
+        """
+        total, correct = 0, 0
+        for batch in chunked(data, batch_size):
+            sentences = [[w for w, _ in sentence] for sentence in batch]
+            for sentence, pred in zip(batch, self.predict_batch(sentences, weights, beam_width)):
+                total += len(sentence)
+                correct += sum(1 for (_, g), (p, _) in zip(sentence, pred) if g == p)
+        return 100.0 * correct / total
+
+
+if __name__ == '__main__':
+    import pickle
+    import tempfile
+    import time
+    from src.pos_training import train_tables, create_dicts
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, tst_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    weights = (1.0, 1.0, 1.0, 1.0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args = create_dicts(trn_data) + weights
+        pkl_path = os.path.join(tmp, 'quiz3.pkl')
+        with open(pkl_path, 'wb') as fout: pickle.dump(args, fout)
+        st = time.perf_counter()
+        with open(pkl_path, 'rb') as fin: args = pickle.load(fin)
+        print('pickle:  {:8.2f} MB, load {:8.2f} ms'.format(os.path.getsize(pkl_path) / 2**20, 1000 * (time.perf_counter() - st)))
+
+        model_path = os.path.join(tmp, 'quiz3.model')
+        CompactModel.from_tables(*train_tables(trn_data), weights=weights).save(model_path)
+        st = time.perf_counter()
+        model = CompactModel.load(model_path)
+        size = sum(os.path.getsize(os.path.join(model_path, f)) for f in os.listdir(model_path))
+        print('compact: {:8.2f} MB, load {:8.2f} ms'.format(size / 2**20, 1000 * (time.perf_counter() - st)))
+
+        st = time.perf_counter()
+        acc = quiz3.evaluate(tst_data, *args)
+        print('quiz3.predict:        {:5.2f}%, {:6.2f} sec'.format(acc, time.perf_counter() - st))
+        st = time.perf_counter()
+        acc = model.evaluate(tst_data)
+        print('CompactModel.predict: {:5.2f}%, {:6.2f} sec'.format(acc, time.perf_counter() - st))
+
+        # greedy vs. beam search vs. Viterbi (beam width > number of tags)
+        tokens = sum(len(sentence) for sentence in tst_data)
+        for beam_width in [1, 2, 4, 8, len(model.tags) + 1]:
+            st = time.perf_counter()
+            acc = model.evaluate(tst_data, beam_width=beam_width)
+            et = time.perf_counter() - st
+            print('beam width {:>2}: {:5.2f}%, {:6.2f} sec, {:6.1f} us/token'.format(beam_width, acc, et, 1e6 * et / tokens))
@@ -0,0 +1,249 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import glob
+import os
+import pickle
+from typing import List, Tuple, Dict, Iterable, Optional, Any
+
+import numpy as np
+
+from src.pos_training import TABLES, Vocab, ContextTable, encode_corpus, shift
+
+# pair contexts are encoded as (a << PAIR_SHIFT) | b so that keys stay valid as the vocabulary grows
+PAIR_SHIFT = 32
+BASE_FILE = 'base.pkl'
+DELTA_FILE = 'delta-{:06d}.pkl'
+
+
+def stable_keys(name: str, w: np.ndarray, t: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    :return: the context key of every token for the table; unlike pos_training.context_keys(), independent of the vocabulary size.
+    """
+    keys = None
+    for vocab, offset in TABLES[name]:
+        ids = shift(w if vocab == 'word' else t, lengths, offset)
+        keys = ids if keys is None else (keys << PAIR_SHIFT) | ids
+    return keys
+
+
+def count_pairs(keys: np.ndarray, t: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: the unique (context key, tag ID) pairs and their counts.
+    """
+    order = np.lexsort((t, keys))  # np.unique(axis=0) sorts the rows as a structured array, which is much slower
+    keys, t = keys[order], t[order]
+    starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (t[1:] != t[:-1])]) if len(keys) else np.zeros(0, dtype=np.int64)
+    return keys[starts], t[starts], np.diff(np.append(starts, len(keys)))
+
+
+def delta_files(path: str) -> List[str]:
+    """
+    :return: the delta files in the directory in the order they were written.
+    """
+    return sorted(glob.glob(os.path.join(path, DELTA_FILE.replace('{:06d}', '[0-9]' * 6))))
+
+
+def delta_numbers(path: str) -> List[int]:
+    return [int(os.path.basename(filename)[6:12]) for filename in delta_files(path)]
+
+
+class OnlineModel:
+    """
+    Keeps the raw counts of every (context, tag) pair so that new sentences can be added without retraining.
+    Only the contexts touched by update() are renormalized, lazily on their next lookup.
+    """
+
+    def __init__(self):
+        self.words = Vocab()
+        self.tags = Vocab()
+        self.counts: Dict[str, Dict[int, Dict[int, int]]] = {name: {} for name in TABLES}
+        self.probs: Dict[str, Dict[int, List[Tuple[str, float]]]] = {name: {} for name in TABLES}
+        self.pending: List[Tuple[List[str], List[str], Dict[str, Tuple[np.ndarray, ...]]]] = []
+        self.num_deltas = 0
+        self.path: Optional[str] = None  # the directory whose base and deltas the counts are in sync with
+        self._saved_words = 1  # DUMMY
+        self._saved_tags = 1
+
+    def update(self, sentences: Iterable[List[Tuple[str, str]]]) -> int:
+        """
+        Adds the counts of the sentences; the cost is proportional to the new data.
+        :param sentences: sentences where every sentence is a list of (word, pos) pairs.
+        :return: the number of added tokens.
+        """
+        w, t, lengths = encode_corpus(sentences, self.words, self.tags)
+        delta = {}
+
+        for name in TABLES:
+            keys, tag_ids, counts = count_pairs(stable_keys(name, w, t, lengths), t)
+            delta[name] = (keys, tag_ids, counts)
+            self._merge(name, keys, tag_ids, counts)
+
+        self.pending.append((self.words.items[self._saved_words:], self.tags.items[self._saved_tags:], delta))
+        self._saved_words, self._saved_tags = len(self.words), len(self.tags)
+        return len(w)
+
+    def _merge(self, name: str, keys: np.ndarray, tag_ids: np.ndarray, counts: np.ndarray):
+        table, probs = self.counts[name], self.probs[name]
+        for key, tag, count in zip(keys.tolist(), tag_ids.tolist(), counts.tolist()):
+            dist = table.get(key)
+            if dist is None: dist = table[key] = {}
+            dist[tag] = dist.get(tag, 0) + count
+            probs.pop(key, None)  # renormalized on the next lookup
+
+    def encode_context(self, name: str, context: Any) -> Optional[int]:
+        """
+        :param context: a string for single contexts or a pair of strings, as the keys of the dictionaries in quiz3.
+        :return: the context key if all of its items are known; otherwise, None.
+        """
+        spec = TABLES[name]
+        items = (context,) if len(spec) == 1 else context
+        key = 0
+        for (vocab, _), item in zip(spec, items):
+            i = (self.words if vocab == 'word' else self.tags).get(item)
+            if i < 0: return None
+            key = (key << PAIR_SHIFT) | i
+        return key
+
+    def lookup(self, name: str, context: Any) -> Optional[List[Tuple[str, float]]]:
+        """
+        :return: the (tag, probability) pairs of the context in descending order as in the dictionaries of quiz3; None if unseen.
+        """
+        key = self.encode_context(name, context)
+        if key is None: return None
+        probs = self.probs[name].get(key)
+        if probs is None:
+            dist = self.counts[name].get(key)
+            if dist is None: return None
+            total = sum(dist.values())
+            probs = [(self.tags.items[tag], count / total) for tag, count in sorted(dist.items(), key=lambda x: (-x[1], x[0]))]
+            self.probs[name][key] = probs
+        return probs
+
+    def to_tables(self) -> Tuple[Vocab, Vocab, Dict[str, ContextTable]]:
+        """
+        :return: the vocabularies and the context tables as returned by pos_training.train_tables(), e.g., for CompactModel.from_tables().
+        """
+        num_words, tables = len(self.words), {}
+
+        for name, spec in TABLES.items():
+            table = self.counts[name]
+            sizes = np.fromiter((len(dist) for dist in table.values()), dtype=np.int64, count=len(table))
+            keys = np.fromiter(table.keys(), dtype=np.int64, count=len(table))
+            tags = np.fromiter((tag for dist in table.values() for tag in dist), dtype=np.int64, count=int(sizes.sum()))
+            counts = np.fromiter((c for dist in table.values() for c in dist.values()), dtype=np.int64, count=len(tags))
+            if len(spec) == 2: keys = (keys >> PAIR_SHIFT) * num_words + (keys & ((1 << PAIR_SHIFT) - 1))
+
+            ctx = np.repeat(keys, sizes)
+            order = np.lexsort((tags, -counts, ctx))  # by context, then by count in descending order, then by tag ID
+            ctx, tags, counts = ctx[order], tags[order], counts[order]
+            ctx_keys, starts = np.unique(ctx, return_index=True)
+            indptr = np.append(starts, len(ctx)).astype(np.int64)
+            totals = np.add.reduceat(counts, starts) if len(starts) else counts
+            probs = counts / np.repeat(totals, np.diff(indptr))
+            tables[name] = ContextTable(ctx_keys, indptr, tags.astype(np.int32), probs, totals)
+
+        return self.words, self.tags, tables
+
+    def save(self, path: str):
+        """
+        Writes the updates since the last save as a delta file; the full counts are written only when the path has no base yet.
+        The word and tag IDs of a delta are only valid on top of the base and the deltas it was built on, so a model can
+        append to a path only if it was loaded from or compacted to that path.
+        :raises ValueError: if the path has a base that this model is not in sync with (use compact() to overwrite it).
+        """
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(os.path.join(path, BASE_FILE)):
+            self.compact(path)
+            return
+        if self.path != os.path.abspath(path):
+            raise ValueError('The model was not loaded from {}; use compact() to overwrite its base'.format(path))
+
+        if not self.pending: return
+        self.num_deltas = max([self.num_deltas] + delta_numbers(path)) + 1
+        filename = os.path.join(path, DELTA_FILE.format(self.num_deltas))
+        if os.path.exists(filename): raise ValueError('Delta file exists: {}'.format(filename))
+        with open(filename + '.tmp', 'wb') as fout:
+            pickle.dump(self.pending, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + '.tmp', filename)
+        self.pending = []
+
+    def compact(self, path: str):
+        """
+        Writes the full counts as the base and removes the delta files.
+        """
+        os.makedirs(path, exist_ok=True)
+        tmp = os.path.join(path, BASE_FILE + '.tmp')
+        with open(tmp, 'wb') as fout:
+            pickle.dump((self.words.items, self.tags.items, self.counts), fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(path, BASE_FILE))
+        for filename in delta_files(path): os.remove(filename)
+        self.pending, self.num_deltas, self.path = [], 0, os.path.abspath(path)
+
+    @classmethod
+    def load(cls, path: str) -> 'OnlineModel':
+        """
+        Loads the base counts and replays the delta files in order.
+        """
+        model = cls()
+        with open(os.path.join(path, BASE_FILE), 'rb') as fin:
+            words, tags, model.counts = pickle.load(fin)
+        for item in words[1:]: model.words.add(item)
+        for item in tags[1:]: model.tags.add(item)
+
+        for filename in delta_files(path):
+            with open(filename, 'rb') as fin:
+                for new_words, new_tags, delta in pickle.load(fin):
+                    for item in new_words: model.words.add(item)
+                    for item in new_tags: model.tags.add(item)
+                    for name, (keys, tag_ids, counts) in delta.items(): model._merge(name, keys, tag_ids, counts)
+            model.num_deltas += 1
+
+        model._saved_words, model._saved_tags = len(model.words), len(model.tags)
+        model.path = os.path.abspath(path)
+        return model
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from src.pos_model import CompactModel
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, tst_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    days = [trn_data[i:i + len(trn_data) // 5] for i in range(0, len(trn_data), len(trn_data) // 5)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'online')
+        model = OnlineModel()
+        for i, day in enumerate(days):
+            st = time.perf_counter()
+            model.update(day)
+            model.save(path)
+            et = time.perf_counter() - st
+            st = time.perf_counter()
+            train_tables([s for d in days[:i + 1] for s in d])
+            print('day {}: update + save {:.3f} sec, retrain {:.3f} sec'.format(i, et, time.perf_counter() - st))
+
+        loaded = OnlineModel.load(path)
+        expected = train_tables(trn_data)[2]
+        actual = loaded.to_tables()[2]
+        same = all(np.array_equal(getattr(expected[n], a), getattr(actual[n], a))
+                   for n in TABLES for a in ['keys', 'indptr', 'tags', 'probs', 'totals'])
+        print('loaded from {} deltas, same tables as retraining: {}'.format(loaded.num_deltas, same))
+        print("lookup('cw', 'the'): {}".format(loaded.lookup('cw', 'the')))
+        print('accuracy: {:5.2f}%'.format(CompactModel.from_tables(*loaded.to_tables()).evaluate(tst_data)))
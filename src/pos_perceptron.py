@@ -0,0 +1,275 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import json
+import os
+import random
+import re
+import zlib
+from typing import List, Tuple, Sequence, Iterable
+
+import numpy as np
+
+from src.parallel import chunked
+from src.pos_training import shift
+from src.quiz.quiz3 import DUMMY
+
+FORMAT_VERSION = 1
+
+# the features that do not depend on the previous tag: a bias, the contexts of pos_training.TABLES, and the affixes and
+# the shape of the current word for unseen words; each feature is a tuple of (attribute, word offset) hashed with its template index
+STATIC_TEMPLATES = [
+    (),
+    (('word', 0),), (('word', -1),), (('word', 1),),
+    (('word', -1), ('word', 0)), (('word', 0), ('word', 1)), (('word', -1), ('word', 1)),
+    (('suffix', 0),), (('prefix', 0),), (('shape', 0),),
+]
+THIRD_TEMPLATE = len(STATIC_TEMPLATES)  # (previous tag, word); the previous tag alone (pp) is a dense matrix
+
+MASK64 = (1 << 64) - 1
+PRIMES = [np.uint64(p) for p in (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)]
+DUMMY_HASH = zlib.crc32(DUMMY.encode('utf-8'))
+RE_SHAPE = [(re.compile(r'[A-Z]+'), 'X'), (re.compile(r'[a-z]+'), 'x'), (re.compile(r'\d+'), 'd')]
+
+
+def word_shape(word: str) -> str:
+    """
+    :return: the word where every run of uppercase letters, lowercase letters, and digits is collapsed (e.g., 'Xx-d').
+    """
+    for regex, repl in RE_SHAPE: word = regex.sub(repl, word)
+    return word
+
+
+# the string of each attribute of a word
+ATTRIBUTES = {
+    'word': lambda w: w,
+    'suffix': lambda w: w[-3:].lower(),
+    'prefix': lambda w: w[:1],
+    'shape': word_shape,
+}
+
+
+def hash_strings(strings: Iterable[str]) -> np.ndarray:
+    """
+    :return: the CRC32 of every string, stable across processes and runs (unlike hash()).
+    """
+    return np.array([zlib.crc32(s.encode('utf-8')) for s in strings], dtype=np.uint64)
+
+
+def hash_words(tokens: Sequence[str]) -> np.ndarray:
+    """
+    :return: the (attribute x token) hashes of every attribute in ATTRIBUTES.
+    """
+    return np.vstack([hash_strings(map(f, tokens)) for f in ATTRIBUTES.values()]) if len(tokens) else \
+        np.zeros((len(ATTRIBUTES), 0), dtype=np.uint64)
+
+
+def mix(template: int, *values: np.ndarray) -> np.ndarray:
+    """
+    :return: the 64-bit hash of the template index and the values, element-wise.
+    """
+    h = np.uint64((template + 1) * 0xD6E8FEB86659FD93 & MASK64)
+    for prime, v in zip(PRIMES, values):
+        h = (h ^ (v * prime)) * PRIMES[0]
+        h ^= h >> np.uint64(29)
+    return h
+
+
+class HashedTagger:
+    """
+    A linear POS tagger over the context features of quiz3 where every feature is hashed into one of `dim` rows
+    of a (dim x tag) weight matrix, trained by the averaged perceptron with greedy left-to-right decoding.
+    The previous-tag features are a dense (previous tag + 1 x tag) matrix whose last row is the beginning of a sentence.
+    """
+
+    def __init__(self, tags: List[str], dim: int = 2 ** 17, weights: np.ndarray = None, transitions: np.ndarray = None):
+        """
+        :param tags: the tag of each tag ID.
+        :param dim: the number of hashed feature rows.
+        :param weights: the (dim x tag) feature weights; if None, zeros.
+        :param transitions: the (previous tag + 1 x tag) weights; if None, zeros.
+        """
+        self.tags = tags
+        self.tag_ids = {t: i for i, t in enumerate(tags)}
+        self.dim = dim
+        t = len(tags)
+        self.weights = np.zeros((dim, t), dtype=np.float32) if weights is None else weights
+        self.transitions = np.zeros((t + 1, t), dtype=np.float32) if transitions is None else transitions
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'weights.npy'), self.weights)
+        np.save(os.path.join(path, 'transitions.npy'), self.transitions)
+        with open(os.path.join(path, 'meta.json'), 'w') as fout:
+            json.dump({'version': FORMAT_VERSION, 'tags': self.tags, 'dim': self.dim}, fout)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'HashedTagger':
+        with open(os.path.join(path, 'meta.json')) as fin:
+            meta = json.load(fin)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported model format: {}'.format(meta['version']))
+        load = lambda filename: np.asarray(np.load(os.path.join(path, filename), mmap_mode='r' if mmap else None))
+        return cls(meta['tags'], meta['dim'], load('weights.npy'), load('transitions.npy'))
+
+    def features(self, word_hashes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        :param word_hashes: the attribute hashes of all tokens in one or more sentences (see hash_words()).
+        :param lengths: the length of every sentence.
+        :return: the (token x static template) rows of the hashed features.
+        """
+        n, dummy = word_hashes.shape[1], np.uint64(DUMMY_HASH)
+        # shift() fills the sentence boundaries with 0; out-of-sentence words are DUMMY for every attribute
+        inside = {o: shift(np.ones(n, dtype=np.int64), lengths, o).astype(bool) for o in (-1, 1)}
+        values = {}
+
+        def value(attr: str, offset: int) -> np.ndarray:
+            if (attr, offset) not in values:
+                h = word_hashes[list(ATTRIBUTES).index(attr)]
+                values[attr, offset] = h if offset == 0 else np.where(inside[offset], shift(h, lengths, offset), dummy)
+            return values[attr, offset]
+
+        feats = np.empty((n, len(STATIC_TEMPLATES)), dtype=np.int64)
+        for j, template in enumerate(STATIC_TEMPLATES):
+            h = mix(j, *[value(a, o) for a, o in template]) if template else mix(j, np.zeros(n, dtype=np.uint64))
+            feats[:, j] = (h % np.uint64(self.dim)).astype(np.int64)
+        return feats
+
+    def third_features(self, word_hashes: np.ndarray) -> np.ndarray:
+        """
+        :return: the (previous tag + 1 x token) rows of the hashed (previous tag, word) features.
+        """
+        prev = np.arange(len(self.tags) + 1, dtype=np.uint64)[:, None]
+        return (mix(THIRD_TEMPLATE, prev, word_hashes[0][None, :]) % np.uint64(self.dim)).astype(np.int64)
+
+    def static_scores(self, feats: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        :return: the (token x tag) sum of the weights of the static features; one gather and sum per template.
+        """
+        scores = weights[feats[:, 0]].copy()
+        for j in range(1, feats.shape[1]): scores += weights[feats[:, j]]
+        return scores
+
+    def fit(self, data: Sequence[List[Tuple[str, str]]], epochs: int = 5, seed: int = 0) -> 'HashedTagger':
+        """
+        Trains the averaged perceptron; the static scores of a sentence are computed once before its updates.
+        :param data: sentences where every sentence is a list of (word, pos) pairs.
+        :param epochs: the number of passes over the data, shuffled every epoch.
+        """
+        t = len(self.tags)
+        lengths = np.array([len(s) for s in data], dtype=np.int64)
+        word_hashes = hash_words([w for s in data for w, _ in s])
+        gold = np.array([self.tag_ids[p] for s in data for _, p in s], dtype=np.int64)
+        feats, third = self.features(word_hashes, lengths), self.third_features(word_hashes)
+        offsets = np.concatenate(([0], np.cumsum(lengths))).tolist()
+
+        W, P = self.weights, self.transitions
+        W_sum, P_sum = np.zeros_like(W, dtype=np.float64), np.zeros_like(P, dtype=np.float64)  # sum of c * update
+        c = 1
+        order = list(range(len(data)))
+        rng = random.Random(seed)
+
+        for _ in range(epochs):
+            rng.shuffle(order)
+            for k in order:
+                b, e = offsets[k], offsets[k + 1]
+                scores = self.static_scores(feats[b:e], W)
+                prev = t
+                for i in range(b, e):
+                    f3 = third[prev, i]
+                    y = int((scores[i - b] + P[prev] + W[f3]).argmax())
+                    g = gold[i]
+                    if y != g:
+                        rows = np.append(feats[i], f3)  # colliding features repeat a row and add up, as in scoring
+                        np.add.at(W, (rows, g), 1)
+                        np.subtract.at(W, (rows, y), 1)
+                        np.add.at(W_sum, (rows, g), c)
+                        np.subtract.at(W_sum, (rows, y), c)
+                        P[prev, g] += 1
+                        P[prev, y] -= 1
+                        P_sum[prev, g] += c
+                        P_sum[prev, y] -= c
+                    prev = y
+                    c += 1
+
+        self.weights = (W - W_sum / c).astype(np.float32)
+        self.transitions = (P - P_sum / c).astype(np.float32)
+        return self
+
+    def predict_batch(self, sentences: Sequence[Sequence[str]]) -> List[List[Tuple[str, float]]]:
+        """
+        :param sentences: lists of input tokens.
+        :return: the list of (tag, score) pairs for each sentence.
+        """
+        lengths = np.array([len(tokens) for tokens in sentences], dtype=np.int64)
+        word_hashes = hash_words([token for tokens in sentences for token in tokens])
+        scores = self.static_scores(self.features(word_hashes, lengths), self.weights)
+        third = self.third_features(word_hashes)
+        W, P, t = self.weights, self.transitions, len(self.tags)
+        outputs, begin = [], 0
+
+        for n in lengths.tolist():
+            output, prev = [], t
+            for i in range(begin, begin + n):
+                s = scores[i] + P[prev] + W[third[prev, i]]
+                prev = int(s.argmax())
+                output.append((self.tags[prev], float(s[prev])))
+            outputs.append(output)
+            begin += n
+
+        return outputs
+
+    def predict(self, tokens: Sequence[str]) -> List[Tuple[str, float]]:
+        return self.predict_batch([tokens])[0]
+
+    def evaluate(self, data: Iterable[List[Tuple[str, str]]], batch_size: int = 1000) -> float:
+        """
+        :return: the accuracy of predict() on the data in percent.
+        """
+        total, correct = 0, 0
+        for batch in chunked(data, batch_size):
+            for sentence, pred in zip(batch, self.predict_batch([[w for w, _ in s] for s in batch])):
+                total += len(sentence)
+                correct += sum(1 for (_, g), (p, _) in zip(sentence, pred) if g == p)
+        return 100.0 * correct / total
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from src.pos_model import CompactModel
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, tst_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    tags = sorted({pos for sentence in trn_data for _, pos in sentence})
+
+    st = time.perf_counter()
+    model = CompactModel.from_tables(*train_tables(trn_data))
+    print('CompactModel: train {:6.2f} sec, {:5.2f}%'.format(time.perf_counter() - st, model.evaluate(tst_data)))
+
+    for dim in [2 ** 14, 2 ** 17]:
+        st = time.perf_counter()
+        tagger = HashedTagger(tags, dim).fit(trn_data)
+        et = time.perf_counter() - st
+        st = time.perf_counter()
+        acc = tagger.evaluate(tst_data)
+        print('HashedTagger (dim {:>6}, {:6.1f} MB): train {:6.2f} sec, {:5.2f}%, predict {:.2f} sec'.format(
+            dim, tagger.weights.nbytes / 2 ** 20, et, acc, time.perf_counter() - st))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tagger.save(tmp)
+        print('reloaded: {:5.2f}%'.format(HashedTagger.load(tmp).evaluate(tst_data)))
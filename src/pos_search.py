@@ -0,0 +1,188 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+from typing import List, Tuple, Iterable, Iterator, Sequence, Optional, NamedTuple
+
+from src.pos_features import FeatureCache
+from src.pos_model import CompactModel
+
+CACHE: Optional[FeatureCache] = None
+
+
+class Trial(NamedTuple):
+    weights: Tuple[float, ...]
+    sentences: int
+    accuracy: float
+    seconds: float
+
+
+def init_worker(model_path: str, data: List[List[Tuple[str, str]]]):
+    """
+    Loads the memory-mapped model and caches the weight-independent scores of the development set; called once per worker,
+    or once per TrialRunner in the serial mode, so that a model saved again to the same path is never scored from a stale cache.
+    """
+    global CACHE
+    CACHE = FeatureCache(CompactModel.load(model_path), data)
+
+
+def run_trial(trial: Tuple[Tuple[float, ...], int]) -> Trial:
+    """
+    :param trial: the (first, second, third, fourth) weights and the number of sentences of the development set to evaluate.
+    """
+    weights, sentences = trial
+    st = time.perf_counter()
+    accuracy = CACHE.evaluate(weights, sentences)
+    return Trial(tuple(weights), sentences, accuracy, time.perf_counter() - st)
+
+
+def grid_weights(grid: Sequence[float], size: int = 4) -> List[Tuple[float, ...]]:
+    """
+    :return: all combinations of the grid values for the four weights.
+    """
+    return list(itertools.product(grid, repeat=size))
+
+
+def random_weights(n: int, low: float = 0.0, high: float = 2.0, seed: int = 0, size: int = 4) -> List[Tuple[float, ...]]:
+    """
+    :return: n weight combinations drawn uniformly from [low, high].
+    """
+    rand = random.Random(seed)
+    return [tuple(round(rand.uniform(low, high), 3) for _ in range(size)) for _ in range(n)]
+
+
+class TrialRunner:
+    """
+    Evaluates trials in a process pool that lives as long as the runner, so that every worker loads the model and scores
+    the development set once for all trials and all rounds of a search.
+    """
+
+    def __init__(self, model_path: str, data: List[List[Tuple[str, str]]], workers: Optional[int] = None):
+        """
+        :param model_path: the directory of a saved CompactModel; every worker memory-maps it instead of receiving a copy.
+        :param data: the development set; sent to each worker once and scored once per worker by FeatureCache.
+        :param workers: the number of worker processes; if None, use all cores; if <= 1, run in this process.
+        """
+        if workers is None: workers = os.cpu_count() or 1
+        if workers <= 1:
+            self.pool = None
+            init_worker(model_path, data)
+        else:
+            self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(model_path, data))
+
+    def run(self, trials: Iterable[Tuple[Tuple[float, ...], int]]) -> Iterator[Trial]:
+        """
+        :param trials: (weights, number of sentences) pairs.
+        :return: the result of every trial as soon as it finishes.
+        """
+        if self.pool is None: return map(run_trial, trials)
+        return self.pool.imap_unordered(run_trial, trials)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self) -> 'TrialRunner':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_trials(model_path: str,
+               data: List[List[Tuple[str, str]]],
+               trials: Iterable[Tuple[Tuple[float, ...], int]],
+               workers: Optional[int] = None) -> Iterator[Trial]:
+    """
+    Evaluates the trials with a TrialRunner of their own and yields each result as soon as it finishes.
+    :param trials: (weights, number of sentences) pairs.
+    """
+    with TrialRunner(model_path, data, workers) as runner:
+        yield from runner.run(trials)
+
+
+def grid_search(model_path: str,
+                data: List[List[Tuple[str, str]]],
+                candidates: List[Tuple[float, ...]],
+                workers: Optional[int] = None,
+                verbose: bool = True) -> Tuple[Trial, List[Trial]]:
+    """
+    Evaluates every weight combination on the whole development set.
+    :return: the best trial and all trials in the order they finished.
+    """
+    results = []
+    for trial in run_trials(model_path, data, [(weights, len(data)) for weights in candidates], workers):
+        if verbose: print_trial(trial)
+        results.append(trial)
+    return max(results, key=lambda t: t.accuracy), results
+
+
+def successive_halving(model_path: str,
+                       data: List[List[Tuple[str, str]]],
+                       candidates: List[Tuple[float, ...]],
+                       min_sentences: int = 100,
+                       eta: int = 3,
+                       workers: Optional[int] = None,
+                       verbose: bool = True) -> Tuple[Trial, List[Trial]]:
+    """
+    Evaluates all candidates on a small prefix of the development set, keeps the best 1/eta of them,
+    and repeats with eta times more sentences until one candidate is left or the whole set is used.
+    All rounds share one TrialRunner, so the development set is scored once per worker.
+    :return: the best trial on the largest subset and all trials in the order they finished.
+    """
+    sentences, results = min(min_sentences, len(data)), []
+
+    with TrialRunner(model_path, data, workers) as runner:
+        while True:
+            trials = list(runner.run([(weights, sentences) for weights in candidates]))
+            for trial in trials:
+                if verbose: print_trial(trial)
+            results.extend(trials)
+            trials.sort(key=lambda t: t.accuracy, reverse=True)
+            if len(trials) == 1 or sentences == len(data): return trials[0], results
+            candidates = [t.weights for t in trials[:max(1, math.ceil(len(trials) / eta))]]
+            sentences = min(sentences * eta, len(data))
+
+
+def print_trial(trial: Trial):
+    print('{:5.2f}% - first: {:5.3f}, second: {:5.3f}, third: {:5.3f}, fourth: {:5.3f} ({} sentences, {:.2f} sec)'.format(
+        trial.accuracy, *trial.weights, trial.sentences, trial.seconds), flush=True)
+
+
+if __name__ == '__main__':
+    import tempfile
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, dev_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        CompactModel.from_tables(*train_tables(trn_data)).save(tmp)
+
+        st = time.perf_counter()
+        best, _ = grid_search(tmp, dev_data, grid_weights([0.5, 1, 2]))
+        print('grid search: {:5.2f}% in {:.2f} sec'.format(best.accuracy, time.perf_counter() - st))
+
+        st = time.perf_counter()
+        best, _ = successive_halving(tmp, dev_data, random_weights(81), verbose=False)
+        print('successive halving: {:5.2f}% with {} in {:.2f} sec'.format(best.accuracy, best.weights, time.perf_counter() - st))
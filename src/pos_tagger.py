@@ -0,0 +1,202 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import functools
+import multiprocessing
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from typing import List, Tuple, Sequence, Optional, Union, NamedTuple
+
+from src.parallel import chunked
+from src.pos_model import CompactModel
+
+MODEL: Optional[CompactModel] = None
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+def init_worker(model_path: str):
+    """
+    Loads the model once in each worker process; the arrays are memory-mapped so the pages are shared across workers.
+    """
+    global MODEL
+    MODEL = CompactModel.load(model_path)
+
+
+def predict_chunk(model: Optional[CompactModel], weights: Optional[Sequence[float]], beam_width: int,
+                  sentences: List[Tuple[str, ...]]) -> List[List[Tuple[str, float]]]:
+    """
+    :param model: the model to use; if None, use the model loaded by init_worker().
+    """
+    return (model or MODEL).predict_batch(sentences, weights, beam_width)
+
+
+class Tagger:
+    def __init__(self,
+                 model: Union[str, CompactModel],
+                 weights: Optional[Sequence[float]] = None,
+                 beam_width: int = 1,
+                 cache_size: int = 10000,
+                 workers: int = 1,
+                 pool: str = 'process',
+                 batch_size: int = 1000):
+        """
+        A POS tagger that loads the model once and caches the outputs of recently tagged sentences.
+        :param model: the path to a model saved by CompactModel.save() or a loaded model.
+        :param weights: the weights of the first, second, third, and fourth tables; if None, use the weights of the model.
+        :param beam_width: see CompactModel.predict_batch().
+        :param cache_size: the maximum number of sentences in the LRU cache; 0 disables the cache.
+        :param workers: the number of workers tagging the batches in parallel; if <= 1, tag in this process.
+        :param pool: 'process' or 'thread'; a process pool requires the model path.
+        :param batch_size: the number of sentences sent to a worker at a time.
+        """
+        if pool not in ('process', 'thread'): raise ValueError('Unknown pool: {}'.format(pool))
+        self.model_path = model if isinstance(model, str) else None
+        if pool == 'process' and workers > 1 and self.model_path is None:
+            raise ValueError('A process pool requires the model path')
+
+        self.model = CompactModel.load(model) if isinstance(model, str) else model
+        self.weights = weights
+        self.beam_width = beam_width
+        self.workers = workers
+        self.pool_type = pool
+        self.batch_size = batch_size
+        self._pool = None
+
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> 'Tagger':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.cache_size, len(self._cache))
+
+    def cache_clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.pool_type == 'thread':
+                self._pool = ThreadPool(self.workers)
+            else:
+                self._pool = multiprocessing.Pool(self.workers, initializer=init_worker, initargs=(self.model_path,))
+        return self._pool
+
+    def _predict(self, sentences: List[Tuple[str, ...]]) -> List[List[Tuple[str, float]]]:
+        batches = list(chunked(sentences, self.batch_size))
+        if self.workers <= 1 or len(batches) <= 1:
+            func = functools.partial(predict_chunk, self.model, self.weights, self.beam_width)
+            return [output for batch in batches for output in func(batch)]
+
+        # worker processes use their own copy of the model (see init_worker())
+        model = self.model if self.pool_type == 'thread' else None
+        func = functools.partial(predict_chunk, model, self.weights, self.beam_width)
+        return [output for outputs in self._get_pool().map(func, batches) for output in outputs]
+
+    def tag_batch(self, sentences: Sequence[Sequence[str]]) -> List[List[Tuple[str, float]]]:
+        """
+        Tags the sentences where repeated sentences, within the batch or from earlier calls, are tagged only once.
+        :param sentences: lists of input tokens.
+        :return: the list of (tag, score) pairs for each sentence.
+        """
+        keys = [tuple(tokens) for tokens in sentences]
+        outputs: List[Optional[Tuple[Tuple[str, float], ...]]] = [None] * len(keys)
+        missing = OrderedDict()  # key -> indices of the sentences
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                output = self._cache.get(key)
+                if output is not None:
+                    self._cache.move_to_end(key)
+                    outputs[i] = output
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            predictions = self._predict(list(missing))
+            with self._lock:
+                for (key, indices), prediction in zip(missing.items(), predictions):
+                    output = tuple(prediction)
+                    for i in indices: outputs[i] = output
+                    if self.cache_size > 0:
+                        self._cache[key] = output
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [list(output) for output in outputs]
+
+    def tag(self, tokens: Sequence[str]) -> List[Tuple[str, float]]:
+        """
+        :return: the list of (tag, score) pairs; see tag_batch().
+        """
+        return self.tag_batch([tokens])[0]
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import tempfile
+    import time
+    from src.pos_training import train_tables
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+    trn_data, tst_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+    sentences = [[w for w, _ in sentence] for sentence in tst_data]
+
+    # traffic where half of the requests repeat a small set of boilerplate sentences
+    random.seed(0)
+    boilerplate = sentences[:50]
+    traffic = [random.choice(boilerplate) if random.random() < 0.5 else random.choice(sentences) for _ in range(20000)]
+    tokens = sum(len(tokens) for tokens in traffic)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'quiz3.model')
+        CompactModel.from_tables(*train_tables(trn_data), weights=(1.0, 1.0, 1.0, 1.0)).save(model_path)
+
+        for cache_size, workers in [(0, 1), (10000, 1), (10000, 2)]:
+            with Tagger(model_path, cache_size=cache_size, workers=workers) as tagger:
+                st = time.perf_counter()
+                outputs = [o for batch in chunked(traffic, 1000) for o in tagger.tag_batch(batch)]
+                et = time.perf_counter() - st
+                print('cache {:>5}, workers {}: {:8.0f} tokens/sec, {}'.format(cache_size, workers, tokens / et, tagger.cache_info()))
+
+        with Tagger(model_path) as tagger:
+            print(tagger.tag(['I', 'like', 'this', 'course', '.']))
@@ -0,0 +1,280 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+from array import array
+from typing import List, Tuple, Dict, Iterable, Optional, Any
+
+import numpy as np
+
+from src.pos_corpus import iter_sentences
+from src.quiz.quiz3 import DUMMY
+
+# the context of every table in the order of the arguments of quiz3.predict(); each context is a tuple of (vocab, position)
+TABLES = {
+    'cw': (('word', 0),),
+    'pp': (('tag', -1),),
+    'pw': (('word', -1),),
+    'nw': (('word', 1),),
+    'first': (('word', -1), ('word', 0)),
+    'second': (('word', 0), ('word', 1)),
+    'third': (('tag', -1), ('word', 0)),
+    'fourth': (('word', -1), ('word', 1)),
+}
+
+
+class Vocab:
+    """
+    Interns strings to consecutive integer IDs; DUMMY is always 0.
+    """
+
+    def __init__(self, items: Iterable[str] = ()):
+        self.index: Dict[str, int] = {DUMMY: 0}
+        self.items: List[str] = [DUMMY]
+        for item in items: self.add(item)
+
+    def add(self, item: str) -> int:
+        i = self.index.get(item)
+        if i is None:
+            i = self.index[item] = len(self.items)
+            self.items.append(item)
+        return i
+
+    def get(self, item: str, default: int = -1) -> int:
+        return self.index.get(item, default)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i: int) -> str:
+        return self.items[i]
+
+
+class ContextTable:
+    """
+    Tag distributions of all contexts in the CSR format: the context keys[i] has the tags tags[indptr[i]:indptr[i+1]]
+    with the probabilities probs[indptr[i]:indptr[i+1]] in descending order, observed totals[i] times.
+    Keys are sorted so that a context can be found by binary search.
+    Compressed tables (see pos_compression) may store quantized probabilities, whose real values are probs * scale,
+    and `buckets` extra rows after the keyed rows that merge the contexts hashed by hash_keys().
+    """
+
+    def __init__(self, keys: np.ndarray, indptr: np.ndarray, tags: np.ndarray, probs: np.ndarray, totals: np.ndarray,
+                 scale: Optional[float] = None, buckets: int = 0):
+        self.keys = keys
+        self.indptr = indptr
+        self.tags = tags
+        self.probs = probs
+        self.totals = totals
+        self.scale = scale
+        self.buckets = buckets
+
+    def __len__(self):
+        return len(self.keys)
+
+    def values(self, idx: Any) -> np.ndarray:
+        """
+        :param idx: indices or a slice of the entry arrays.
+        :return: the probabilities of the entries as floats.
+        """
+        probs = self.probs[idx]
+        return probs if self.scale is None else probs * np.float32(self.scale)
+
+    def find(self, key: int) -> int:
+        """
+        :return: the index of the context key if exists, the index of its hash bucket if not empty; otherwise, -1.
+        """
+        i = int(self.keys.searchsorted(key))
+        if i < len(self.keys) and self.keys[i] == key: return i
+        if self.buckets and key >= 0:
+            i = len(self.keys) + int(hash_keys(np.array([key]), self.buckets)[0])
+            if self.indptr[i + 1] > self.indptr[i]: return i
+        return -1
+
+    def lookup(self, key: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        :return: the (tag IDs, probabilities) of the context key if exists; otherwise, None.
+        """
+        i = self.find(key)
+        if i < 0: return None
+        s, e = self.indptr[i], self.indptr[i + 1]
+        return self.tags[s:e], self.values(slice(s, e))
+
+
+def hash_keys(keys: np.ndarray, buckets: int) -> np.ndarray:
+    """
+    :param keys: non-negative context keys.
+    :return: the bucket of every key by multiplicative (Fibonacci) hashing, stable across processes and runs.
+    """
+    h = keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return ((h >> np.uint64(32)) % np.uint64(buckets)).astype(np.int64)
+
+
+def encode_corpus(data: Iterable[List[Tuple[str, str]]], words: Vocab, tags: Vocab) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Interns every word and tag in a single pass over the data.
+    :param data: sentences where every sentence is a list of (word, pos) pairs.
+    :param words: the vocabulary of words, extended in place.
+    :param tags: the vocabulary of tags, extended in place.
+    :return: the word IDs and the tag IDs of all tokens in the data, and the length of every sentence.
+    """
+    w, t, lengths = array('q'), array('q'), array('q')
+    add_word, add_tag = words.add, tags.add
+
+    for sentence in data:
+        lengths.append(len(sentence))
+        for word, pos in sentence:
+            w.append(add_word(word))
+            t.append(add_tag(pos))
+
+    return np.frombuffer(w, dtype=np.int64), np.frombuffer(t, dtype=np.int64), np.frombuffer(lengths, dtype=np.int64)
+
+
+def shift(ids: np.ndarray, lengths: np.ndarray, offset: int) -> np.ndarray:
+    """
+    :param ids: IDs of all tokens in the corpus.
+    :param lengths: the length of every sentence.
+    :param offset: -1 for the previous token, 1 for the next token.
+    :return: IDs of the tokens at the offset within the same sentence where DUMMY (0) is used across sentence boundaries.
+    """
+    if offset == 0: return ids
+    out = np.zeros_like(ids)  # slicing rather than np.roll(), whose overhead dominates for a single sentence
+    if offset < 0: out[-offset:] = ids[:offset]
+    else: out[:-offset] = ids[offset:]
+    ends = lengths.cumsum()
+    starts = ends - lengths
+    nonempty = lengths > 0
+    out[starts[nonempty] if offset < 0 else ends[nonempty] - 1] = 0
+    return out
+
+
+def context_keys(name: str, w: np.ndarray, t: np.ndarray, lengths: np.ndarray, num_words: int) -> np.ndarray:
+    """
+    :return: the integer context key of every token for the table; pairs (a, b) are encoded as a * num_words + b.
+    """
+    keys = None
+    for vocab, offset in TABLES[name]:
+        ids = shift(w if vocab == 'word' else t, lengths, offset)
+        keys = ids if keys is None else keys * num_words + ids
+    return keys
+
+
+def count_table(keys: np.ndarray, t: np.ndarray, num_tags: int) -> ContextTable:
+    """
+    Counts every (context, tag) pair in one vectorized pass and normalizes the counts per context.
+    """
+    uniq, counts = np.unique(keys * num_tags + t, return_counts=True)
+    ctx, tag = np.divmod(uniq, num_tags)
+    order = np.lexsort((-counts, ctx))  # by context, then by count in descending order
+    ctx, tag, counts = ctx[order], tag[order], counts[order]
+
+    ctx_keys, starts = np.unique(ctx, return_index=True)
+    indptr = np.append(starts, len(ctx)).astype(np.int64)
+    totals = np.add.reduceat(counts, starts) if len(starts) else counts
+    probs = counts / np.repeat(totals, np.diff(indptr))
+    return ContextTable(ctx_keys, indptr, tag.astype(np.int32), probs, totals)
+
+
+def train_tables(data: Iterable[List[Tuple[str, str]]],
+                 words: Optional[Vocab] = None,
+                 tags: Optional[Vocab] = None) -> Tuple[Vocab, Vocab, Dict[str, ContextTable]]:
+    """
+    :param data: sentences where every sentence is a list of (word, pos) pairs.
+    :param words: the vocabulary of words to extend; if None, a new vocabulary is created.
+    :param tags: the vocabulary of tags to extend; if None, a new vocabulary is created.
+    :return: the vocabularies of words and tags, and the context tables of TABLES.
+    """
+    if words is None: words = Vocab()
+    if tags is None: tags = Vocab()
+    w, t, lengths = encode_corpus(data, words, tags)
+    tables = {name: count_table(context_keys(name, w, t, lengths, len(words)), t, len(tags)) for name in TABLES}
+    return words, tags, tables
+
+
+def train_file(filename: str, use_mmap: bool = False) -> Tuple[Vocab, Vocab, Dict[str, ContextTable]]:
+    """
+    Trains the context tables while streaming the corpus file, so only the integer IDs of the tokens are kept in memory.
+    :param filename: the path to a tab-separated corpus (see pos_corpus.iter_sentences()).
+    :param use_mmap: if True, read the file through a memory map.
+    """
+    return train_tables(iter_sentences(filename, use_mmap))
+
+
+def decode_keys(name: str, keys: np.ndarray, words: Vocab, tags: Vocab) -> List[Any]:
+    """
+    :return: the context keys of the table as used by the dictionaries of quiz3 (strings or pairs of strings).
+    """
+    context = TABLES[name]
+    vocabs = [(words if vocab == 'word' else tags).items for vocab, _ in context]
+    if len(context) == 1: return [vocabs[0][i] for i in keys.tolist()]
+    a, b = np.divmod(keys, len(words))
+    return list(zip([vocabs[0][i] for i in a.tolist()], [vocabs[1][i] for i in b.tolist()]))
+
+
+def to_dict(name: str, table: ContextTable, words: Vocab, tags: Vocab) -> Dict[Any, List[Tuple[str, float]]]:
+    """
+    :return: the table as the dictionary returned by the corresponding create_*_dict() in quiz3.
+    """
+    pairs = list(zip([tags.items[i] for i in table.tags.tolist()], table.probs.tolist()))
+    indptr = table.indptr.tolist()
+    return {key: pairs[indptr[i]:indptr[i + 1]] for i, key in enumerate(decode_keys(name, table.keys, words, tags))}
+
+
+def create_dicts(data: Iterable[List[Tuple[str, str]]]) -> Tuple[Dict[Any, List[Tuple[str, float]]], ...]:
+    """
+    :param data: sentences where every sentence is a list of (word, pos) pairs.
+    :return: the eight dictionaries of quiz3.train() (cw, pp, pw, nw, first, second, third, fourth) with the same probabilities;
+             tags with the same count within a context are ordered by their first occurrence in the data.
+    """
+    words, tags, tables = train_tables(data)
+    return tuple(to_dict(name, tables[name], words, tags) for name in TABLES)
+
+
+if __name__ == '__main__':
+    import time
+    from src.quiz import quiz3
+
+    data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+
+    st = time.perf_counter()
+    expected = (quiz3.create_cw_dict(data), quiz3.create_pp_dict(data), quiz3.create_pw_dict(data), quiz3.create_nw_dict(data),
+                quiz3.create_first_pos_dict(data), quiz3.create_second_pos_dict(data), quiz3.create_third_pos_dict(data),
+                quiz3.create_fourth_pos_dict(data))
+    print('quiz3.create_*: {:.3f} sec'.format(time.perf_counter() - st))
+
+    st = time.perf_counter()
+    words, tags, tables = train_tables(data)
+    print('train_tables:   {:.3f} sec'.format(time.perf_counter() - st))
+
+    st = time.perf_counter()
+    actual = create_dicts(data)
+    print('create_dicts:   {:.3f} sec'.format(time.perf_counter() - st))
+
+    for name, e, a in zip(TABLES, expected, actual):
+        same = e.keys() == a.keys() and all(
+            len(e[k]) == len(a[k]) and all(abs(p - dict(a[k])[t]) < 1e-12 for t, p in e[k]) for k in e)
+        print('{:<7} {:>7} contexts, same probabilities: {}'.format(name, len(a), same))
+
+    # streaming the file keeps only the token IDs in memory, not the sentences
+    import tracemalloc
+    tracemalloc.start()
+    st = time.perf_counter()
+    words_f, tags_f, tables_f = train_file('dat/pos/wsj-pos.dev.gold.tsv', use_mmap=True)
+    et = time.perf_counter() - st
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    same = words_f.items == words.items and tags_f.items == tags.items and \
+        all(np.array_equal(tables[name].keys, tables_f[name].keys) and np.array_equal(tables[name].probs, tables_f[name].probs)
+            for name in TABLES)
+    print('train_file:     {:.3f} sec, peak {:.1f} MB, same tables: {}'.format(et, peak / 2**20, same))
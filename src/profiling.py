@@ -0,0 +1,238 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Any, Callable, Optional
+
+
+def env_flag(name: str) -> bool:
+    return os.environ.get(name, '') not in {'', '0'}
+
+
+# set the following environment variables before the instrumented modules are imported:
+#   CS329_PROFILE=1              record the wall time, calls, and tokens of every stage
+#   CS329_PROFILE_MEMORY=1       also record the peak memory of every stage with tracemalloc (slow)
+#   CS329_PROFILE_JSON=path      write the report as JSON at exit (implies CS329_PROFILE=1)
+#   CS329_PROFILE_CPROFILE=path  dump the cProfile statistics of the whole run at exit (see pstats)
+# when disabled, profiled() returns the function itself and stage() a shared no-op context, so there is no overhead
+REPORT_PATH = os.environ.get('CS329_PROFILE_JSON')
+CPROFILE_PATH = os.environ.get('CS329_PROFILE_CPROFILE')
+TRACE_MEMORY = env_flag('CS329_PROFILE_MEMORY')
+ENABLED = env_flag('CS329_PROFILE') or TRACE_MEMORY or bool(REPORT_PATH)
+
+
+class StageStats:
+    __slots__ = ('calls', 'seconds', 'tokens', 'peak_bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.tokens = 0
+        self.peak_bytes = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {'calls': self.calls, 'seconds': self.seconds, 'tokens': self.tokens,
+             'tokens_per_sec': self.tokens / self.seconds if self.tokens and self.seconds > 0 else None}
+        if tracemalloc.is_tracing(): d['peak_bytes'] = self.peak_bytes
+        return d
+
+
+class Stage:
+    """
+    A running stage; nested stages are timed inclusively, and the peak memory of a stage includes its nested stages.
+    """
+    __slots__ = ('profiler', 'name', 'tokens', 'st', 'mem_start', 'mem_peak')
+
+    def __init__(self, profiler: 'Profiler', name: str, tokens: int = 0):
+        self.profiler = profiler
+        self.name = name
+        self.tokens = tokens
+
+    def add(self, tokens: int):
+        """
+        Adds the number of tokens processed, e.g., when only known at the end of the stage.
+        """
+        self.tokens += tokens
+
+    def __enter__(self) -> 'Stage':
+        if tracemalloc.is_tracing():
+            stack = self.profiler.stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack: stack[-1].mem_peak = max(stack[-1].mem_peak, peak)  # the peak before this stage resets it
+            tracemalloc.reset_peak()
+            self.mem_start, self.mem_peak = current, current
+            stack.append(self)
+        self.st = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self.st
+        peak_bytes = 0
+        if tracemalloc.is_tracing():
+            stack = self.profiler.stack()
+            stack.pop()
+            peak = max(self.mem_peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = peak - self.mem_start
+            if stack: stack[-1].mem_peak = max(stack[-1].mem_peak, peak)
+        self.profiler.record(self.name, seconds, self.tokens, peak_bytes)
+
+
+class NullStage:
+    __slots__ = ()
+
+    def add(self, tokens: int):
+        pass
+
+    def __enter__(self) -> 'NullStage':
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Profiler:
+    def __init__(self, trace_memory: bool = False):
+        """
+        :param trace_memory: if True, start tracemalloc to record the peak memory of every stage.
+        """
+        self.stats: Dict[str, StageStats] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing(): tracemalloc.start()
+
+    def stack(self) -> List[Stage]:
+        if not hasattr(self.local, 'stack'): self.local.stack = []
+        return self.local.stack
+
+    def record(self, name: str, seconds: float, tokens: int = 0, peak_bytes: int = 0):
+        with self.lock:
+            s = self.stats.get(name)
+            if s is None: s = self.stats[name] = StageStats()
+            s.calls += 1
+            s.seconds += seconds
+            s.tokens += tokens
+            s.peak_bytes = max(s.peak_bytes, peak_bytes)
+
+    def stage(self, name: str, tokens: int = 0) -> Stage:
+        return Stage(self, name, tokens)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.started = time.perf_counter()
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'pid': os.getpid(), 'seconds': time.perf_counter() - self.started,
+                    'stages': {name: s.to_dict() for name, s in self.stats.items()}}
+
+    def write(self, path: str):
+        with open(path, 'w') as fout:
+            json.dump(self.report(), fout, indent=2)
+
+    def format(self) -> str:
+        trace = tracemalloc.is_tracing()
+        lines = ['{:<32} {:>8} {:>10} {:>10} {:>12}'.format('Stage', 'Calls', 'Seconds', 'Tokens', 'Tokens/sec') +
+                 (' {:>10}'.format('Peak MB') if trace else '')]
+        for name, s in sorted(self.report()['stages'].items(), key=lambda x: -x[1]['seconds']):
+            line = '{:<32} {:>8} {:>10.3f} {:>10} {:>12}'.format(
+                name, s['calls'], s['seconds'], s['tokens'], '{:.0f}'.format(s['tokens_per_sec']) if s['tokens_per_sec'] else '-')
+            if trace: line += ' {:>10.2f}'.format(s['peak_bytes'] / 2 ** 20)
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+PROFILER = Profiler(TRACE_MEMORY) if ENABLED else None
+
+
+def stage(name: str, tokens: int = 0):
+    """
+    :return: a context manager recording the stage if profiling is enabled; the returned stage accepts add(tokens).
+    """
+    return PROFILER.stage(name, tokens) if PROFILER is not None else NULL_STAGE
+
+
+def profiled(name: Optional[str] = None, tokens: Optional[Callable[..., int]] = None) -> Callable:
+    """
+    Records every call of the decorated function as a stage.
+    :param name: the name of the stage; if None, the qualified name of the function.
+    :param tokens: if not None, called as tokens(result, *args, **kwargs) to count the tokens processed by the call.
+    """
+    def decorator(func: Callable) -> Callable:
+        if PROFILER is None: return func
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.stage(stage_name) as s:
+                result = func(*args, **kwargs)
+                if tokens is not None: s.add(tokens(result, *args, **kwargs))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def num_tokens(data: List[List[Any]]) -> int:
+    """
+    :return: the number of tokens in the sentences.
+    """
+    return sum(len(sentence) for sentence in data)
+
+
+def dump_profile(profile: cProfile.Profile, path: str):
+    profile.disable()
+    profile.dump_stats(path)
+
+
+# installed once by the imported module (not again by `python -m src.profiling`, which runs a second copy as __main__)
+if __name__ != '__main__':
+    if ENABLED and REPORT_PATH: atexit.register(PROFILER.write, REPORT_PATH)
+    if CPROFILE_PATH:
+        PROFILE = cProfile.Profile()
+        PROFILE.enable()
+        atexit.register(dump_profile, PROFILE, CPROFILE_PATH)
+
+
+if __name__ == '__main__':
+    # e.g., CS329_PROFILE=1 CS329_PROFILE_MEMORY=1 python -m src.profiling
+    import pickle
+    from src.profiling import PROFILER, stage, num_tokens  # the instance used by the instrumented modules
+    from src.quiz import quiz3
+
+    if PROFILER is None:
+        print('Set CS329_PROFILE=1 to enable profiling.')
+    else:
+        data = quiz3.read_data('dat/pos/wsj-pos.dev.gold.tsv')
+        trn_data, dev_data = data[:len(data) * 4 // 5], data[len(data) * 4 // 5:]
+        args = (quiz3.create_cw_dict(trn_data), quiz3.create_pp_dict(trn_data), quiz3.create_pw_dict(trn_data),
+                quiz3.create_nw_dict(trn_data), quiz3.create_first_pos_dict(trn_data), quiz3.create_second_pos_dict(trn_data),
+                quiz3.create_third_pos_dict(trn_data), quiz3.create_fourth_pos_dict(trn_data), 1.0, 1.0, 1.0, 1.0)
+        with stage('pickle.dumps'): s = pickle.dumps(args)
+        with stage('pickle.loads'): args = pickle.loads(s)
+        quiz3.evaluate(dev_data, *args)
+        print(PROFILER.format())
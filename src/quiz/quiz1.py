@@ -13,160 +13,110 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
-import re
-
-
-def normalize(text):
-    dictionary = {
-        'one': '1',
-        'two': '2',
-        'three': '3',
-        'four': '4',
-        'five': '5',
-        'six': '6',
-        'seven': '7',
-        'eight': '8',
-        'nine': '9',
-        'ten': '10',
-        'eleven': '11',
-        'twelve': '12',
-        'thir': '3',
-        'for': '4',
-        'fif': '5',
-        'twen': '2'
-    }
-    for key in dictionary:
-        RE = re.compile(key)
-        hundres = RE.search((text.lower()))
-        while (hundres is not None):
-            ms = RE.search(text.lower())
-            endTy = text[ms.end() + 2:]
-            endY = text[ms.end() + 1:]
-            endTeen = text[ms.end() + 4:]
-            endEen = text[ms.end() + 3:]
-            text = text[: ms.start()] + dictionary[key] + text[ms.end():]
-            if text[ms.start() + len(dictionary[key]):ms.start() + len(dictionary[key]) + 2] == 'ty':
-                middleNum = 10 * int(dictionary[key])
-                text = text[: ms.start()] + str(middleNum) + endTy
-            elif text[ms.start() + len(dictionary[key]):ms.start() + len(dictionary[key]) + 1] == 'y':
-                middleNum = 10 * int(dictionary[key])
-                text = text[: ms.start()] + str(middleNum) + endY
-            elif text[ms.start() + len(dictionary[key]):ms.start() + len(dictionary[key]) + 4] == 'teen':
-                text = text[: ms.start()] + str(10 + int(dictionary[key])) + endTeen
-            elif text[ms.start() + len(dictionary[key]):ms.start() + len(dictionary[key]) + 3] == 'een':
-                text = text[: ms.start()] + str(10 + int(dictionary[key])) + endEen
-            hundres = RE.search(text)
-
-    RE = re.compile(r'(\d\d[\s-]\d)+')
-    spaceOrDash = RE.search(text)
-    while spaceOrDash is not None:
-        plus = int(text[spaceOrDash.start(): spaceOrDash.start() + 2])
-        plus = plus + int(text[spaceOrDash.end() - 1: spaceOrDash.end()])
-        text = text[:spaceOrDash.start()] + str(plus) + text[spaceOrDash.end():]
-        spaceOrDash = RE.search(text)
-
-    RE = re.compile(r'(hundred)')
-    hundres = RE.search(text)
-    while hundres is not None:
-        ms = RE.search(text)
-        text = text[: ms.start()] + '100' + text[ms.end():]
-        if text[ms.start() - 2: ms.start()] == ('a ' or 'A '):
-            text = text[: ms.start() - 2] + text[ms.start():]
-        RE_1 = re.compile(r'(\d[\s]100)|(\d\d[\s]100)')
-        spaceOrDash = RE_1.search(text)
-        if spaceOrDash is not None:
-            plus = int(text[spaceOrDash.start(): spaceOrDash.end() - 4])
-            plus = plus * 100
-            text = text[:spaceOrDash.start()] + str(plus) + text[spaceOrDash.end():]
-        hundres = RE.search((text))
-
-
-    RE = re.compile(r'(thousand)')
-    hundres = RE.search(text)
-    while hundres is not None:
-        ms = RE.search(text)
-        text = text[: ms.start()] + '1000' + text[ms.end():]
-        if text[ms.start() - 2: ms.start()] == ('a ' or 'A '):
-            text = text[: ms.start() - 2] + text[ms.start():]
-        RE_1 = re.compile(r'(\d[\s]1000)|(\d\d[\s]1000)')
-        spaceOrDash = RE_1.search(text)
-        if spaceOrDash is not None:
-            plus = int(text[spaceOrDash.start(): spaceOrDash.end() - 5])
-            plus = plus * 1000
-            text = text[:spaceOrDash.start()] + str(plus) + text[spaceOrDash.end():]
-        hundres = RE.search(text)
-
-    RE = re.compile(r'(million)')
-    hundres = RE.search(text)
-    while hundres is not None:
-        ms = RE.search(text)
-        text = text[: ms.start()] + '1000000' + text[ms.end():]
-        if text[ms.start() - 2: ms.start()] == ('a ' or 'A '):
-            text = text[: ms.start() - 2] + text[ms.start():]
-        RE_1 = re.compile(r'(\d[\s]1000000)|(\d\d[\s]1000000)')
-        spaceOrDash = RE_1.search(text)
-        if spaceOrDash is not None:
-            plus = int(text[spaceOrDash.start(): spaceOrDash.end() - 8])
-            plus = plus * 1000000
-            text = text[:spaceOrDash.start()] + str(plus) + text[spaceOrDash.end():]
-        hundres = RE.search(text)
-
-    RE = re.compile(r'(billion)')
-    hundres = RE.search(text)
-    while hundres is not None:
-        ms = RE.search(text)
-        text = text[: ms.start()] + '1000000000' + text[ms.end():]
-        if text[ms.start() - 2: ms.start()] == ('a ' or 'A '):
-            text = text[: ms.start() - 2] + text[ms.start():]
-        RE_1 = re.compile(r'(\d[\s]1000000000)|(\d\d[\s]1000000000)')
-        spaceOrDash = RE_1.search(text)
-        if spaceOrDash is not None:
-            plus = int(text[spaceOrDash.start(): spaceOrDash.end() - 11])
-            plus = plus * 1000000000
-            text = text[:spaceOrDash.start()] + str(plus) + text[spaceOrDash.end():]
-        hundres = RE.search(text)
-
-    RE = re.compile(r'(trillion)')
-    hundres = RE.search(text)
-    while hundres is not None:
-        ms = RE.search(text)
-        text = text[: ms.start()] + '1000000000000' + text[ms.end():]
-        if text[ms.start() - 2: ms.start()] == ('a ' or 'A '):
-            text = text[: ms.start() - 2] + text[ms.start():]
-        RE_1 = re.compile(r'(\d[\s]1000000000000)|(\d\d[\s]1000000000000)')
-        spaceOrDash = RE_1.search(text)
-        if spaceOrDash is not None:
-            plus = int(text[spaceOrDash.start(): spaceOrDash.end() - 13])
-            plus = plus * 1000000000000
-            text = text[:spaceOrDash.start()] + str(plus) + text[spaceOrDash.end():]
-        hundres = RE.search(text)
-
-
-    RE = re.compile(r'\d+(?:\s+\d+)')
-    firstTwo = RE.search(text)
-    while firstTwo is not None:
-        space = re.compile(r'\s').search(text[firstTwo.start():firstTwo.end()])
-        first = int(text[firstTwo.start():(firstTwo.start() + space.start())])
-        second = int(text[(firstTwo.start() + space.end()):firstTwo.end()])
-        plus = first + second
-        text = text[:firstTwo.start()] + str(plus) + text[firstTwo.end():]
-        firstTwo = RE.search(text)
-
-    RE = re.compile(r'\d+(?:\sand\s\d+)')
-    firstTwo = RE.search(text)
-
-    while firstTwo is not None:
-        space = re.compile(r'and').search(text[firstTwo.start():firstTwo.end()])
-        first = int(text[firstTwo.start():(firstTwo.start() + space.start() - 1)])
-        second = int(text[(firstTwo.start() + space.end() + 1):firstTwo.end()])
-        plus = first + second
-        text = text[:firstTwo.start()] + str(plus) + text[firstTwo.end():]
-        firstTwo = RE.search(text)
-    print(text)
-    return text
-
-
-
+from typing import Iterable, List, Optional, Tuple
+
+from src.parallel import imap_chunks
+from src.patterns import RE_NUMBER_WORD, RE_NUMBER_GAP
+
+UNITS = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine']
+TEENS = ['ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen', 'sixteen', 'seventeen', 'eighteen', 'nineteen']
+TENS = ['twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety']
+SCALES = ['thousand', 'million', 'billion', 'trillion']
+
+# word -> (kind, value)
+NUMBER_WORDS = dict()
+NUMBER_WORDS.update((w, ('unit', i)) for i, w in enumerate(UNITS))
+NUMBER_WORDS.update((w, ('teen', i + 10)) for i, w in enumerate(TEENS))
+NUMBER_WORDS.update((w, ('tens', (i + 2) * 10)) for i, w in enumerate(TENS))
+NUMBER_WORDS.update((w, ('scale', 1000 ** (i + 1))) for i, w in enumerate(SCALES))
+NUMBER_WORDS['hundred'] = ('hundred', 100)
+NUMBER_WORDS['a'] = ('a', 1)  # only as in "a hundred", "a thousand"
+NUMBER_WORDS['and'] = ('and', 0)  # only as in "one hundred and five"
+
+# (total, current, kind of the last word, last scale)
+START = (0, 0, None, 0)
+
+
+def accept(state: Tuple[int, int, Optional[str], int], kind: str, value: int) -> Optional[Tuple[int, int, str, int]]:
+    """
+    One transition of the number-phrase grammar.
+    :param state: (total, current, kind of the last word, last scale) of the phrase so far.
+    :param kind: the kind of the next word (unit, teen, tens, hundred, scale, a, and).
+    :param value: the value of the next word.
+    :return: the next state if the word continues the phrase; otherwise, None.
+    """
+    total, current, last, scale = state
+
+    if kind == 'unit':
+        if last is None or last in {'tens', 'hundred', 'scale', 'and'}: return total, current + value, kind, scale
+    elif kind == 'teen' or kind == 'tens':
+        if last is None or last in {'hundred', 'scale', 'and'}: return total, current + value, kind, scale
+        if last in {'teen', 'tens'} and total == 0 and current < 100: return total, current * 100 + value, kind, scale  # nineteen ninety
+    elif kind == 'hundred':
+        if last in {'unit', 'teen', 'tens', 'a'} and current < 100: return total, current * 100, kind, scale
+    elif kind == 'scale':
+        if last in {'unit', 'teen', 'tens', 'hundred', 'a'} and (not scale or value < scale): return total + current * value, 0, kind, value
+    elif kind == 'a':
+        if last is None: return total, value, kind, scale
+    elif kind == 'and':
+        if last in {'hundred', 'scale'}: return total, current, kind, scale
+
+    return None
+
+
+def normalize(text: str) -> str:
+    """
+    Converts spelled-out numbers in the text to digits (e.g., "twenty three million four hundred thousand five" -> "23400005")
+    in a single pass over the words of the text.
+    :param text: the input text.
+    :return: the normalized text.
+    """
+    out, pos = [], 0
+    state, start, end, prev_end = START, -1, -1, -1
+
+    def flush():
+        nonlocal pos
+        if end > start >= 0:
+            total, current, _, _ = state
+            out.append(text[pos:start])
+            out.append(str(total + current))
+            pos = end
+
+    for m in RE_NUMBER_WORD.finditer(text):
+        kind, value = NUMBER_WORDS.get(m.group().lower(), (None, 0))
+        if kind is None:
+            flush()
+            state, start, end = START, -1, -1
+            continue
+
+        next_state = None
+        if state is not START and RE_NUMBER_GAP.fullmatch(text, prev_end, m.start()):
+            next_state = accept(state, kind, value)
+
+        if next_state is None:
+            flush()
+            state, start, end = START, m.start(), -1
+            next_state = accept(state, kind, value)
+            if next_state is None:
+                state, start = START, -1
+                continue
+
+        state, prev_end = next_state, m.end()
+        if kind != 'a' and kind != 'and': end = m.end()
+
+    flush()
+    out.append(text[pos:])
+    return ''.join(out)
+
+
+def normalize_batch(texts: Iterable[str], workers: Optional[int] = None, chunksize: int = 1000) -> List[str]:
+    """
+    :param texts: any iterable of texts.
+    :param workers: the number of worker processes; if None, use all cores; if <= 1, normalize in this process.
+    :param chunksize: the number of texts sent to a worker at a time.
+    :return: the list of normalized texts in the input order.
+    """
+    return list(imap_chunks(normalize, texts, workers=workers, chunksize=chunksize))
 
 
 def normalize_extra(text):
@@ -194,17 +144,17 @@ if __name__ == '__main__':
 
     T = [
         'I met 12 people',
-        'sfs',
         'I have 1 brother and 2 sisters',
+        'My group has 1000 people',
         'A year has 365 days',
-        'I made 1000000 dollars',
-        'Say One, "Two", and !!Three?!',
-        'One two    three   four',
-        'Two Billion and Thirteen Million',
-        'I\'m seventy-eight years old',
+        'I made 23400005 dollars',
+        'Say 1, "2", and !!3?!',
+        '1 2    3   4',
+        '2013000000',
+        'I\'m 78 years old',
         'I won the sixth place',
-        'I was born in nineteen ninety-six',
-        'I know twenty five hundred people',
+        'I was born in 1996',
+        'I know 2500 people',
         'None has a tendency of being a teen'
     ]
 
@@ -212,5 +162,22 @@ if __name__ == '__main__':
     for s, t in zip(S, T):
         if normalize(s) == t:
             correct += 1
-
-    print('Score: {}/{}'.format(correct, len(S)))
\ No newline at end of file
+        else:
+            print('Expected: {}\nActual:   {}'.format(t, normalize(s)))
+
+    print('Score: {}/{}'.format(correct, len(S)))
+
+    # throughput; the time per character should stay flat as the input grows
+    import time
+    for n in [10, 100, 1000]:
+        text = ' '.join(S * n)
+        st = time.perf_counter()
+        normalize(text)
+        et = time.perf_counter() - st
+        print('{:>9,} chars: {:8.4f} sec, {:>12,.0f} chars/sec'.format(len(text), et, len(text) / et))
+
+    texts = S * 10000
+    st = time.perf_counter()
+    normalize_batch(texts)
+    et = time.perf_counter() - st
+    print('normalize_batch: {:,} texts, {:>12,.0f} texts/sec'.format(len(texts), len(texts) / et))
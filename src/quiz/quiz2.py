@@ -14,17 +14,38 @@
 # limitations under the License.
 # ========================================================================
 #hohoh
-import nltk
+from typing import Set, Optional, List, Iterable, TYPE_CHECKING
 
-from typing import Set, Optional, List
-from nltk.corpus.reader import Synset
-from nltk.corpus import wordnet as wn
+from src.lazy import LazyImport, wordnet as wn
 
+if TYPE_CHECKING:
+    from nltk.corpus.reader import Synset
 
-def antonyms(sense: str) -> Set[Synset]:
+wordnet_index = LazyImport('src.wordnet_index')
+taxonomy_index = LazyImport('src.taxonomy_index')
+
+
+def antonyms(sense: str) -> Set['Synset']:
     """
     :param sense: the ID of the sense (e.g., 'dog.n.01').
     :return: a set of Synsets representing the union of all antonyms of the sense as well as its synonyms.
+    Served from the precomputed WordNet index (see wordnet_index); see antonyms_nltk() for the original computation.
+    """
+    index = wordnet_index.get_index()
+    return set(index.to_synsets(index.antonyms(index.synset_id(sense))))
+
+
+def antonyms_many(senses: Iterable[str]) -> List[Set['Synset']]:
+    """
+    :return: the antonyms of every sense; see antonyms().
+    """
+    index = wordnet_index.get_index()
+    return [set(index.to_synsets(a)) for a in index.antonyms_many([index.synset_id(sense) for sense in senses])]
+
+
+def antonyms_nltk(sense: str) -> Set['Synset']:
+    """
+    The same as antonyms() where the lemmas and their antonyms are read through the WordNet corpus reader of NLTK.
     """
     result = set()
     sen = wn.synset(sense)
@@ -36,39 +57,22 @@ def antonyms(sense: str) -> Set[Synset]:
     return result
 
 
-def paths(sense_0: str, sense_1: str) -> List[List[Synset]]:
-
-    result0 = []
-    first = wn.synset(sense_0)
-    second = wn.synset(sense_1)
-    hypernym_path0 = first.hypernym_paths()
-    hypernym_path1 = second.hypernym_paths()
-    lch = first.lowest_common_hypernyms(second)
-
-    for hypernym in lch:
-        for syn_list in hypernym_path1:
-            i = next((i for i, syn in enumerate(syn_list) if syn == hypernym), -1)
-            if i >= 0:
-                path = syn_list[i:]
-                for syn_list in hypernym_path0:
-                    pathOwn = path.copy()
-                    i = next((i for i, syn in enumerate(syn_list) if syn == hypernym), -1)
-                    if i >= 0:
-                        for e in syn_list[i+1:]:
-                            pathOwn.insert(0, e)
-                        result0.append(pathOwn)
-
-    myset = set()
-    for result in result0:
-        myset.add(str(result))
-    result = list(myset)
-    return result
+def paths(sense_0: str, sense_1: str) -> List[List['Synset']]:
+    """
+    :param sense_0: the ID of the first sense.
+    :param sense_1: the ID of the second sense.
+    :return: the distinct paths from the first sense up to each of their lowest common hypernyms and down to the second sense,
+             through every pair of their hypernym paths; answered by the precomputed taxonomy index (see taxonomy_index).
+    """
+    index = taxonomy_index.get_index()
+    return [index.to_synsets(path) for path in index.paths(index.synset_id(sense_0), index.synset_id(sense_1))]
 
 
 if __name__ == '__main__':
     print(antonyms('purchase.v.01'))
     print(antonyms('end.v.02'))
     print(antonyms('nonspecific.a.01'))
+    print(antonyms_many(['purchase.v.01', 'end.v.02', 'nonspecific.a.01']))
 
     for path in paths('dog.n.01', 'cat.n.01'):
        print([s.name() for s in path])
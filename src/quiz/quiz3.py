@@ -15,26 +15,20 @@
 # ========================================================================
 import pickle
 from collections import Counter
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
+
+from src.pos_corpus import iter_sentences
+from src.profiling import profiled, stage, num_tokens
 
 DUMMY = '!@#$'
 
 
+@profiled(tokens=lambda data, *args, **kwargs: num_tokens(data))
 def read_data(filename: str):
-    data, sentence = [], []
-    fin = open(filename)
-
-    for line in fin:
-        l = line.split()
-        if l:
-            sentence.append((l[0], l[1]))
-        else:
-            data.append(sentence)
-            sentence = []
-
-    return data
+    return list(iter_sentences(filename))
 
 
+@profiled()
 def to_probs(model: Dict[Any, Counter]) -> Dict[str, List[Tuple[str, float]]]:
     probs = dict()
     for feature, counter in model.items():
@@ -44,6 +38,7 @@ def to_probs(model: Dict[Any, Counter]) -> Dict[str, List[Tuple[str, float]]]:
     return probs
 
 
+@profiled(tokens=lambda acc, data, *args: num_tokens(data))
 def evaluate(data: List[List[Tuple[str, str]]], *args):
     total, correct = 0, 0
     for sentence in data:
@@ -55,6 +50,7 @@ def evaluate(data: List[List[Tuple[str, str]]], *args):
     return accuracy
 
 
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_cw_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[str, float]]]:
     """
     :param data: a list of tuple lists where each inner list represents a sentence and every tuple is a (word, pos) pair.
@@ -67,6 +63,7 @@ def create_cw_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[st
     return to_probs(model)
 
 
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_pp_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[str, float]]]:
     """
     :param data: a list of tuple lists where each inner list represents a sentence and every tuple is a (word, pos) pair.
@@ -80,6 +77,7 @@ def create_pp_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[st
     return to_probs(model)
 
 
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_pw_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[str, float]]]:
     """
     :param data: a list of tuple lists where each inner list represents a sentence and every tuple is a (word, pos) pair.
@@ -93,6 +91,7 @@ def create_pw_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[st
     return to_probs(model)
 
 
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_nw_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[str, float]]]:
     """
     :param data: a list of tuple lists where each inner list represents a sentence and every tuple is a (word, pos) pair.
@@ -106,6 +105,7 @@ def create_nw_dict(data: List[List[Tuple[str, str]]]) -> Dict[str, List[Tuple[st
     return to_probs(model)
 
 # P(wi,wi-1,pi)/P(wi,wi-1)
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_first_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str, str], List[Tuple[str, float]]]:
     PREV_DUMMY = '!@#$'
     model = dict()
@@ -124,6 +124,7 @@ def create_first_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str,
 
 
 # P(wi,wi+1,pi)/P(wi,wi+1)
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_second_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str, str], List[Tuple[str, float]]]:
     NEXT_DUMMY = '!@#$'
     model = dict()
@@ -143,6 +144,7 @@ def create_second_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str,
 
 
 # P(wi,pi-1,pi)/P(wi,pi-1)
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_third_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str, str], List[Tuple[str, float]]]:
     PREV_DUMMY = '!@#$'
     model = dict()
@@ -161,6 +163,7 @@ def create_third_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str,
     return model
 
 #P(pi, wi+1, wi-1)/P(wi+1, wi-1)
+@profiled(tokens=lambda model, data: num_tokens(data))
 def create_fourth_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str, str], List[Tuple[str, float]]]:
     NEXT_DUMMY = '!@#$'
     model = dict()
@@ -180,12 +183,20 @@ def create_fourth_pos_dict(data: List[List[Tuple[str, str]]]) -> Dict[Tuple[str,
     return model
 
 
-def train(trn_data: List[List[Tuple[str, str]]], dev_data: List[List[Tuple[str, str]]]) -> Tuple:
+@profiled()
+def train(trn_data: List[List[Tuple[str, str]]], dev_data: List[List[Tuple[str, str]]], workers: Optional[int] = None) -> Tuple:
     """
     :param trn_data: the training set
     :param dev_data: the development set
+    :param workers: the number of processes of the weight search; see pos_search.TrialRunner.
     :return: a tuple of all parameters necessary to perform part-of-speech tagging
     """
+    # imported here as they import this module
+    import tempfile
+    from src.pos_model import CompactModel
+    from src.pos_search import grid_search, grid_weights
+    from src.pos_training import train_tables
+
     cw_dict = create_cw_dict(trn_data)
     pp_dict = create_pp_dict(trn_data)
     pw_dict = create_pw_dict(trn_data)
@@ -194,20 +205,19 @@ def train(trn_data: List[List[Tuple[str, str]]], dev_data: List[List[Tuple[str,
     second_dict = create_second_pos_dict(trn_data)
     third_dict = create_third_pos_dict(trn_data)
     fourth_dict = create_fourth_pos_dict(trn_data)
-    best_acc, best_args = -1, None
-    grid = [0.5, 1, 2]
+    candidates = grid_weights([0.5, 1, 2])
 
-    for first_weight in grid:
-        for second_weight in grid:
-            for third_weight in grid:
-                for fourth_weight in grid:
-                    args = (cw_dict, pp_dict, pw_dict, nw_dict, first_dict, second_dict, third_dict, fourth_dict, first_weight, second_weight, third_weight, fourth_weight)
-                    acc = evaluate(dev_data, *args)
-                    if acc > best_acc: best_acc, best_args = acc, args
+    # the same predictions as predict() for every weight combination, evaluated across processes on the saved tables
+    with stage('train.grid'), tempfile.TemporaryDirectory() as tmp:
+        CompactModel.from_tables(*train_tables(trn_data)).save(tmp)
+        _, trials = grid_search(tmp, dev_data, candidates, workers, verbose=False)
 
-    return best_args
+    order = {weights: i for i, weights in enumerate(candidates)}
+    best = max(trials, key=lambda t: (t.accuracy, -order[t.weights]))  # the first best in the grid order, as the serial loop
+    return (cw_dict, pp_dict, pw_dict, nw_dict, first_dict, second_dict, third_dict, fourth_dict) + best.weights
 
 
+@profiled(tokens=lambda output, tokens, *args: len(tokens))
 def predict(tokens: List[str], *args) -> List[Tuple[str, float]]:
     cw_dict, pp_dict, pw_dict, nw_dict, first_dict, second_dict, third_dict, fourth_dict, first_weight, second_weight, third_weight, fourth_weight = args
     output = []
@@ -251,14 +261,14 @@ def predict(tokens: List[str], *args) -> List[Tuple[str, float]]:
 
 
 if __name__ == '__main__':
-    path = '../../'  # path to the cs329 directory
+    path = ''  # path to the cs329 directory
     trn_data = read_data(path + 'dat/pos/wsj-pos.trn.gold.tsv')
     dev_data = read_data(path + 'dat/pos/wsj-pos.dev.gold.tsv')
     model_path = path + 'src/quiz/quiz3.pkl'
 
     # save model
     args = train(trn_data, dev_data)
-    pickle.dump(args, open(model_path, 'wb'))
+    with stage('pickle.dump'): pickle.dump(args, open(model_path, 'wb'))
     # load model
-    args = pickle.load(open(model_path, 'rb'))
+    with stage('pickle.load'): args = pickle.load(open(model_path, 'rb'))
     print(evaluate(dev_data, *args))
\ No newline at end of file
@@ -13,15 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
-import glob
-import os
+from bisect import bisect_left
 from types import SimpleNamespace
-from typing import Iterable, Tuple, Any, List, Set
+from typing import Iterable, Tuple, Any, List, Set, TYPE_CHECKING
 
-import ahocorasick
+from src.gazetteer import Gazetteer, TokenTrie, load_gazetteers
+from src.lazy import ahocorasick
+from src.regular_expression import TokenSpans
 
+if TYPE_CHECKING:
+    from ahocorasick import Automaton
 
-def create_ac(data: Iterable[Tuple[str, Any]]) -> ahocorasick.Automaton:
+
+def create_ac(data: Iterable[Tuple[str, Any]]) -> 'Automaton':
     """
     Creates the Aho-Corasick automation and adds all (span, value) pairs in the data and finalizes this matcher.
     :param data: a collection of (span, value) pairs.
@@ -40,16 +44,14 @@ def create_ac(data: Iterable[Tuple[str, Any]]) -> ahocorasick.Automaton:
     return AC
 
 
-def read_gazetteers(dirname: str) -> ahocorasick.Automaton:
-    data = []
-    for filename in glob.glob(os.path.join(dirname, '*.txt')):
-        label = os.path.basename(filename)[:-4]
-        for line in open(filename):
-            data.append((line.strip(), label))
-    return create_ac(data)
+def read_gazetteers(dirname: str) -> Gazetteer:
+    """
+    :return: the automaton of the gazetteers in the directory, loaded from the cache unless any file has changed.
+    """
+    return load_gazetteers(dirname)
 
 
-def match(AC: ahocorasick.Automaton, tokens: List[str]) -> List[Tuple[str, int, int, Set[str]]]:
+def match(AC: 'Automaton', tokens: List[str]) -> List[Tuple[str, int, int, Set[str]]]:
     """
     :param AC: the finalized Aho-Corasick automation.
     :param tokens: the list of input tokens.
@@ -80,6 +82,57 @@ def match(AC: ahocorasick.Automaton, tokens: List[str]) -> List[Tuple[str, int,
     return spans
 
 
+def match_spans(AC: 'Automaton', tokens: TokenSpans) -> List[Tuple[str, int, int, Set[str]]]:
+    """
+    Same as match() but runs on the original text of the token spans, so neither the joined text nor the offset maps are built.
+    Spans are matched as they appear in the original text (e.g., multi-word spans need single spaces between their tokens).
+    :param AC: the finalized Aho-Corasick automation.
+    :param tokens: the token spans returned by tokenize_spans().
+    :return: the same list of tuples as match().
+    """
+    starts, ends = tokens.starts, tokens.ends
+    n, spans = len(starts), []
+
+    for eidx, t in AC.iter(tokens.text):
+        eidx += 1
+        sidx = eidx - len(t.span)
+        si = bisect_left(starts, sidx)
+        if si == n or starts[si] != sidx: continue
+        ei = bisect_left(ends, eidx, si)
+        if ei == n or ends[ei] != eidx: continue
+        spans.append((t.span, si, ei + 1, t.values))
+
+    return spans
+
+
+def match_tokens(trie: TokenTrie, tokens: List[str]) -> List[Tuple[str, int, int, Set[str]]]:
+    """
+    Same as match() but walks the token trie backward from every token, so only spans on token boundaries are visited,
+    and neither the joined text nor the offset maps are built.
+    :param trie: the token trie of the gazetteers (e.g., read_gazetteers(dirname).trie).
+    :param tokens: the list of input tokens.
+    :return: the same list of tuples as match(), in the same order.
+    """
+    roots, vocab, edges, labelsets = trie.roots, trie.vocab, trie.edges, trie.labelsets
+    v, spans = len(vocab), []
+
+    for end, token in enumerate(tokens):
+        node = roots.get(token)
+        if node is None: continue
+        hits = [(end, labelsets[node])] if labelsets[node] is not None else []
+        for begin in range(end - 1, -1, -1):
+            tid = vocab.get(tokens[begin])
+            if tid is None: break
+            node = edges.get(node * v + tid)
+            if node is None: break
+            if labelsets[node] is not None: hits.append((begin, labelsets[node]))
+        # match() finds the longest span first among the spans ending at the same token
+        for begin, labels in reversed(hits):
+            spans.append((' '.join(tokens[begin:end + 1]), begin, end + 1, labels))
+
+    return spans
+
+
 def remove_overlaps(entities: List[Tuple[str, int, int, Set[str]]]) -> List[Tuple[str, int, int, Set[str]]]:
     """
     :param entities: a list of tuples where each tuple consists of
@@ -171,7 +224,7 @@ def to_bilou(tokens: List[str], entities: List[Tuple[str, int, int, str]]) -> Li
 
 if __name__ == '__main__':
     gaz_dir = 'dat/ner'
-    AC = read_gazetteers('../../dat/ner')
+    AC = read_gazetteers(gaz_dir)
 
     tokens = 'Atlantic City of Georgia'.split()
     #tokens = 'AA BB CCC DD'.split()
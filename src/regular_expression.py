@@ -13,15 +13,47 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
-import re
+from array import array
+from typing import List, Tuple, Dict, Iterator
 
-RE_TOK = re.compile(r'([",.]|n\'t|\s+)')
-RE_ABBR = re.compile(r'((?:Mr|Mrs|Ms|Dr)\.)|((?:[A-Z]\.){2,})')  # Mr. Dr. Mrs. U.S.A. USA.
-RE_APOS = re.compile(r'\'(\d\ds?|cause)')
-RE_CONC = re.compile(r'([A-Za-z]+)(n\'t)|(gon)(na)|(can)(not)')
-RE_HYPE = re.compile(r'(https?:\/\/\S+)')
-RE_NUMB = re.compile(r'(\d+\/\d+)|(\d{3}-\d{3}-\d{4})|(\d(?:,\d{3})+)')
-RE_UNIT = re.compile(r'([$#])?(\d+)([km]g)?')
+from src.patterns import PATTERNS, Pattern, RE_TOK, RE_ABBR, RE_APOS, RE_HYPE, RE_NUMB, RE_UNIT, RE_PUNC, RE_WORD, \
+    RE_CONC_SCAN, RE_PLAIN
+from src.patterns import RE_CONC  # re-exported for backward compatibility; the scanner uses RE_CONC_SCAN
+
+# (name, rule, first character guard, right boundary, split into groups); earlier rules win at the same position
+SCAN_RULES = [
+    ('PLAIN', RE_PLAIN, '', '', False),
+    ('HYPE', RE_HYPE, 'h', '', False),
+    ('ABBR', RE_ABBR, '[A-Z]', '', False),
+    ('NUMB', RE_NUMB, r'\d', r'(?!\d)', False),
+    ('APOS', RE_APOS, '\'', r'(?![A-Za-z\d])', False),
+    ('CONC', RE_CONC_SCAN, '[gc]', r'(?![A-Za-z])', True),
+    ('UNIT', RE_UNIT, r'[$#\d]', r'(?![A-Za-z])', True),
+    ('PUNC', RE_PUNC, '', '', False),
+    ('WORD', RE_WORD, '', '', False),
+]
+
+
+def compile_scanner(name: str, rules) -> Tuple[Pattern, Dict[int, Tuple[int, ...]]]:
+    """
+    Combines all rules into one alternation so that a single finditer pass emits every token.
+    Every match starts with the whitespace before its token, so that the scanner never fails at a whitespace position.
+    :param name: the name of the combined pattern in the registry.
+    :param rules: a list of (name, rule, first character guard, right boundary, split) tuples.
+    :return: the combined pattern and a dictionary mapping the group index of every split rule to its inner group indices.
+    """
+    pattern = r'\s*(?:' + '|'.join('(?P<{}>{}(?:{}){})'.format(name, '(?={})'.format(guard) if guard else '', rule.pattern, boundary)
+                       for name, rule, guard, boundary, _ in rules) + ')'
+    scanner = PATTERNS.register(name, pattern)
+    split_groups = dict()
+    for name, rule, _, _, split in rules:
+        if split:
+            g = scanner.groupindex[name]
+            split_groups[g] = tuple(range(g + 1, g + 1 + rule.groups))
+    return scanner, split_groups
+
+
+RE_SCAN, SPLIT_GROUPS = compile_scanner('SCAN', SCAN_RULES)
 
 
 def tokenize_regex(text):
@@ -41,9 +73,143 @@ def tokenize_regex(text):
     return tokens
 
 
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """
+    :param text: the input text.
+    :return: a list of (token, start offset, end offset) tuples where the offsets index the input text.
+    """
+    tokens = []
+    for m in RE_SCAN.finditer(text):
+        g = m.lastindex
+        if g in SPLIT_GROUPS:
+            for g in SPLIT_GROUPS[g]:
+                s, e = m.span(g)
+                if s >= 0: tokens.append((text[s:e], s, e))
+        else:
+            s, e = m.span(g)
+            tokens.append((text[s:e], s, e))
+    return tokens
+
+
+class Token:
+    """
+    A view of one token in its source text; the token string is materialized only when requested.
+    """
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source: str, start: int, end: int):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def __str__(self):
+        return self.source[self.start:self.end]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return 'Token({!r}, {}, {})'.format(str(self), self.start, self.end)
+
+
+class TokenSpans:
+    """
+    Tokens of a text stored as parallel start/end offset arrays over the original text.
+    Indexing returns the token string; token() returns a Token view that does not copy the text.
+    """
+    __slots__ = ('text', 'starts', 'ends')
+
+    def __init__(self, text: str, starts: array = None, ends: array = None):
+        self.text = text
+        self.starts = starts if starts is not None else array('i')
+        self.ends = ends if ends is not None else array('i')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> str:
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def __iter__(self) -> Iterator[str]:
+        text = self.text
+        for s, e in zip(self.starts, self.ends): yield text[s:e]
+
+    def token(self, i: int) -> Token:
+        return Token(self.text, self.starts[i], self.ends[i])
+
+    def spans(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts, self.ends)
+
+
+def tokenize_spans(text: str) -> TokenSpans:
+    """
+    The same tokenization as tokenize() without allocating a string per token.
+    :param text: the input text (shorter than 2^31 characters).
+    :return: the token spans over the input text.
+    """
+    spans = TokenSpans(text)
+    starts, ends = spans.starts, spans.ends
+    for m in RE_SCAN.finditer(text):
+        g = m.lastindex
+        if g in SPLIT_GROUPS:
+            for g in SPLIT_GROUPS[g]:
+                s, e = m.span(g)
+                if s >= 0:
+                    starts.append(s)
+                    ends.append(e)
+        else:
+            s, e = m.span(g)
+            starts.append(s)
+            ends.append(e)
+    return spans
+
+
 if __name__ == '__main__':
+    import time
+    import tracemalloc
+    from src.tokenization import tokenize_strmat_0, tokenize_strmat_1
+
     text0 = 'Mr. Wayne isn\'t the hero we need, but "the one" we deserve.'
     text1 = 'Ms. Wayne is "Batgirl" but not "the one".'
+    text2 = 'Dr. Lee of the U.S.A. said you cannot pay $20 for 5kg in the \'90s, see https://emory.edu or call 404-123-4567.'
+
+    tokenizers = [
+        ('tokenize_regex', tokenize_regex),
+        ('tokenize_strmat_0', tokenize_strmat_0),
+        ('tokenize_strmat_1', tokenize_strmat_1),
+        ('tokenize', lambda t: [token for token, _, _ in tokenize(t)]),
+    ]
+
+    for text in [text0, text1, text2]:
+        print(text)
+        for name, tokenizer in tokenizers: print('  {:<18} {}'.format(name, tokenizer(text)))
+
+    # throughput over the WSJ dev set, one sentence per line
+    texts, sentence = [], []
+    for line in open('dat/pos/wsj-pos.dev.gold.tsv'):
+        l = line.split()
+        if l: sentence.append(l[0])
+        elif sentence: texts.append(' '.join(sentence)); sentence = []
+    if sentence: texts.append(' '.join(sentence))
+
+    for name, tokenizer in tokenizers:
+        st = time.perf_counter()
+        count = sum(len(tokenizer(text)) for text in texts)
+        et = time.perf_counter() - st
+        print('{:<18} {:>8} tokens {:>12,.0f} tokens/sec'.format(name, count, count / et))
 
-    print(tokenize_regex(text0))
-    print(tokenize_regex(text1))
\ No newline at end of file
+    # memory and throughput of string tuples vs. offset spans, per sentence and over the whole document
+    document = '\n'.join(texts)
+    for name, run in [('tokenize/sentence', lambda: [tokenize(text) for text in texts]),
+                      ('tokenize_spans/sentence', lambda: [tokenize_spans(text) for text in texts]),
+                      ('tokenize/document', lambda: tokenize(document)),
+                      ('tokenize_spans/document', lambda: tokenize_spans(document))]:
+        st = time.perf_counter()
+        run()
+        et = time.perf_counter() - st
+        tracemalloc.start()
+        output = run()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del output
+        print('{:<24} {:>12,.0f} tokens/sec {:>8.2f} MB'.format(name, count / et, size / 2**20))
\ No newline at end of file
@@ -0,0 +1,242 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+from typing import Tuple, Sequence, Optional, NamedTuple
+
+import numpy as np
+
+from src.parallel import imap_chunks
+from src.taxonomy_index import TaxonomyIndex, INDEX_PATH, get_index
+from src.wordnet_index import POS_CODES
+
+MEASURES = ('path', 'wup', 'lch')
+NOUN = POS_CODES.index('n')
+MAX_PAIRS = 1 << 20  # synset pairs per chunk of similarity_matrix()
+
+# the state of a worker process of similarity_matrix()
+INDEX: Optional[TaxonomyIndex] = None
+SYNSETS: Optional[np.ndarray] = None
+MEASURE = 'path'
+SIMULATE_ROOT = True
+
+
+class PairStats(NamedTuple):
+    distance: np.ndarray                # the shortest path distance through a common hypernym; inf if none
+    subsumer: Optional[np.ndarray]      # the first of Synset.lowest_common_hypernyms(use_min_depth=True); -1 if none
+    is_ancestor: Optional[np.ndarray]   # whether the first synset is a hypernym of (or the same as) the second
+
+
+def node_pairs(index: TaxonomyIndex, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: the nodes (u, v) of every pair of nodes of every pair of synsets (a[i], b[i]),
+             and the offset of the first node pair of every synset pair.
+    """
+    ia, ib = index.synset_indptr[a], index.synset_indptr[b]
+    na, nb = index.synset_indptr[a + 1] - ia, index.synset_indptr[b + 1] - ib
+    counts = na * nb
+    starts = np.zeros(len(a), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    g = np.repeat(np.arange(len(a)), counts)
+    k = np.arange(int(counts.sum())) - starts[g]
+    return index.synset_nodes[ia[g] + k // nb[g]], index.synset_nodes[ib[g] + k % nb[g]], starts
+
+
+def pair_stats(index: TaxonomyIndex, a: np.ndarray, b: np.ndarray, subsumers: bool = True) -> PairStats:
+    """
+    Every path between two synsets through a common hypernym is the tree path between one node of each of them,
+    so the shortest distance is the minimum over their node pairs of the distances through the lowest common ancestors.
+    :param a: the first synset IDs.
+    :param b: the second synset IDs, aligned with `a`.
+    :param subsumers: if False, only the distances are computed (the other fields are None).
+    """
+    if not len(a): return PairStats(np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool))
+    u, v, starts = node_pairs(index, a, b)
+    w = index.lca(u, v)
+    common = w > 0  # 0 is the virtual root above all roots
+
+    d = index.depth[u].astype(np.float64) + index.depth[v] - 2 * index.depth[w]
+    d[~common] = np.inf
+    distance = np.minimum.reduceat(d, starts)
+    distance[a == b] = 0
+    if not subsumers: return PairStats(distance, None, None)
+
+    # the best subsumer of all node pairs by the rank of (min_depth, name), decoded back to the synset
+    n = len(index.name_order)
+    s = index.subsumer[w]
+    key = np.where(common, index.min_depth[s].astype(np.int64) * n + (n - 1 - index.name_rank[s]), -1)
+    best = np.maximum.reduceat(key, starts)
+    subsumer = np.where(best >= 0, index.name_order[n - 1 - best % n], -1)
+    is_ancestor = np.maximum.reduceat(w == u, starts)
+    return PairStats(distance, subsumer, is_ancestor)
+
+
+def needs_root(index: TaxonomyIndex, synsets: np.ndarray) -> np.ndarray:
+    """
+    :return: whether NLTK simulates a root for every synset; all but nouns, whose taxonomy has a single root.
+    """
+    return index.synset_pos[synsets] != NOUN
+
+
+def path_similarity(index: TaxonomyIndex, a: np.ndarray, b: np.ndarray, simulate_root: bool = True) -> np.ndarray:
+    """
+    :return: Synset.path_similarity() of every synset pair; nan where NLTK returns None.
+    """
+    distance = pair_stats(index, a, b, subsumers=False).distance
+    fake = np.isinf(distance) & simulate_root & (needs_root(index, a) | needs_root(index, b))
+    distance = np.where(fake, index.root_distance[a].astype(np.float64) + index.root_distance[b], distance)
+    return np.where(np.isinf(distance), np.nan, 1.0 / (distance + 1))
+
+
+def lch_similarity(index: TaxonomyIndex, a: np.ndarray, b: np.ndarray, simulate_root: bool = True) -> np.ndarray:
+    """
+    :return: Synset.lch_similarity() of every synset pair; nan where NLTK returns None or raises
+             for synsets of different parts-of-speech.
+    """
+    pos = index.synset_pos[a]
+    need = needs_root(index, a)
+    # the depth of the taxonomy of every part-of-speech, one deeper with the simulated root
+    depths = np.zeros(len(POS_CODES), dtype=np.float64)
+    np.maximum.at(depths, index.synset_pos, index.max_depth)
+    depth = depths[pos] + need
+
+    distance = pair_stats(index, a, b, subsumers=False).distance
+    fake = np.isinf(distance) & simulate_root & need
+    distance = np.where(fake, index.root_distance[a].astype(np.float64) + index.root_distance[b], distance)
+    valid = (pos == index.synset_pos[b]) & ~np.isinf(distance) & (depth > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(valid, -np.log((distance + 1) / (2.0 * depth)), np.nan)
+
+
+def wup_similarity(index: TaxonomyIndex, a: np.ndarray, b: np.ndarray, simulate_root: bool = True) -> np.ndarray:
+    """
+    :return: Synset.wup_similarity() of every synset pair; nan where NLTK returns None.
+    """
+    stats = pair_stats(index, a, b)
+    simulate = simulate_root & (needs_root(index, a) | needs_root(index, b))
+    has = stats.subsumer >= 0
+    top = index.min_depth[np.maximum(stats.subsumer, 0)]
+    # NLTK prefers the first synset if it is one of the subsumers; otherwise, the simulated root sorts first ('*ROOT*')
+    first = stats.is_ancestor & has & (index.min_depth[a] == top)
+    fake = simulate & ~first & (~has | (top == 0))
+    real = has & ~fake
+    subsumer = np.where(first, a, stats.subsumer)
+
+    out = np.full(len(a), np.nan)
+    r = np.flatnonzero(real)
+    if len(r):
+        c = subsumer[r]
+        depth = index.max_depth[c].astype(np.float64) + 1
+        len_a = pair_stats(index, a[r], c, subsumers=False).distance
+        len_b = pair_stats(index, b[r], c, subsumers=False).distance
+        out[r] = 2.0 * depth / (len_a + len_b + 2 * depth)
+    f = np.flatnonzero(fake)
+    if len(f):
+        out[f] = 2.0 / (index.root_distance[a[f]].astype(np.float64) + index.root_distance[b[f]] + 2)
+    return out
+
+
+SIMILARITIES = {'path': path_similarity, 'wup': wup_similarity, 'lch': lch_similarity}
+
+
+def similarity_pairs(pairs: Sequence[Tuple[str, str]], measure: str = 'path', simulate_root: bool = True,
+                     index: Optional[TaxonomyIndex] = None) -> np.ndarray:
+    """
+    :param pairs: pairs of sense IDs (e.g., ('dog.n.01', 'cat.n.01')).
+    :param measure: one of MEASURES.
+    :return: the similarity of every pair as NLTK computes it; nan where NLTK returns None.
+    """
+    if measure not in SIMILARITIES: raise ValueError('Unknown measure: {}'.format(measure))
+    if index is None: index = get_index()
+    a = np.array([index.synset_id(s) for s, _ in pairs], dtype=np.int64)
+    b = np.array([index.synset_id(s) for _, s in pairs], dtype=np.int64)
+    return SIMILARITIES[measure](index, a, b, simulate_root)
+
+
+def similarity(sense_0: str, sense_1: str, measure: str = 'path', simulate_root: bool = True) -> Optional[float]:
+    """
+    :return: the similarity of the two senses as NLTK computes it; None where NLTK returns None.
+    """
+    score = float(similarity_pairs([(sense_0, sense_1)], measure, simulate_root)[0])
+    return None if np.isnan(score) else score
+
+
+def init_worker(index_path: str, synsets: np.ndarray, measure: str, simulate_root: bool):
+    global INDEX, SYNSETS, MEASURE, SIMULATE_ROOT
+    INDEX = get_index(index_path)
+    SYNSETS, MEASURE, SIMULATE_ROOT = synsets, measure, simulate_root
+
+
+def similarity_rows(rows: Tuple[int, int]) -> np.ndarray:
+    """
+    :return: the similarities of the synsets in SYNSETS[begin:end] to all synsets in SYNSETS.
+    """
+    begin, end = rows
+    n = len(SYNSETS)
+    a = np.repeat(SYNSETS[begin:end], n)
+    b = np.tile(SYNSETS, end - begin)
+    return SIMILARITIES[MEASURE](INDEX, a, b, SIMULATE_ROOT).reshape(end - begin, n)
+
+
+def similarity_matrix(senses: Sequence[str], measure: str = 'path', simulate_root: bool = True, workers: int = 1,
+                      rows_per_chunk: Optional[int] = None, index_path: str = INDEX_PATH) -> np.ndarray:
+    """
+    :param senses: sense IDs (e.g., 'dog.n.01').
+    :param measure: one of MEASURES.
+    :param workers: the number of processes, each memory-mapping the index; the rows are computed in chunks.
+    :param rows_per_chunk: the number of rows per chunk; if None, about MAX_PAIRS pairs per chunk.
+    :param index_path: the directory of the taxonomy index, used by this and every worker process (see get_index()).
+    :return: the (sense x sense) matrix of the similarities as NLTK computes them; nan where NLTK returns None.
+    """
+    if measure not in SIMILARITIES: raise ValueError('Unknown measure: {}'.format(measure))
+    index = get_index(index_path)
+    synsets = np.array([index.synset_id(s) for s in senses], dtype=np.int64)
+    n = len(synsets)
+    if rows_per_chunk is None: rows_per_chunk = max(1, MAX_PAIRS // max(n, 1))
+    chunks = [(i, min(i + rows_per_chunk, n)) for i in range(0, n, rows_per_chunk)]
+
+    out = np.empty((n, n), dtype=np.float64)
+    results = imap_chunks(similarity_rows, chunks, workers, chunksize=1, initializer=init_worker,
+                          initargs=(index_path, synsets, measure, simulate_root))
+    for (begin, end), block in zip(chunks, results): out[begin:end] = block
+    return out
+
+
+if __name__ == '__main__':
+    import random
+    import time
+    from nltk.corpus import wordnet as wn
+
+    random.seed(0)
+    nouns = [s.name() for s in wn.all_synsets('n')]
+    verbs = [s.name() for s in wn.all_synsets('v')]
+    senses = random.sample(nouns, 150) + random.sample(verbs, 50)
+    synsets = [wn.synset(s) for s in senses]
+
+    for measure in MEASURES:
+        func = {'path': wn.path_similarity, 'wup': wn.wup_similarity, 'lch': wn.lch_similarity}[measure]
+        st = time.perf_counter()
+        gold = np.array([[np.nan if measure == 'lch' and s.pos() != t.pos() else func(s, t) or np.nan for t in synsets]
+                         for s in synsets], dtype=np.float64)
+        nltk_time = time.perf_counter() - st
+        st = time.perf_counter()
+        matrix = similarity_matrix(senses, measure)
+        print('{:<4} {}x{}: NLTK {:7.2f} sec, matrix {:6.3f} sec, same: {}'.format(
+            measure, len(senses), len(senses), nltk_time, time.perf_counter() - st, np.allclose(gold, matrix, equal_nan=True)))
+
+    senses = random.sample(nouns, 3000)
+    for workers in [1, 4]:
+        st = time.perf_counter()
+        similarity_matrix(senses, 'wup', workers=workers)
+        print('wup 3000x3000, {} worker(s): {:.2f} sec'.format(workers, time.perf_counter() - st))
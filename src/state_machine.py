@@ -1,5 +1,8 @@
-from emora_stdm import KnowledgeBase, DialogueFlow
 from enum import Enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from emora_stdm import DialogueFlow
 
 ################################
 # Modify State enum for any Quiz2 tasks as needed
@@ -26,36 +29,44 @@ ont_dict = {
 
 ################################
 
-knowledge = KnowledgeBase()
-knowledge.load_json(ont_dict)
-df = DialogueFlow(State.START, initial_speaker=DialogueFlow.Speaker.SYSTEM, kb=knowledge)
+def build_dialogue() -> 'DialogueFlow':
+    """
+    :return: the dialogue flow, built on demand so that importing this module neither loads emora_stdm nor runs the dialogue.
+    """
+    from emora_stdm import KnowledgeBase, DialogueFlow
 
-df.add_system_transition(State.START, State.PROMPT, '"Enter an animal"')
-df.add_user_transition(State.PROMPT, State.MAMMAL, "$animal={cat,dog}")
-df.add_user_transition(State.PROMPT, State.BIRD, "$animal={parrot,dove,crow}")
-df.add_system_transition(State.MAMMAL, State.PROMPT, '[! $animal " is a mammal, enter another animal"]')
-df.add_system_transition(State.BIRD, State.PROMPT, '[! $animal "is a bird, enter another animal"]')
-df.add_system_transition(State.ERR, State.PROMPT, '"i dont know that one, enter another animal"')
-df.set_error_successor(State.PROMPT, State.ERR)
+    knowledge = KnowledgeBase()
+    knowledge.load_json(ont_dict)
+    df = DialogueFlow(State.START, initial_speaker=DialogueFlow.Speaker.SYSTEM, kb=knowledge)
 
+    df.add_system_transition(State.START, State.PROMPT, '"Enter an animal"')
+    df.add_user_transition(State.PROMPT, State.MAMMAL, "$animal={cat,dog}")
+    df.add_user_transition(State.PROMPT, State.BIRD, "$animal={parrot,dove,crow}")
+    df.add_system_transition(State.MAMMAL, State.PROMPT, '[! $animal " is a mammal, enter another animal"]')
+    df.add_system_transition(State.BIRD, State.PROMPT, '[! $animal "is a bird, enter another animal"]')
+    df.add_system_transition(State.ERR, State.PROMPT, '"i dont know that one, enter another animal"')
+    df.set_error_successor(State.PROMPT, State.ERR)
 
-################################
-# Add Quiz2 Task 1 below
-################################
 
+    ################################
+    # Add Quiz2 Task 1 below
+    ################################
 
 
-################################
-# Add Quiz2 Task 2 below
-################################
 
+    ################################
+    # Add Quiz2 Task 2 below
+    ################################
 
 
-################################
-# Add Quiz2 Task 3 below
-# (except do not move ont_dict from line 11)
-################################
 
+    ################################
+    # Add Quiz2 Task 3 below
+    # (except do not move ont_dict from line 11)
+    ################################
+
+    return df
 
 
-df.run(debugging=False)
\ No newline at end of file
+if __name__ == '__main__':
+    build_dialogue().run(debugging=False)
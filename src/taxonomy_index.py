@@ -0,0 +1,323 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import os
+import threading
+from typing import List, Dict, Sequence, Optional, Tuple
+
+import numpy as np
+
+from src.wordnet_index import PACKAGE_DIR, POS_CODES, IndexCache, SynsetTable, csr, load_arrays, save_index
+
+FORMAT_VERSION = 3
+INDEX_PATH = os.environ.get('CS329_TAXONOMY_INDEX') or os.path.join(PACKAGE_DIR, 'dat', 'taxonomy_index')
+ARRAYS = ['parent', 'depth', 'node_synset', 'tout', 'euler', 'first', 'synset_indptr', 'synset_nodes', 'max_depth',
+          'min_depth', 'root_distance', 'subsumer', 'name_order', 'synset_pos', 'synset_offsets']
+SCALAR_PAIRS = 16  # node pairs up to which the LCA is found pair by pair rather than vectorized
+
+
+class TaxonomyIndex(SynsetTable):
+    """
+    The hypernym taxonomy of WordNet (hypernyms and instance hypernyms) unfolded into a tree whose root-to-node paths are
+    exactly the paths of Synset.hypernym_paths(); a synset has one node per hypernym path (synset_nodes), in the order of
+    the build (NLTK keeps the pointers of a synset in a set, so its own order of the paths can differ across processes).
+    Nodes are numbered in preorder under a virtual root (node 0), so node x is an ancestor of node y iff x <= y < tout[x].
+    The lowest common ancestor of two nodes is the shallowest node between their first occurrences in the Euler tour,
+    found in constant time with a sparse table over the depths of the tour.
+    For the similarity measures of NLTK (see similarity), every synset also has its min_depth(), its distance to the root
+    that NLTK simulates for verbs (root_distance), and every node the synset on its root path with the greatest min_depth()
+    and then the smallest name (subsumer), as Synset.lowest_common_hypernyms(use_min_depth=True) picks its first result.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], synset_names: Optional[List[str]] = None, path: Optional[str] = None):
+        for name in ARRAYS: setattr(self, name, arrays[name])
+        self._synset_names = synset_names
+        self._synset_ids: Optional[Dict[str, int]] = None
+        self._path = path
+        self._lock = threading.Lock()
+        self.euler_depth = self.depth[self.euler]
+        # the levels of the sparse table concatenated, so that every query is a single gather
+        table = self.sparse_table(self.euler_depth)
+        self.sparse = np.concatenate(table)
+        self.sparse_offsets = np.cumsum([0] + [len(t) for t in table[:-1]]).astype(np.int64)
+        self.log2 = (np.frexp(np.arange(len(self.euler) + 1))[1] - 1).astype(np.int8)  # floor(log2(i)) for i >= 1
+        self.name_rank = np.empty(len(self.name_order), dtype=np.int64)
+        self.name_rank[self.name_order] = np.arange(len(self.name_order))
+
+    @staticmethod
+    def sparse_table(values: np.ndarray) -> List[np.ndarray]:
+        """
+        :return: table[k][i] = the index of the minimum of values[i:i + 2 ** k].
+        """
+        table = [np.arange(len(values), dtype=np.int32)]
+        k = 1
+        while (1 << k) <= len(values):
+            prev, half = table[-1], 1 << (k - 1)
+            a, b = prev[:-half], prev[half:]
+            table.append(np.where(values[b] < values[a], b, a))
+            k += 1
+        return table
+
+    @classmethod
+    def build(cls) -> 'TaxonomyIndex':
+        """
+        Builds the index from the WordNet corpus of NLTK; save() the index and load() it afterwards.
+        """
+        from nltk.corpus import wordnet as wn
+
+        synsets = list(wn.all_synsets())
+        synset_ids = {s.name(): i for i, s in enumerate(synsets)}
+        parents, synset_of = [-1], [-1]  # node 0 is the virtual root
+        nodes: Dict[int, List[int]] = {}
+
+        def unfold(s) -> List[int]:
+            # one node per hypernym path, in the order of Synset.hypernym_paths()
+            sid = synset_ids[s.name()]
+            if sid in nodes: return nodes[sid]
+            hypernyms = s.hypernyms() + s.instance_hypernyms()
+            out = []
+            for p in ([0] if not hypernyms else [p for h in hypernyms for p in unfold(h)]):
+                out.append(len(parents))
+                parents.append(p)
+                synset_of.append(sid)
+            nodes[sid] = out
+            return out
+
+        for s in synsets: unfold(s)
+
+        # renumber the nodes in preorder and record the Euler tour
+        n = len(parents)
+        children = [[] for _ in range(n)]
+        for i in range(1, n): children[parents[i]].append(i)
+        order, euler_old, tout_old = [], [], [0] * n
+        stack = [(0, 0)]
+        while stack:
+            node, k = stack.pop()
+            if k == 0: order.append(node)
+            euler_old.append(node)
+            if k < len(children[node]):
+                stack.append((node, k + 1))
+                stack.append((children[node][k], 0))
+            else:
+                tout_old[node] = len(order)
+
+        new_id = np.empty(n, dtype=np.int32)
+        new_id[order] = np.arange(n, dtype=np.int32)
+        old = np.array(order)
+        parent = np.where(old == 0, -1, new_id[np.maximum(np.array(parents)[old], 0)]).astype(np.int32)
+        depth = np.zeros(n, dtype=np.int16)
+        depth[0] = -1
+        for i in range(1, n): depth[i] = depth[parent[i]] + 1  # parents precede children in preorder
+        euler = new_id[np.array(euler_old)]
+        first = np.full(n, -1, dtype=np.int32)
+        first[euler[::-1]] = np.arange(len(euler) - 1, -1, -1, dtype=np.int32)
+
+        synset_indptr, synset_nodes = csr([new_id[nodes[i]].tolist() for i in range(len(synsets))])
+        max_depth = np.maximum.reduceat(depth[synset_nodes], synset_indptr[:-1]).astype(np.int16)
+        min_depth = np.minimum.reduceat(depth[synset_nodes], synset_indptr[:-1]).astype(np.int16)
+        node_synset = np.array(synset_of, dtype=np.int32)[old]
+
+        # NLTK simulates the root one step above the farthest of the ancestors by their shortest distances
+        parent_l, depth_l, synset_l = parent.tolist(), depth.tolist(), node_synset.tolist()
+        root_distance = np.zeros(len(synsets), dtype=np.int16)
+        for i in range(len(synsets)):
+            dist: Dict[int, int] = {}
+            for u in synset_nodes[synset_indptr[i]:synset_indptr[i + 1]].tolist():
+                x = u
+                while x > 0:
+                    d = depth_l[u] - depth_l[x]
+                    if dist.get(synset_l[x], d + 1) > d: dist[synset_l[x]] = d
+                    x = parent_l[x]
+            root_distance[i] = max(dist.values()) + 1
+
+        # the best subsumer on every root path: the greatest min_depth, then the smallest name
+        names = list(synset_ids)
+        name_order = np.array(sorted(range(len(names)), key=lambda i: names[i]), dtype=np.int32)
+        rank = np.empty(len(names), dtype=np.int64)
+        rank[name_order] = np.arange(len(names))
+        key = (min_depth.astype(np.int64) * len(names) - rank).tolist()
+        subsumer = [-1] * n
+        for i in range(1, n):
+            sid, p = synset_l[i], parent_l[i]
+            subsumer[i] = sid if p <= 0 or key[sid] > key[subsumer[p]] else subsumer[p]
+
+        arrays = {'parent': parent, 'depth': depth, 'node_synset': node_synset,
+                  'tout': np.array(tout_old, dtype=np.int32)[old], 'euler': euler.astype(np.int32), 'first': first,
+                  'synset_indptr': synset_indptr, 'synset_nodes': synset_nodes, 'max_depth': max_depth,
+                  'min_depth': min_depth, 'root_distance': root_distance, 'subsumer': np.array(subsumer, dtype=np.int32),
+                  'name_order': name_order,
+                  'synset_pos': np.array([POS_CODES.index(s.pos()) for s in synsets], dtype=np.uint8),
+                  'synset_offsets': np.array([s.offset() for s in synsets], dtype=np.int64)}
+        return cls(arrays, list(synset_ids))
+
+    def save(self, path: str):
+        """
+        Replaces the index at the path as a whole; see wordnet_index.save_index().
+        """
+        save_index(path, {name: getattr(self, name) for name in ARRAYS}, self.synset_names,
+                   {'version': FORMAT_VERSION, 'synsets': len(self.max_depth), 'nodes': len(self.parent)})
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'TaxonomyIndex':
+        """
+        :param path: the directory of a saved index.
+        :param mmap: if True, memory-map the arrays instead of reading them (the sparse table is rebuilt in memory).
+        """
+        return cls(load_arrays(path, ARRAYS, FORMAT_VERSION, mmap), path=path)
+
+    def nodes(self, synset: int) -> np.ndarray:
+        """
+        :return: the nodes of the synset, one per hypernym path.
+        """
+        return self.synset_nodes[self.synset_indptr[synset]:self.synset_indptr[synset + 1]]
+
+    def lca(self, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """
+        :return: the lowest common ancestor of every pair of nodes (u[i], v[i]); 0 (the virtual root) if none.
+        """
+        a, b = self.first[u], self.first[v]
+        l, r = np.minimum(a, b), np.maximum(a, b) + 1
+        k = self.log2[r - l]
+        offsets = self.sparse_offsets[k]
+        x, y = self.sparse[offsets + l], self.sparse[offsets + r - (1 << k.astype(np.int64))]
+        return self.euler[np.where(self.euler_depth[y] < self.euler_depth[x], y, x)]
+
+    def lca_one(self, u: int, v: int) -> int:
+        """
+        :return: the lowest common ancestor of the two nodes; the same as lca() without the overhead of numpy on a pair.
+        """
+        a, b = int(self.first[u]), int(self.first[v])
+        l, r = (a, b + 1) if a <= b else (b, a + 1)
+        k = (r - l).bit_length() - 1
+        offset = int(self.sparse_offsets[k])
+        x, y = int(self.sparse[offset + l]), int(self.sparse[offset + r - (1 << k)])
+        return int(self.euler[y if self.euler_depth[y] < self.euler_depth[x] else x])
+
+    def is_ancestor(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        :return: whether every node x[i] is an ancestor of (or the same as) the node y[i].
+        """
+        return (x <= y) & (y < self.tout[x])
+
+    def root_path(self, node: int) -> List[int]:
+        """
+        :return: the synsets from the root to the node.
+        """
+        path = []
+        while node > 0:
+            path.append(int(self.node_synset[node]))
+            node = int(self.parent[node])
+        return path[::-1]
+
+    def lowest_common_hypernyms(self, synset_0: int, synset_1: int) -> List[int]:
+        """
+        :return: the same synsets as Synset.lowest_common_hypernyms(): the common hypernyms with the greatest max_depth(),
+                 sorted by name. One of them is the lowest common ancestor of the deepest path through it in both synsets,
+                 so the candidates are the lowest common ancestors of all pairs of the nodes of the two synsets.
+        """
+        n0, n1 = self.nodes(synset_0).tolist(), self.nodes(synset_1).tolist()
+        if len(n0) * len(n1) > SCALAR_PAIRS:
+            lcas = self.lca(np.repeat(n0, len(n1)), np.tile(n1, len(n0))).tolist()
+        else:
+            lcas = [self.lca_one(u, v) for u in n0 for v in n1]
+
+        best, out = -1, []
+        for s in {int(self.node_synset[x]) for x in lcas if x > 0}:
+            d = int(self.max_depth[s])
+            if d > best: best, out = d, [s]
+            elif d == best: out.append(s)
+        if len(out) > 1:
+            names = self.synset_names
+            out.sort(key=lambda s: names[s])
+        return out
+
+    def lch_paths(self, synset_0: int, synset_1: int, lch: Optional[List[int]] = None) -> List[List[int]]:
+        """
+        :param lch: the lowest common hypernyms of the synsets if already known (e.g., by lowest_common_hypernyms_many()).
+        :return: the same paths as ontology_taxonomy.lch_paths() as synset IDs: for every lowest common hypernym and
+                 every hypernym path of the first synset through it, the path from the root to the hypernym.
+        """
+        if lch is None: lch = self.lowest_common_hypernyms(synset_0, synset_1)
+        paths_0 = [self.root_path(x) for x in self.nodes(synset_0).tolist()] if lch else []
+        return [p[:p.index(h) + 1] for h in lch for p in paths_0 if h in p]
+
+    def paths(self, synset_0: int, synset_1: int, lch: Optional[List[int]] = None) -> List[List[int]]:
+        """
+        :param lch: the lowest common hypernyms of the synsets if already known (e.g., by lowest_common_hypernyms_many()).
+        :return: the distinct paths of quiz2.paths() as synset IDs: from the first synset up to a lowest common hypernym
+                 and down to the second synset, through every pair of their hypernym paths.
+        """
+        if lch is None: lch = self.lowest_common_hypernyms(synset_0, synset_1)
+        if not lch: return []
+        paths_0 = [self.root_path(x) for x in self.nodes(synset_0).tolist()]
+        paths_1 = [self.root_path(x) for x in self.nodes(synset_1).tolist()]
+        out, seen = [], set()
+
+        for h in lch:
+            for p1 in paths_1:
+                if h not in p1: continue
+                down = p1[p1.index(h):]
+                for p0 in paths_0:
+                    if h not in p0: continue
+                    path = tuple(p0[:p0.index(h):-1]) + tuple(down)
+                    if path not in seen:
+                        seen.add(path)
+                        out.append(list(path))
+        return out
+
+    def lowest_common_hypernyms_many(self, pairs: Sequence[Tuple[int, int]]) -> List[List[int]]:
+        """
+        :return: the lowest common hypernyms of every pair of synset IDs, with one vectorized LCA query for all pairs.
+        """
+        if not pairs: return []
+        nodes = [(self.nodes(s0).tolist(), self.nodes(s1).tolist()) for s0, s1 in pairs]
+        u = np.array([x for n0, n1 in nodes for x in n0 for _ in n1], dtype=np.int32)
+        v = np.array([y for n0, n1 in nodes for _ in n0 for y in n1], dtype=np.int32)
+        syn = self.node_synset[self.lca(u, v)]
+        dep = np.where(syn >= 0, self.max_depth[np.maximum(syn, 0)], -1)
+        syn, dep = syn.tolist(), dep.tolist()
+        names, out, b = self.synset_names, [], 0
+
+        for n0, n1 in nodes:
+            e = b + len(n0) * len(n1)
+            best = max(dep[b:e], default=-1)
+            lch = sorted({syn[i] for i in range(b, e) if dep[i] == best}, key=lambda x: names[x]) if best >= 0 else []
+            out.append(lch)
+            b = e
+        return out
+
+
+INDEXES = IndexCache(TaxonomyIndex)
+
+
+def get_index(path: str = INDEX_PATH) -> TaxonomyIndex:
+    """
+    :return: the index loaded from the path, once per process and path; built from NLTK and saved to the path if it is
+             missing or stale (see wordnet_index.IndexCache).
+    """
+    return INDEXES.get(path)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else INDEX_PATH
+    st = time.perf_counter()
+    index = TaxonomyIndex.build()
+    index.save(path)
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    print('built {} nodes for {} synsets in {:.1f} sec: {:.1f} MB'.format(
+        len(index.parent), len(index.max_depth), time.perf_counter() - st, size / 2 ** 20))
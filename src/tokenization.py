@@ -13,10 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ========================================================================
-import re
+from typing import Iterable, Iterator, List, Callable, Any, Optional
 
-STARTS = ['"']
-ENDS = ["n't", '.', ',', '"']
+from src.parallel import imap_chunks
+from src.patterns import STARTS, ENDS
+from src.regular_expression import tokenize
 
 
 def tokenize_strmat_0(text):
@@ -73,10 +74,48 @@ def tokenize_strmat_1(text):
     return new_tokens
 
 
+def tokenize_stream(lines: Iterable[str],
+                    tokenizer: Callable[[str], List[Any]] = tokenize,
+                    workers: Optional[int] = None,
+                    chunksize: int = 1000) -> Iterator[List[Any]]:
+    """
+    :param lines: any iterable of texts; it is consumed lazily.
+    :param tokenizer: a module-level tokenizer function (e.g., tokenize, tokenize_regex, tokenize_strmat_1).
+    :param workers: the number of worker processes; if None, use all cores; if <= 1, tokenize in this process.
+    :param chunksize: the number of lines sent to a worker at a time.
+    :return: an iterator of token lists in the same order as the input lines.
+    """
+    return imap_chunks(tokenizer, lines, workers=workers, chunksize=chunksize)
+
+
+def tokenize_batch(texts: Iterable[str],
+                   tokenizer: Callable[[str], List[Any]] = tokenize,
+                   workers: Optional[int] = None,
+                   chunksize: int = 1000) -> List[List[Any]]:
+    """
+    :return: the list of token lists for the texts; see tokenize_stream() for the parameters.
+    """
+    return list(tokenize_stream(texts, tokenizer, workers, chunksize))
+
+
+def tokenize_file(filename: str,
+                  tokenizer: Callable[[str], List[Any]] = tokenize,
+                  workers: Optional[int] = None,
+                  chunksize: int = 1000,
+                  encoding: str = 'utf-8') -> Iterator[List[Any]]:
+    """
+    :param filename: the path to a text file where each line is tokenized independently.
+    :return: an iterator of token lists, one per line; see tokenize_stream() for the other parameters.
+    """
+    with open(filename, encoding=encoding) as fin:
+        yield from tokenize_stream((line.rstrip('\n') for line in fin), tokenizer, workers, chunksize)
+
+
 if __name__ == '__main__':
     text0 = 'Mr. Wayne isn\'t the hero we need, but "the one" we deserve.'
     text1 = 'Ms. Wayne is "Batgirl" but not "the one".'
 
     print(tokenize_strmat_0(text0))
     print(tokenize_strmat_0(text1))
-    print(tokenize_strmat_1(text1))
\ No newline at end of file
+    print(tokenize_strmat_1(text1))
+    print(tokenize_batch([text0, text1], tokenizer=tokenize_strmat_1))
\ No newline at end of file
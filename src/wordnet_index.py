@@ -0,0 +1,385 @@
+# ========================================================================
+# Copyright 2021 Emory University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========================================================================
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from typing import List, Dict, Sequence, Optional, Tuple, FrozenSet, Iterable, Any
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # the root of the repository, above src/
+FORMAT_VERSION = 3
+INDEX_PATH = os.environ.get('CS329_WORDNET_INDEX') or os.path.join(PACKAGE_DIR, 'dat', 'wordnet_index')
+POS_CODES = 'nvars'  # the part-of-speech of every synset as its index in this string
+ARRAYS = ['words', 'word_indptr', 'word_synsets', 'synset_pos', 'synset_offsets', 'synset_indptr', 'synset_lemmas', 'lemma_counts',
+          'lemma_names', 'antonym_indptr', 'antonym_entries']
+SYNSET_CACHE_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+
+def to_bytes(strings: Sequence[str]) -> np.ndarray:
+    return np.array([s.encode('utf-8') for s in strings], dtype=np.bytes_) if len(strings) else np.zeros(0, dtype='S1')
+
+
+def csr(rows: List[List[int]], dtype=np.int32) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the offsets and the concatenated values of the rows.
+    """
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rows], out=indptr[1:])
+    return indptr, np.fromiter((v for r in rows for v in r), dtype=dtype, count=int(indptr[-1]))
+
+
+@lru_cache(maxsize=SYNSET_CACHE_SIZE)
+def resolve_synset(name: str) -> str:
+    """
+    :return: the name of the synset that wn.synset(name) returns (e.g., 'male_child.n.01' for 'boy.n.01');
+             raises WordNetError if there is no such synset.
+    """
+    from nltk.corpus import wordnet as wn
+    return wn.synset(name).name()
+
+
+def corpus_files(root: str) -> Dict[str, List[int]]:
+    """
+    :param root: the directory (or the zip file) of the WordNet corpus.
+    :return: the size and the modification time of every file of the corpus; only stat() is called, so it is cheap to check.
+    """
+    filenames = [os.path.join(root, f) for f in sorted(os.listdir(root))] if os.path.isdir(root) else [root]
+    stats = [(os.path.basename(f), os.stat(f)) for f in filenames]
+    return {f: [st.st_size, st.st_mtime_ns] for f, st in stats}
+
+
+def wordnet_source() -> Dict[str, Any]:
+    """
+    :return: the version and the location of the WordNet corpus of NLTK with its files (see corpus_files()), as recorded in
+             the meta.json of every saved index.
+    """
+    from nltk.corpus import wordnet as wn
+    root = wn.root
+    root = root.path if hasattr(root, 'path') else root.zipfile.filename
+    return {'version': wn.get_version(), 'root': root, 'files': corpus_files(root)}
+
+
+def save_index(path: str, arrays: Dict[str, np.ndarray], synset_names: List[str], meta: Dict[str, Any]):
+    """
+    Writes the arrays as .npy files, the synset names, and meta.json into a new directory next to the path and moves it
+    into place, so that a reader never sees a partial index or a meta.json of another build, and the files of an index
+    memory-mapped by another process are never overwritten (they stay readable through its maps after the removal).
+    :param meta: written to meta.json along with the WordNet corpus of NLTK (see wordnet_source()).
+    """
+    path = os.path.abspath(path)
+    parent, base = os.path.split(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.' + base + '-', dir=parent)
+
+    try:
+        for name, array in arrays.items(): np.save(os.path.join(tmp, name + '.npy'), array)
+        with open(os.path.join(tmp, 'synset_names.txt'), 'w', encoding='utf-8') as fout:
+            fout.write('\n'.join(synset_names))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as fout:
+            json.dump(dict(meta, wordnet=wordnet_source()), fout)
+
+        if os.path.isdir(path):  # a directory can only replace an empty one, so the old index is moved aside first
+            old = tempfile.mkdtemp(prefix='.' + base + '-', dir=parent)
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_arrays(path: str, names: Sequence[str], version: int, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    :param path: the directory of an index saved by save_index().
+    :param names: the names of the arrays to load.
+    :param version: the format version that the index must have.
+    :param mmap: if True, memory-map the arrays instead of reading them.
+    :raises ValueError: if the index has another format version or the WordNet corpus has changed since it was built.
+    """
+    with open(os.path.join(path, 'meta.json')) as fin:
+        meta = json.load(fin)
+    if meta['version'] != version:
+        raise ValueError('Unsupported index format: {}'.format(meta['version']))
+    source = meta['wordnet']
+    if corpus_files(source['root']) != source['files']:
+        raise ValueError('WordNet {} at {} has changed since the index was built'.format(source['version'], source['root']))
+    mode = 'r' if mmap else None
+    return {name: np.asarray(np.load(os.path.join(path, name + '.npy'), mmap_mode=mode)) for name in names}
+
+
+class IndexCache:
+    """
+    The indexes of a class loaded once per process and per path; an index that is missing, in an older format, or built
+    from another WordNet corpus is built from NLTK and saved to its path.
+    The class must have build(), save(path), and load(path).
+    """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        self.indexes: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> Any:
+        key = os.path.abspath(path)
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None:
+                try:
+                    index = self.cls.load(key)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.info('Building the %s for %s: %s', self.cls.__name__, key, e)
+                    index = self.cls.build()
+                    try:
+                        index.save(key)
+                    except OSError as e:
+                        logger.warning('Could not save the %s to %s: %s', self.cls.__name__, key, e)
+                self.indexes[key] = index
+            return index
+
+
+class SynsetTable:
+    """
+    The synsets of an index, identified by their positions in wn.all_synsets() (synset IDs), with their names read lazily.
+    Requires the attributes synset_pos, synset_offsets, _synset_names, _synset_ids, _path, and _lock.
+    """
+
+    @property
+    def synset_names(self) -> List[str]:
+        with self._lock:
+            if self._synset_names is None:
+                with open(os.path.join(self._path, 'synset_names.txt'), encoding='utf-8') as fin:
+                    self._synset_names = fin.read().split('\n')
+        return self._synset_names
+
+    def synset_id(self, name: str) -> int:
+        """
+        :param name: the ID of a sense (e.g., 'dog.n.01').
+        :return: the synset ID of the sense as wn.synset(name) resolves it.
+        """
+        if self._synset_ids is None:
+            names = self.synset_names
+            with self._lock:
+                if self._synset_ids is None: self._synset_ids = {s: i for i, s in enumerate(names)}
+        i = self._synset_ids.get(name)
+        # a lemma-based ID (e.g., 'boy.n.01' for 'male_child.n.01') is resolved by NLTK, which also raises on unknown IDs
+        return i if i is not None else self._synset_ids[resolve_synset(name)]
+
+    def to_synsets(self, synsets: Iterable[int]) -> List[Any]:
+        """
+        :return: the NLTK Synset of every synset ID.
+        """
+        from nltk.corpus import wordnet as wn
+        return [wn.synset_from_pos_and_offset(POS_CODES[self.synset_pos[s]], int(self.synset_offsets[s])) for s in synsets]
+
+
+class WordNetIndex(SynsetTable):
+    """
+    A precomputed index of WordNet as flat arrays, memory-mappable from a directory of .npy files:
+    - words: the sorted query words (every lemma name and every inflected form in the exception lists, lowercased)
+      with the synsets returned by wn.synsets(word) in words[i] -> word_synsets[word_indptr[i]:word_indptr[i+1]];
+    - every synset has its part-of-speech (synset_pos) and its lemmas with their counts in
+      synset_lemmas[synset_indptr[j]:synset_indptr[j+1]] and lemma_counts, where lemma names are IDs of lemma_names;
+    - every lemma of a synset (the k'th entry of synset_lemmas) has its antonyms as entries of synset_lemmas in
+      antonym_entries[antonym_indptr[k]:antonym_indptr[k+1]]; the lemmas of a synset are contiguous, and so are their antonyms.
+    Words outside the index (e.g., regular inflections such as 'dogs') are left to the callers to resolve through NLTK.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], synset_names: Optional[List[str]] = None):
+        """
+        :param arrays: the arrays of ARRAYS.
+        :param synset_names: the name of every synset (e.g., 'dog.n.01'); read lazily from the saved index if None.
+        """
+        for name in ARRAYS: setattr(self, name, arrays[name])
+        self._synset_names = synset_names
+        self._synset_ids: Optional[Dict[str, int]] = None
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+        # the synset of every entry of synset_lemmas, and of every antonym
+        self.lemma_synsets = np.repeat(np.arange(len(self.synset_pos), dtype=np.int32), np.diff(self.synset_indptr))
+        self.antonym_synsets = self.lemma_synsets[self.antonym_entries]
+
+    @classmethod
+    def build(cls) -> 'WordNetIndex':
+        """
+        Builds the index from the WordNet corpus of NLTK; this takes a while, so save() the index and load() it afterwards.
+        """
+        from nltk.corpus import wordnet as wn
+
+        counts = {}
+        with wn.open('cntlist.rev') as fin:
+            for line in fin:
+                key, _, count = line.split()
+                counts[key] = int(count)
+
+        synsets = list(wn.all_synsets())
+        synset_ids = {s.name(): i for i, s in enumerate(synsets)}
+        lemma_ids: Dict[str, int] = {}
+        entries: Dict[Tuple[str, str], int] = {}  # (synset, lemma) -> the entry of the lemma in synset_lemmas
+        synset_rows, count_rows = [], []
+        for s in synsets:
+            lemmas = s.lemmas()
+            synset_rows.append([lemma_ids.setdefault(l.name(), len(lemma_ids)) for l in lemmas])
+            count_rows.append([counts.get(l.key(), 0) for l in lemmas])
+            for l in lemmas: entries[s.name(), l.name()] = len(entries)
+        antonym_rows = [[entries[a.synset().name(), a.name()] for a in l.antonyms()] for s in synsets for l in s.lemmas()]
+
+        words = set(wn.all_lemma_names())
+        for exc in wn._exception_map.values(): words.update(exc)
+        words = sorted({w.lower() for w in words})
+        word_rows = [[synset_ids[s.name()] for s in wn.synsets(w)] for w in words]
+
+        arrays = {'words': to_bytes(words), 'synset_pos': np.array([POS_CODES.index(s.pos()) for s in synsets], dtype=np.uint8),
+                  'synset_offsets': np.array([s.offset() for s in synsets], dtype=np.int64), 'lemma_names': to_bytes(list(lemma_ids))}
+        arrays['word_indptr'], arrays['word_synsets'] = csr(word_rows)
+        arrays['synset_indptr'], arrays['synset_lemmas'] = csr(synset_rows)
+        arrays['lemma_counts'] = csr(count_rows)[1]
+        arrays['antonym_indptr'], arrays['antonym_entries'] = csr(antonym_rows)
+
+        # queries are looked up by binary search over the UTF-8 bytes, so the order must be the byte order
+        order = np.argsort(arrays['words'], kind='stable')
+        if not np.array_equal(order, np.arange(len(order))):
+            rows = [word_rows[i] for i in order.tolist()]
+            arrays['words'] = arrays['words'][order]
+            arrays['word_indptr'], arrays['word_synsets'] = csr(rows)
+
+        return cls(arrays, list(synset_ids))
+
+    def save(self, path: str):
+        """
+        Replaces the index at the path as a whole; see save_index().
+        """
+        save_index(path, {name: getattr(self, name) for name in ARRAYS}, self.synset_names,
+                   {'version': FORMAT_VERSION, 'synsets': len(self.synset_pos), 'words': len(self.words)})
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'WordNetIndex':
+        """
+        :param path: the directory of a saved index.
+        :param mmap: if True, memory-map the arrays instead of reading them.
+        """
+        index = cls(load_arrays(path, ARRAYS, FORMAT_VERSION, mmap))
+        index._path = path
+        return index
+
+    def find(self, word: str) -> int:
+        """
+        :return: the index of the word (lowercased as wn.synsets() does) if exists; otherwise, -1.
+        """
+        key = word.lower().encode('utf-8')
+        i = int(np.searchsorted(self.words, key))
+        return i if i < len(self.words) and self.words[i] == key else -1
+
+    def synsets(self, word: str, pos: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        :param pos: if not None, only the synsets of the part-of-speech; 'a' includes satellite adjectives as in NLTK.
+        :return: the synset IDs of wn.synsets(word, pos) in the same order; None if the word is not in the index.
+        """
+        i = self.find(word)
+        if i < 0: return None
+        ids = self.word_synsets[self.word_indptr[i]:self.word_indptr[i + 1]]
+        if pos is None: return ids
+        codes = self.synset_pos[ids]
+        mask = (codes == POS_CODES.index('a')) | (codes == POS_CODES.index('s')) if pos == 'a' else codes == POS_CODES.index(pos)
+        return ids[mask]
+
+    def synonyms(self, word: str, pos: Optional[str] = None, count: int = 0) -> Optional[FrozenSet[str]]:
+        """
+        :return: the same lemma names as ontology_taxonomy.synonyms(); None if the word is not in the index.
+        """
+        ids = self.synsets(word, pos)
+        if ids is None: return None
+        names = set()
+        for s in ids.tolist():
+            b, e = self.synset_indptr[s], self.synset_indptr[s + 1]
+            lemmas = self.synset_lemmas[b:e]
+            if count > 0: lemmas = lemmas[self.lemma_counts[b:e] >= count]
+            names.update(self.lemma_names[lemmas].tolist())
+        return frozenset(n.decode('utf-8') for n in names)
+
+    def synonyms_many(self, words: Iterable[str], pos: Optional[str] = None, count: int = 0) -> List[Optional[FrozenSet[str]]]:
+        """
+        :return: synonyms() of every word; the lemmas of the synsets of all words are gathered and decoded at once.
+        """
+        ids = [self.synsets(word, pos) for word in words]
+        synsets = np.concatenate([i for i in ids if i is not None] or [np.zeros(0, dtype=np.int32)]).astype(np.int64)
+        begins, ends = self.synset_indptr[synsets], self.synset_indptr[synsets + 1]
+        lengths = ends - begins
+        # the entries of synset_lemmas of all synsets: every range begins[k]:ends[k] concatenated
+        entries = np.repeat(begins - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+        keep = self.lemma_counts[entries] >= count if count > 0 else np.ones(len(entries), dtype=bool)
+        uniq, inverse = np.unique(self.synset_lemmas[entries], return_inverse=True)
+        names = [n.decode('utf-8') for n in self.lemma_names[uniq].tolist()]
+        inverse, keep = inverse.tolist(), keep.tolist()
+
+        out, b, k = [], 0, 0
+        for i in ids:
+            if i is None:
+                out.append(None)
+                continue
+            e = b + int(lengths[k:k + len(i)].sum())
+            out.append(frozenset(names[inverse[j]] for j in range(b, e) if keep[j]))
+            b, k = e, k + len(i)
+        return out
+
+    def antonyms(self, synset: int) -> List[int]:
+        """
+        :return: the sorted synset IDs of the antonyms of all lemmas of the synset, as quiz2.antonyms() collects them.
+        """
+        b, e = self.antonym_indptr[self.synset_indptr[synset]], self.antonym_indptr[self.synset_indptr[synset + 1]]
+        return sorted(set(self.antonym_synsets[b:e].tolist()))
+
+    def antonyms_many(self, synsets: Sequence[int]) -> List[List[int]]:
+        """
+        :return: antonyms() of every synset ID, with the antonym ranges of all synsets looked up at once.
+        """
+        if not len(synsets): return []
+        synsets = np.asarray(synsets, dtype=np.int64)
+        begins = self.antonym_indptr[self.synset_indptr[synsets]].tolist()
+        ends = self.antonym_indptr[self.synset_indptr[synsets + 1]].tolist()
+        targets = self.antonym_synsets
+        return [sorted(set(targets[b:e].tolist())) if e > b else [] for b, e in zip(begins, ends)]
+
+
+INDEXES = IndexCache(WordNetIndex)
+
+
+def get_index(path: str = INDEX_PATH) -> WordNetIndex:
+    """
+    :return: the index loaded from the path, once per process and path; built from NLTK and saved to the path if it is
+             missing or stale (see IndexCache).
+    """
+    return INDEXES.get(path)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else INDEX_PATH
+    st = time.perf_counter()
+    index = WordNetIndex.build()
+    index.save(path)
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    print('built {} words, {} synsets in {:.1f} sec: {:.1f} MB'.format(len(index.words), len(index.synset_pos), time.perf_counter() - st, size / 2 ** 20))